@@ -1,5 +1,10 @@
+import json
+import os
+import re
+import time
 from openai import OpenAI
 from apollo_lib import settings
+from apollo_lib import state
 
 _client = None
 
@@ -33,13 +38,82 @@ def ask(request):
   return completion.choices[0].message.content
 
 
-def get_playlist(description, length):
-  """Generate an AI playlist given a description and length."""
+def _cache_folder():
+  """Return the folder holding cached AI responses, inside .apollo/ai."""
+  playlist_folder, apollo_folder, ai_folder, m3u_folder, missing_folder, sorted_folder = settings.get_apollo_folders()
+  folder = os.path.join(ai_folder, "cache")
+  os.makedirs(folder, exist_ok=True)
+  return folder
+
+
+def _cache_path(description, model, length):
+  """Return the cache file for a prompt; prompts differing only in case or spacing share it."""
+  prompt = re.sub(r"\s+", " ", description).strip().casefold()
+  key = state.content_hash(json.dumps([prompt, model, length]))
+  return os.path.join(_cache_folder(), f"{key}.json")
+
+
+def _read_cache(path):
+  """Return the cached entry at path, or None if missing or unreadable."""
+  try:
+    with open(path, "r", encoding="utf-8") as f:
+      return json.load(f)
+  except (IOError, ValueError):
+    return None
+
+
+def _prune_cache(folder, max_bytes, keep=None):
+  """Remove the least recently used responses, except keep, until the cache fits in max_bytes."""
+  entries = []
+  for name in os.listdir(folder):
+    path = os.path.join(folder, name)
+    if name.endswith(".json"):
+      stat = os.stat(path)
+      entries.append((stat.st_mtime, stat.st_size, path))
+  total = sum(size for _, size, _ in entries)
+  for _, size, path in sorted(entries):
+    if total <= max_bytes:
+      break
+    if path == keep:
+      continue
+    os.remove(path)
+    total -= size
+
+
+def get_playlist(description, length, refresh=False):
+  """
+  Generate an AI playlist given a description and length.
+  Responses are cached in .apollo/ai/cache by prompt, OPENAI_MODEL and length for
+  AI_CACHE_TTL_DAYS (default 30), and the cache is kept under AI_CACHE_MAX_MB (default 20)
+  by dropping the least recently used. refresh skips the cache; an expired entry is still
+  used when the API call fails, so known prompts work offline.
+  """
   if not length:
     length = 50
+  model = settings.get_setting("OPENAI_MODEL")
+  ttl = float(settings.get_optional_setting("AI_CACHE_TTL_DAYS", 30)) * 86400
+  path = _cache_path(description, model, length)
+
+  cached = _read_cache(path)
+  if cached and not refresh and time.time() - cached.get("created", 0) < ttl:
+    os.utime(path)
+    print(f"Using cached AI response from {time.strftime('%Y-%m-%d %H:%M', time.localtime(cached['created']))} (--refresh to ask again)")
+    return cached["response"]
+
   request = (
     "Only reply in plain text in the format 'artist - title', one song per line. "
     f"Write a playlist of {length} songs that fit the following request: " + description
   )
-  response = ask(request)
+  try:
+    response = ask(request)
+  except Exception as exc:
+    if cached:
+      print(f"AI request failed ({exc}), using the cached response")
+      return cached["response"]
+    raise
+
+  entry = {"prompt": description, "model": model, "length": length, "created": time.time(), "response": response}
+  state.write_atomic(path, json.dumps(entry, ensure_ascii=False).encode("utf-8"))
+  max_bytes = float(settings.get_optional_setting("AI_CACHE_MAX_MB", 20)) * 1024 * 1024
+  _prune_cache(os.path.dirname(path), max_bytes, keep=path)
   return response
@@ -0,0 +1,83 @@
+import time
+from colorama import Fore, Style
+from apollo_lib import db
+from apollo_lib import ratings
+
+# Benchmarks for the ratings pipeline. Transfer sizes are estimated from the values
+# received, which is close to the wire size of the MySQL text protocol.
+
+def _row_bytes(row):
+    """Estimate the transferred size of one result row."""
+    return sum(len(str(value).encode("utf-8")) for value in row.values() if value is not None)
+
+def _report(label, rows, transferred, seconds):
+    print(Fore.YELLOW + f"{label}" + Style.RESET_ALL)
+    print(f"  Rows transferred: {rows}")
+    print(f"  Bytes (approx):   {transferred / 1024 / 1024:.2f} MB")
+    print(f"  Time:             {seconds:.2f}s")
+
+def benchmark_calculate_all():
+    """Compare pulling every event row (the previous approach) with the grouped aggregate query."""
+    with db.session() as (dbh, sth):
+        # previous approach: three full table pulls, counted in Python
+        start = time.perf_counter()
+        rows = 0
+        transferred = 0
+        merged = {}
+        for sql in ("SELECT artist, title, rating FROM apollo_rating",
+                    "SELECT artist, title, rating FROM apollo_vote",
+                    "SELECT artist, title FROM apollo_skip"):
+            sth.execute(sql)
+            for row in sth.fetchall():
+                rows += 1
+                transferred += _row_bytes(row)
+                merged.setdefault((row.get("artist"), row.get("title")), 0)
+        _report(f"Full table pull ({len(merged)} songs)", rows, transferred, time.perf_counter() - start)
+
+        # grouped aggregate, streamed
+        start = time.perf_counter()
+        rows = 0
+        transferred = 0
+        stream = db.stream_cursor(dbh)
+        try:
+            stream.execute(ratings.aggregate_ratings_sql())
+            for row in stream:
+                rows += 1
+                transferred += _row_bytes(row)
+        finally:
+            stream.close()
+        _report(f"Grouped aggregate ({rows} songs)", rows, transferred, time.perf_counter() - start)
+
+def benchmark_backends(backends=None):
+    """
+    Time a full and an incremental rating calculation on each backend.
+    The full run's results are stored, as rating -ca -u --full would, so the incremental
+    run has watermarks to start from.
+    """
+    results = {}
+    for backend in backends or db.BACKENDS:
+        with db.use_backend(backend):
+            ratings.reset_calculated_ratings()
+            try:
+                start = time.perf_counter()
+                ratings.calculate_all_ratings(full=True)
+                full_seconds = time.perf_counter() - start
+                songs = len(ratings.calculated_ratings or {})
+                ratings.store_calculated_ratings()
+
+                ratings.reset_calculated_ratings()
+                start = time.perf_counter()
+                ratings.calculate_all_ratings()
+                incremental_seconds = time.perf_counter() - start
+            except db.DatabaseError as e:
+                print(Fore.RED + f"{backend}: unavailable ({e})" + Style.RESET_ALL)
+                continue
+            finally:
+                ratings.reset_calculated_ratings()
+
+        results[backend] = (songs, full_seconds, incremental_seconds)
+        print(Fore.YELLOW + f"{backend}" + Style.RESET_ALL)
+        print(f"  Songs:       {songs}")
+        print(f"  Full:        {full_seconds:.2f}s")
+        print(f"  Incremental: {incremental_seconds:.2f}s")
+    return results
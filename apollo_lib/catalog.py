@@ -0,0 +1,142 @@
+import json
+import os
+import re
+import sqlite3
+from colorama import Fore, Style
+from apollo_lib import settings
+from apollo_lib import tracks as tracks_lib
+
+# A compact, searchable copy of the Elasticsearch index, written next to es.jsonl during scan.
+# Searches stream rows from SQLite, so the catalog is never loaded into memory as a whole.
+
+SEARCH_FIELDS = ["artist", "title", "album", "genre"]
+
+_COLUMNS = ["artist", "title", "album", "albumartist", "genre", "year", "url", "extension", "bitrate", "duration", "track_key"]
+
+_REGEX_META = set(".^$*+?{}[]\\|()")
+
+def get_catalog_path():
+    """Return the path of the catalog database."""
+    playlist_folder, apollo_folder, ai_folder, m3u_folder, missing_folder, sorted_folder = settings.get_apollo_folders()
+    return os.path.join(ai_folder, "catalog.sqlite")
+
+class CatalogWriter:
+    """Build a new catalog into a temp file and swap it in on close."""
+
+    def __init__(self, path=None):
+        self.path = path or get_catalog_path()
+        self.tmp_path = self.path + ".tmp"
+        self.rows = []
+        self.count = 0
+
+    def __enter__(self):
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        self.db = sqlite3.connect(self.tmp_path)
+        self.db.execute(
+            """
+            CREATE TABLE songs (
+                id INTEGER PRIMARY KEY,
+                artist TEXT, title TEXT, album TEXT, albumartist TEXT, genre TEXT,
+                year INTEGER, url TEXT UNIQUE, extension TEXT, bitrate INTEGER,
+                duration REAL, track_key TEXT
+            )
+            """
+        )
+        return self
+
+    def add(self, song):
+        """Queue one song dict (as written to es.jsonl) for insertion."""
+        row = [song.get(column) for column in _COLUMNS[:-1]]
+        row.append(tracks_lib.normalize_key(song.get("artist"), song.get("title")))
+        self.rows.append(row)
+        if len(self.rows) >= 5000:
+            self._flush()
+
+    def _flush(self):
+        placeholders = ", ".join("?" for _ in _COLUMNS)
+        self.db.executemany(
+            f"INSERT OR REPLACE INTO songs ({', '.join(_COLUMNS)}) VALUES ({placeholders})",
+            self.rows,
+        )
+        self.count += len(self.rows)
+        self.rows = []
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.db.close()
+            os.remove(self.tmp_path)
+            return False
+
+        self._flush()
+        self.db.execute("CREATE INDEX idx_songs_track_key ON songs (track_key)")
+        try:
+            # Trigram index used to prefilter literal searches; needs SQLite 3.34+
+            self.db.execute(
+                "CREATE VIRTUAL TABLE songs_fts USING fts5("
+                "artist, title, album, genre, content='songs', content_rowid='id', tokenize='trigram')"
+            )
+            self.db.execute("INSERT INTO songs_fts(songs_fts) VALUES ('rebuild')")
+        except sqlite3.OperationalError as e:
+            print(Fore.YELLOW + f"Catalog trigram index unavailable: {e}" + Style.RESET_ALL)
+        self.db.commit()
+        self.db.close()
+        os.replace(self.tmp_path, self.path)
+        return False
+
+def rebuild_from_jsonl():
+    """Build the catalog from es.jsonl, for trees scanned before the catalog existed."""
+    playlist_folder, apollo_folder, ai_folder, m3u_folder, missing_folder, sorted_folder = settings.get_apollo_folders()
+    es_jsonl_path = os.path.join(ai_folder, "es.jsonl")
+    if not os.path.exists(es_jsonl_path):
+        return False
+
+    print(Fore.YELLOW + "Building catalog from es.jsonl..." + Style.RESET_ALL)
+    with CatalogWriter() as writer, open(es_jsonl_path, "r") as f:
+        for line in f:
+            try:
+                writer.add(json.loads(line, strict=False))
+            except json.JSONDecodeError:
+                continue
+    return True
+
+def connect():
+    """Open the catalog read-only, building it from es.jsonl first if needed."""
+    path = get_catalog_path()
+    if not os.path.exists(path) and not rebuild_from_jsonl():
+        raise FileNotFoundError(f"Catalog not found, run 'apollo scan' first: {path}")
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+def _has_fts(db):
+    row = db.execute("SELECT name FROM sqlite_master WHERE name = 'songs_fts'").fetchone()
+    return row is not None
+
+def search(input_str, fields=None):
+    """Yield (artist, title) for catalog rows where any of fields matches the regex input_str."""
+    fields = [field for field in (fields or SEARCH_FIELDS) if field in SEARCH_FIELDS]
+    if not fields:
+        raise ValueError(f"No searchable fields given, choose from: {', '.join(SEARCH_FIELDS)}")
+
+    pattern = re.compile(input_str, re.IGNORECASE)
+    columns = ", ".join(f"s.{field}" for field in fields)
+    db = connect()
+    try:
+        literal = input_str.strip()
+        if len(literal) >= 3 and not (_REGEX_META & set(literal)) and _has_fts(db):
+            # Plain text: let the trigram index narrow the candidates, the regex below confirms them
+            match = "{" + " ".join(fields) + "} : \"" + literal.replace('"', '""') + "\""
+            cursor = db.execute(
+                f"SELECT s.artist, s.title, {columns} FROM songs_fts f JOIN songs s ON s.id = f.rowid WHERE songs_fts MATCH ?",
+                (match,),
+            )
+        else:
+            cursor = db.execute(f"SELECT s.artist, s.title, {columns} FROM songs s")
+
+        for row in cursor:
+            artist, title = row[0], row[1]
+            if not artist or not title:
+                continue
+            if any(value and pattern.search(str(value)) for value in row[2:]):
+                yield artist, title
+    finally:
+        db.close()
@@ -1,5 +1,5 @@
 import argparse
-from apollo_lib import playlist, scanner, ratings, compare, navidrome
+from apollo_lib import catalog, playlist, scanner, ratings, compare, navidrome, importer, ordering, benchmark, estools, rating_engine, storage, db
 
 def main():
     """CLI entrypoint for Apollo playlist and library management."""
@@ -8,11 +8,13 @@ def main():
     subparsers = parser.add_subparsers(dest="command", required=True)
     # create subparser for create-playlist
     create_parser = subparsers.add_parser("create", help="Create a playlist")
-    create_parser.add_argument("-t", "--type", required=True, choices=["ai", "artist", "path", "any"], help="Type of playlist to create")
+    create_parser.add_argument("-t", "--type", required=True, choices=["ai", "artist", "path", "any", "query"], help="Type of playlist to create")
     create_parser.add_argument("-i", "--input", required=True, help="Input string for the playlist type")
     create_parser.add_argument("-d", "--dynamic", action="store_true", help="Write dynamic M3U to DYNAMIC_PLAYLIST_FILE")
     create_parser.add_argument("-p", "--playlist", help="Override DEFAULT_PLAYLIST_FILE for appending new tracks")
     create_parser.add_argument("-y", "--yes", action="store_true", help="Automatically answer yes to adding tracks to the default playlist")
+    create_parser.add_argument("-f", "--fields", default="artist,title,album,genre", help="Comma-separated fields searched by -t any (artist,title,album,genre)")
+    create_parser.add_argument("--refresh", action="store_true", help="With -t ai, ask the model again instead of using a cached response")
     create_parser.set_defaults(func=handle_playlist)
     
     # create subparser for publish-playlist
@@ -20,12 +22,28 @@ def main():
     publish_group = publish_parser.add_mutually_exclusive_group(required=True)
     publish_group.add_argument("-a", "--all", action="store_true", help="Publish all playlists")
     publish_group.add_argument("-p", "--playlist", metavar="NAME", help="Publish single playlist by name (without .txt)")
+    publish_parser.add_argument("-f", "--force", action="store_true", help="Re-resolve playlists even if their inputs are unchanged")
+    publish_parser.add_argument("-o", "--order", choices=ordering.ORDER_MODES, help="Track order (default PLAYLIST_ORDER or alpha)")
+    publish_parser.add_argument("--seed", help="Seed for reproducible ordering (default PLAYLIST_ORDER_SEED)")
+    publish_parser.add_argument("--gap", type=int, help="Minimum tracks between the same artist for --order artist")
     publish_parser.set_defaults(func=handle_publish)
 
     # create subparser for scan-music
     scan_parser = subparsers.add_parser("scan", help="Scan music folder into Elasticsearch")
     scan_parser.set_defaults(func=handle_scan)
 
+    # import
+    import_parser = subparsers.add_parser("import", help="Import M3U/PLS/XSPF playlists as artist - title source lists")
+    import_parser.add_argument("files", nargs="+", help="Playlist files to import")
+    import_parser.add_argument("-o", "--output", help="Output folder (default PLAYLIST_SOURCE_FOLDER)")
+    import_parser.add_argument("--overwrite", action="store_true", help="Overwrite existing source lists")
+    import_parser.set_defaults(func=handle_import)
+
+    # missing
+    missing_parser = subparsers.add_parser("missing", help="Rank missing songs by how many playlists they would fill")
+    missing_parser.add_argument("-n", "--limit", type=int, default=50, help="Number of songs to show")
+    missing_parser.set_defaults(func=handle_missing)
+
     # compare
     compare_parser = subparsers.add_parser("compare", help="Compare a directory of mp3s with ES and list better versions")
     compare_parser.add_argument("-d", "--directory", required=True, help="Directory to compare")
@@ -41,44 +59,94 @@ def main():
     rating_group.add_argument("-caa", "--calculate-all-artists", action="store_true", help="Calculate and display all artists by rating (highest to lowest)")
     rating_group.add_argument("-c", "--calc", action="store_true", help="Calculate rating for a song or artist")
     rating_group.add_argument("-sn", "--sync-navidrome", action="store_true", help="Sync apollo_calculated_rating scores to Navidrome")
+    rating_group.add_argument("-pn", "--pull-navidrome", action="store_true", help="Import ratings, stars and plays made in Navidrome")
+    rating_group.add_argument("-b", "--benchmark", action="store_true", help="Benchmark rating aggregation (transfer size and time)")
+    rating_group.add_argument("-rs", "--refresh-snapshot", action="store_true", help="Rebuild the local ratings snapshot used by create and publish")
+    rating_group.add_argument("-si", "--sync-index", action="store_true", help="Write calculated ratings onto the Elasticsearch documents")
+    rating_group.add_argument("-wi", "--what-if", action="store_true", help="Show how different formula settings would change ratings (needs numpy)")
     rating_parser.add_argument("-a", "--artist", type=str, help="Artist name for calculation")
     rating_parser.add_argument("-t", "--title", type=str, help="Title of the song for calculation (optional with -c)")
     rating_parser.add_argument("-v", "--verbose", action="store_true", help="Print verbose output")
     rating_parser.add_argument("-u", "--update-db", action="store_true", help="Upsert calculated ratings into apollo_calculated_rating")
+    rating_parser.add_argument("--full", action="store_true", help="Recompute every song instead of only those with new events (with -pn: ignore the pull watermarks)")
+    rating_parser.add_argument("--verify", action="store_true", help="With -sn, compare every song with Navidrome instead of only pushing changes")
+    rating_parser.add_argument("--bulk", action="store_true", help="With -u, load a temp table and merge it in one statement")
+    rating_parser.add_argument("--vote-strength", type=float, help="VOTE_STRENGTH to try with --what-if")
+    rating_parser.add_argument("--skip-strength", type=float, help="SKIP_STRENGTH to try with --what-if")
+    rating_parser.add_argument("--threshold", type=float, help="RATING_THRESHOLD to try with --what-if")
     rating_parser.set_defaults(func=handle_rating)
+
+    # database backends
+    db_parser = subparsers.add_parser("db", help="Manage the ratings database backends")
+    db_group = db_parser.add_mutually_exclusive_group(required=True)
+    db_group.add_argument("-m", "--migrate", nargs=2, metavar=("FROM", "TO"), help="Copy ratings tables between backends (mysql, sqlite)")
+    db_group.add_argument("-b", "--benchmark", action="store_true", help="Time full and incremental rating calculation on each backend")
+    db_parser.set_defaults(func=handle_db)
     
     args = parser.parse_args()
     
     if args.command == "rating" and args.calc:
         if not args.artist:
             parser.error("rating -c requires -a/--artist")
+
+    if args.command == "create":
+        fields = [field.strip() for field in args.fields.split(",") if field.strip()]
+        unknown = [field for field in fields if field not in catalog.SEARCH_FIELDS]
+        if unknown or not fields:
+            parser.error(f"-f/--fields: unknown field(s) {', '.join(unknown) or '(none given)'}, choose from {','.join(catalog.SEARCH_FIELDS)}")
     
     args.func(args)
 
 def handle_playlist(args):
     """Handle 'create' command and build playlists."""
-    input = args.input.replace('"', '')
     ptype = args.type
-    playlist.create_playlist(ptype=ptype, input_str=input, dynamic=args.dynamic, default_playlist_file=args.playlist, auto_yes=args.yes)
+    # query expressions use quotes to group values with spaces
+    input = args.input if ptype == "query" else args.input.replace('"', '')
+    fields = [field.strip() for field in args.fields.split(",") if field.strip()]
+    playlist.create_playlist(ptype=ptype, input_str=input, dynamic=args.dynamic, default_playlist_file=args.playlist, auto_yes=args.yes, fields=fields, refresh=args.refresh)
 
 def handle_publish(args):
     """Handle 'publish' command to write M3U files."""
     if args.all:
-        playlist.write_m3u_files(None)
+        playlist.write_m3u_files(None, force=args.force, order=args.order, seed=args.seed, gap=args.gap)
     else:
         name = args.playlist
         if not name.endswith(".txt"):
             name = name + ".txt"
-        playlist.write_m3u_files(name)
+        playlist.write_m3u_files(name, force=args.force, order=args.order, seed=args.seed, gap=args.gap)
 
 def handle_scan(args):
     """Handle 'scan' command to index music into ES."""
-    scanner.scan_music_folder_into_es()
+    new_artists = scanner.scan_music_folder_into_es()
+    if estools.ratings_in_index():
+        estools.sync_ratings_to_index()
+    if new_artists:
+        playlist.reresolve_missing(new_artists)
+
+def handle_import(args):
+    """Handle 'import' command to convert playlists into source lists."""
+    importer.import_playlists(args.files, output_folder=args.output, overwrite=args.overwrite)
+
+def handle_missing(args):
+    """Handle 'missing' command to report unresolved songs."""
+    playlist.print_missing_report(limit=args.limit)
 
 def handle_compare(args):
     """Handle 'compare' command to find better versions."""
     compare.compare_directory(args.directory)
 
+def handle_db(args):
+    """Handle 'db' command to migrate or benchmark backends."""
+    if args.migrate:
+        source, target = args.migrate
+        for name in (source, target):
+            if name not in db.BACKENDS:
+                print(f"Unknown backend '{name}', choose from: {', '.join(db.BACKENDS)}")
+                return
+        storage.migrate(source, target)
+    elif args.benchmark:
+        benchmark.benchmark_backends()
+
 def handle_rating(args):
     """Handle 'rating' command operations."""
     try:
@@ -89,7 +157,7 @@ def handle_rating(args):
         elif args.printratings:
             ratings.print_ratings()
         elif args.calculate_all:
-            ratings.calculate_all_ratings(verbose=args.verbose)
+            ratings.calculate_all_ratings(verbose=args.verbose, full=args.full, update_decay=args.update_db)
         elif args.calculate_all_artists:
             from colorama import Fore, Style
             artists_data = ratings.calculate_all_artists_ratings()
@@ -159,14 +227,40 @@ def handle_rating(args):
                     title = song['title']
                     rating = song['calculated_rating']
                     print(f"  {len(sorted_songs)-4+i}. {title} - {rating}")
+        elif args.benchmark:
+            benchmark.benchmark_calculate_all()
+        elif args.refresh_snapshot:
+            ratings.refresh_ratings_snapshot(verbose=True)
+        elif args.sync_index:
+            estools.sync_ratings_to_index(verbose=args.verbose)
+        elif args.what_if:
+            try:
+                rating_engine.what_if(vote_strength=args.vote_strength, skip_strength=args.skip_strength, threshold=args.threshold)
+            except RuntimeError as exc:
+                print(exc)
+        elif args.pull_navidrome:
+            try:
+                result = navidrome.pull_ratings(verbose=args.verbose, full=args.full)
+                print(
+                    f"Navidrome pull complete. "
+                    f"Songs: {result['songs']}, "
+                    f"New ratings: {result['ratings']}, "
+                    f"New stars: {result['stars']}, "
+                    f"New plays: {result['plays']}"
+                )
+                if result["ratings"] or result["stars"]:
+                    print("Run 'apollo.py rating -ca -u' to update calculated ratings.")
+            except Exception as exc:
+                print(f"Navidrome pull failed: {exc}")
         elif args.sync_navidrome:
             try:
-                result = navidrome.update_all_ratings(verbose=args.verbose)
+                result = navidrome.update_all_ratings(verbose=args.verbose, verify=args.verify)
                 print(
                     f"Navidrome sync complete. "
                     f"Total: {result.get('total', 0)}, "
                     f"Updated: {result.get('updated', 0)}, "
                     f"Unchanged: {result.get('unchanged', 0)}, "
+                    f"Skipped: {result.get('skipped', 0)}, "
                     f"Missing file: {result.get('missing_file', 0)}, "
                     f"Failed: {result.get('failed', 0)}"
                 )
@@ -178,7 +272,7 @@ def handle_rating(args):
             print("Invalid rating command. Use -h for help.")
     finally:
         if args.update_db:
-            ratings.store_calculated_ratings(verbose=args.verbose)
+            ratings.store_calculated_ratings(verbose=args.verbose, bulk=args.bulk)
 
 
 if __name__ == "__main__":
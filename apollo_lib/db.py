@@ -0,0 +1,268 @@
+import atexit
+import calendar
+import datetime
+import decimal
+import math
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+import pymysql
+from apollo_lib import settings
+
+# Database connections shared by ratings and Navidrome sync: pooled MySQL connections, or an
+# embedded SQLite file for single-host setups and tests (DATABASE_BACKEND: sqlite).
+#
+# Optional settings:
+#   DATABASE_BACKEND               mysql (default) or sqlite
+#   DATABASE_PATH                  SQLite file (default .apollo/ratings.db)
+#   DATABASE_POOL_SIZE             idle connections kept open (default 4)
+#   DATABASE_CONNECT_TIMEOUT       seconds to wait when connecting (default 10)
+#   DATABASE_READ_TIMEOUT          seconds to wait for a query result (default none)
+#   DATABASE_HEALTH_CHECK_SECONDS  ping connections idle longer than this before reuse (default 30)
+#   DATABASE_CONNECT_RETRIES       attempts before giving up on a new connection (default 3)
+
+DatabaseError = (pymysql.MySQLError, sqlite3.Error)
+
+BACKENDS = ["mysql", "sqlite"]
+
+class ConnectionPool:
+    """A small thread-safe pool of pymysql connections with health checks."""
+
+    def __init__(self):
+        self.size = int(settings.get_optional_setting("DATABASE_POOL_SIZE", 4))
+        self.connect_timeout = int(settings.get_optional_setting("DATABASE_CONNECT_TIMEOUT", 10))
+        self.read_timeout = settings.get_optional_setting("DATABASE_READ_TIMEOUT", None)
+        self.health_check_seconds = float(settings.get_optional_setting("DATABASE_HEALTH_CHECK_SECONDS", 30))
+        self.retries = max(1, int(settings.get_optional_setting("DATABASE_CONNECT_RETRIES", 3)))
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def _connect(self):
+        """Open a new connection, retrying with backoff."""
+        db_host = settings.get_setting("DATABASE_HOST")
+        db_user = settings.get_setting("DATABASE_UN")
+        db_pass = settings.get_setting("DATABASE_PWD")
+        db_name = settings.get_setting("DATABASE_NAME")
+
+        for attempt in range(self.retries):
+            try:
+                dbh = pymysql.connect(
+                    host=db_host,
+                    user=db_user,
+                    password=db_pass,
+                    database=db_name,
+                    charset='utf8mb4',
+                    cursorclass=pymysql.cursors.DictCursor,
+                    connect_timeout=self.connect_timeout,
+                    read_timeout=self.read_timeout,
+                    init_command="SET NAMES utf8mb4",
+                )
+                return dbh
+            except pymysql.MySQLError as e:
+                if attempt + 1 == self.retries:
+                    print(f"Failed to connect to '{db_host}:{db_name}' using username: {db_user}")
+                    print(e)
+                    raise
+                time.sleep(0.5 * (2 ** attempt))
+
+    def acquire(self):
+        """Return a healthy connection, reusing an idle one when possible."""
+        while True:
+            try:
+                dbh, released_at = self.idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+
+            if time.monotonic() - released_at < self.health_check_seconds:
+                return dbh
+            try:
+                dbh.ping(reconnect=True)
+                return dbh
+            except pymysql.MySQLError:
+                self._close(dbh)
+
+    def release(self, dbh, broken=False):
+        """Return a connection to the pool, or close it if it failed or the pool is full."""
+        if broken or self.closed:
+            self._close(dbh)
+            return
+        try:
+            dbh.rollback()
+        except pymysql.MySQLError:
+            self._close(dbh)
+            return
+        with self.lock:
+            if self.idle.qsize() < self.size:
+                self.idle.put((dbh, time.monotonic()))
+                return
+        self._close(dbh)
+
+    def _close(self, dbh):
+        try:
+            dbh.close()
+        except Exception:
+            pass
+
+    def close_all(self):
+        """Close every idle connection."""
+        self.closed = True
+        while True:
+            try:
+                dbh, _ = self.idle.get_nowait()
+            except queue.Empty:
+                return
+            self._close(dbh)
+
+_pool = None
+_pool_lock = threading.Lock()
+_backend_override = None
+
+def get_pool():
+    """Return the process-wide connection pool."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool()
+            atexit.register(_pool.close_all)
+    return _pool
+
+def backend_name():
+    """Return the active backend name, mysql or sqlite."""
+    name = _backend_override or settings.get_optional_setting("DATABASE_BACKEND", "mysql")
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown DATABASE_BACKEND '{name}', choose from: {', '.join(BACKENDS)}")
+    return name
+
+@contextmanager
+def use_backend(name):
+    """Temporarily route sessions to another backend, e.g. for migrations and benchmarks."""
+    global _backend_override
+    previous = _backend_override
+    _backend_override = name
+    try:
+        yield
+    finally:
+        _backend_override = previous
+
+def get_sqlite_path():
+    """Return the path of the SQLite ratings database."""
+    path = settings.get_optional_setting("DATABASE_PATH")
+    if path:
+        return os.path.expanduser(path)
+    playlist_folder, apollo_folder, ai_folder, m3u_folder, missing_folder, sorted_folder = settings.get_apollo_folders()
+    return os.path.join(apollo_folder, "ratings.db")
+
+# values MySQL hands back that sqlite3 cannot bind on its own, e.g. during a migration
+sqlite3.register_adapter(decimal.Decimal, float)
+sqlite3.register_adapter(datetime.datetime, lambda value: value.strftime("%Y-%m-%d %H:%M:%S"))
+
+def _unix_timestamp(value):
+    """UNIX_TIMESTAMP() for SQLite, whose CURRENT_TIMESTAMP values are UTC text."""
+    if value is None:
+        return None
+    return calendar.timegm(time.strptime(str(value)[:19], "%Y-%m-%d %H:%M:%S"))
+
+def _dict_row(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+class SQLiteCursor:
+    """A sqlite3 cursor that accepts the %s placeholders used by the pymysql queries."""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    @staticmethod
+    def _translate(sql, params):
+        if params is None:
+            return sql
+        return sql.replace("%s", "?").replace("%%", "%")
+
+    def execute(self, sql, params=None):
+        if params is None:
+            return self.cursor.execute(sql)
+        return self.cursor.execute(self._translate(sql, params), params)
+
+    def executemany(self, sql, rows):
+        return self.cursor.executemany(self._translate(sql, rows), rows)
+
+    def fetchone(self):
+        return self.cursor.fetchone()
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+    def close(self):
+        self.cursor.close()
+
+class SQLiteConnection:
+    """A sqlite3 connection with dict rows and the MySQL functions the ratings queries use."""
+
+    def __init__(self, path):
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.row_factory = _dict_row
+        self.db.create_function("POW", 2, math.pow, deterministic=True)
+        self.db.create_function("UNIX_TIMESTAMP", 1, _unix_timestamp, deterministic=True)
+        self.db.execute("PRAGMA journal_mode=WAL")
+
+    def cursor(self):
+        return SQLiteCursor(self.db.cursor())
+
+    def commit(self):
+        self.db.commit()
+
+    def rollback(self):
+        self.db.rollback()
+
+    def close(self):
+        self.db.close()
+
+@contextmanager
+def connection(backend=None):
+    """Borrow a connection. MySQL connections are returned to the pool on exit, or discarded if they failed."""
+    if (backend or backend_name()) == "sqlite":
+        dbh = SQLiteConnection(get_sqlite_path())
+        try:
+            yield dbh
+        finally:
+            dbh.close()
+        return
+
+    pool = get_pool()
+    dbh = pool.acquire()
+    broken = False
+    try:
+        yield dbh
+    except (pymysql.OperationalError, pymysql.InterfaceError):
+        broken = True
+        raise
+    finally:
+        pool.release(dbh, broken=broken)
+
+@contextmanager
+def session(backend=None):
+    """Borrow a connection and a cursor, yielded as (dbh, sth)."""
+    with connection(backend) as dbh:
+        sth = dbh.cursor()
+        try:
+            yield dbh, sth
+        finally:
+            sth.close()
+
+def stream_cursor(dbh):
+    """Return a cursor that streams rows instead of buffering the whole result."""
+    if isinstance(dbh, SQLiteConnection):
+        return dbh.cursor()
+    return dbh.cursor(pymysql.cursors.SSDictCursor)
@@ -1,9 +1,14 @@
 import yaml
 import re
 from elasticsearch import Elasticsearch
+from elasticsearch import helpers
 from colorama import Fore, Style
+from apollo_lib import catalog
 from apollo_lib import settings
+from apollo_lib import query as query_lib
 from apollo_lib import ratings
+from apollo_lib import state
+from apollo_lib import tracks as tracks_lib
 from platformdirs import user_config_dir
 
 # A collection of utility functions for interacting with Elasticsearch
@@ -18,6 +23,17 @@ def get_es():
     es = Elasticsearch(es_url)
     return es, es_index
 
+def get_index_generation():
+    """Return the scan generation counter, bumped whenever a scan changes the index."""
+    return state.load_state("index").get("generation", 0)
+
+def bump_index_generation():
+    """Increment and persist the scan generation counter."""
+    index_state = state.load_state("index")
+    index_state["generation"] = index_state.get("generation", 0) + 1
+    state.save_state("index", index_state)
+    return index_state["generation"]
+
 def print_hit(hit):
     """Print the details of a single Elasticsearch hit."""
     src = hit.get('_source', {})
@@ -160,33 +176,27 @@ def pick_best_hit(result, patterns_path=None):
         inner_debug_string += f"Selected with normalized bitrate: {max_normalized_bitrate:.1f}\n"
     return best, candidates, inner_debug_string
 
-def get_playlist_from_lines(es, index_name, lines):
-    """Get a playlist from a list of lines, searching for each line in Elasticsearch."""
-    urls = []
-    tracks = []
+def resolve_lines(es, index_name, lines):
+    """Resolve 'artist - title' lines to their best files.
+
+    Returns (entries, missing) where each entry is a dict with url, artist, title, album and duration.
+    """
+    entries = []
     missing = []
-    duration = 0
+    in_index = ratings_in_index()
+    rating_threshold = settings.get_setting('RATING_THRESHOLD', 45)
     for raw in lines:
-        song = raw.strip()
-
-        if not song or song.startswith('#'):
-            continue
-        
-        song = re.sub(r"\s*-\s*", " - ", song, count=1)
-        if " - " not in song:
-            continue
-
-        artist, title = [part.strip() for part in song.split(" - ", 1)]
-        if not artist or not title:
+        parts = tracks_lib.split_track(raw)
+        if parts is None:
             continue
+        artist, title = parts
         
-        calculated_rating = ratings.get_calculated_rating(artist, title)
-        
-        rating_threshold = settings.get_setting('RATING_THRESHOLD', 45)
-        if calculated_rating is not None:
-            if calculated_rating < rating_threshold:
-                print(f"{Fore.RED}Low calculated rating for {artist} - {title}: {calculated_rating}")
-                continue
+        if not in_index:
+            calculated_rating = ratings.get_calculated_rating(artist, title)
+            if calculated_rating is not None:
+                if calculated_rating < rating_threshold:
+                    print(f"{Fore.RED}Low calculated rating for {artist} - {title}: {calculated_rating}")
+                    continue
         
         result = search_es(es, index_name, artist, title)
         if not result or "hits" not in result or "total" not in result["hits"]:
@@ -198,14 +208,28 @@ def get_playlist_from_lines(es, index_name, lines):
             continue
         
         best, candidates, debug_info = pick_best_hit(result)
-        es_title = best["hit"]["_source"].get("title", "")
-        es_artist = best["hit"]["_source"].get("artist", "")
-        es_url = best["hit"]["_source"].get("url", "")
-
-        urls.append(f"{es_url}")
-        track = es_artist + " - " + es_title
-        tracks.append(track)
-        duration += best["hit"]["_source"].get("duration", 0)
+        source = best["hit"]["_source"]
+        if in_index:
+            # the rating was synced onto the document, unrated songs have none
+            calculated_rating = source.get("calculated_rating")
+            if calculated_rating is not None and calculated_rating < rating_threshold:
+                print(f"{Fore.RED}Low calculated rating for {artist} - {title}: {calculated_rating}")
+                continue
+        entries.append({
+            "url": source.get("url", ""),
+            "artist": source.get("artist", ""),
+            "title": source.get("title", ""),
+            "album": source.get("album", ""),
+            "duration": source.get("duration", 0),
+        })
+    return entries, missing
+
+def get_playlist_from_lines(es, index_name, lines):
+    """Get a playlist from a list of lines, searching for each line in Elasticsearch."""
+    entries, missing = resolve_lines(es, index_name, lines)
+    urls = [f"{entry['url']}" for entry in entries]
+    tracks = [entry["artist"] + " - " + entry["title"] for entry in entries]
+    duration = sum(entry["duration"] or 0 for entry in entries)
     return urls, tracks, duration, missing
 
 def search_es(es, index_name, artist, title):
@@ -228,6 +252,97 @@ def search_es(es, index_name, artist, title):
     result = es.search(index=index_name, body=query_body)
     return result
 
+def ratings_in_index():
+    """True when RATINGS_IN_INDEX is set and calculated ratings are read from the ES documents."""
+    return bool(settings.get_optional_setting("RATINGS_IN_INDEX", False))
+
+def _apply_rating_filter(query_body, sort=True):
+    """With ratings in the index, drop songs below RATING_THRESHOLD and list the best rated first."""
+    if not ratings_in_index():
+        return query_body
+    threshold = settings.get_setting('RATING_THRESHOLD', 45)
+    bool_query = query_body["query"]["bool"]
+    # songs without any ratings, votes or skips carry no calculated_rating and count as unrated (50)
+    bool_query.setdefault("filter", []).append({
+        "bool": {
+            "should": [
+                {"range": {"calculated_rating": {"gte": threshold}}},
+                {"bool": {"must_not": {"exists": {"field": "calculated_rating"}}}},
+            ],
+            "minimum_should_match": 1,
+        }
+    })
+    if sort:
+        query_body["sort"] = [
+            {"calculated_rating": {"order": "desc", "missing": 50, "unmapped_type": "integer"}},
+            "_score",
+        ]
+    return query_body
+
+def sync_ratings_to_index(verbose=False):
+    """
+    Write calculated_rating onto the ES documents of rated songs with bulk partial updates.
+    Only songs whose rating changed since the last sync are sent; after a scan changes the
+    index, every rated song is sent again so new files pick up their rating.
+    Returns counts of updated documents, cleared ratings and failures.
+    """
+    es, index_name = get_es()
+    # checked against the database, so a sync right after rating -ca -u sends the new ratings
+    lookup = ratings.load_rating_lookup(fresh=True)
+    generation = get_index_generation()
+    synced = state.load_state("index-ratings")
+    previous = synced.get("ratings", {}) if synced.get("generation") == generation else {}
+
+    changed = {key: rating for key, rating in lookup.items() if previous.get(key) != rating}
+    cleared = [key for key in previous if key not in lookup]
+
+    try:
+        es.indices.put_mapping(index=index_name, body={"properties": {"calculated_rating": {"type": "integer"}}})
+    except Exception as e:
+        print(Fore.YELLOW + f"Could not set calculated_rating mapping: {e}" + Style.RESET_ALL)
+
+    wanted = dict(changed)
+    wanted.update({key: None for key in cleared})
+    sent = {}
+
+    def actions():
+        db = catalog.connect()
+        try:
+            for track_key, url in db.execute("SELECT track_key, url FROM songs"):
+                if track_key in wanted:
+                    sent[url] = track_key
+                    yield {
+                        "_op_type": "update",
+                        "_index": index_name,
+                        "_id": url,
+                        "doc": {"calculated_rating": wanted[track_key]},
+                    }
+        finally:
+            db.close()
+
+    updated = 0
+    failed = 0
+    retry = set()
+    for ok, item in helpers.streaming_bulk(es, actions(), chunk_size=500, raise_on_error=False, max_retries=3):
+        if ok:
+            updated += 1
+            continue
+        failed += 1
+        result = item.get("update", {})
+        if result.get("status") != 404:
+            # a 404 means the catalog lists a file ES no longer has; nothing to retry
+            retry.add(sent.get(result.get("_id")))
+        if verbose:
+            print(Fore.RED + f"Failed to update {result.get('_id')}: {result.get('error')}" + Style.RESET_ALL)
+
+    # keys with a failed document are left out, so the next sync sends them again
+    synced_ratings = {key: rating for key, rating in lookup.items() if key not in retry}
+    synced_ratings.update({key: previous[key] for key in cleared if key in retry})
+    state.save_state("index-ratings", {"generation": generation, "ratings": synced_ratings})
+    print(Fore.GREEN + f"Ratings in index: {len(changed)} changed, {len(cleared)} cleared, "
+          f"{updated} documents updated, {failed} failed" + Style.RESET_ALL)
+    return {"changed": len(changed), "cleared": len(cleared), "updated": updated, "failed": failed}
+
 def get_all_by_artist(es, index_name, artist):
     """Get all songs by a specific artist from Elasticsearch."""
     query_body = {
@@ -244,6 +359,7 @@ def get_all_by_artist(es, index_name, artist):
         },
         "size": 500,
     }
+    _apply_rating_filter(query_body)
 
     result = es.search(index=index_name, body=query_body)
 
@@ -270,6 +386,7 @@ def get_all_by_path(es, index_name, path):
         },
         "size": 2000,
     }
+    _apply_rating_filter(query_body)
 
     result = es.search(index=index_name, body=query_body)
 
@@ -279,3 +396,17 @@ def get_all_by_path(es, index_name, path):
 
     lines = list(set(lines))
     return lines
+
+def get_all_by_query(es, index_name, expression):
+    """Stream 'artist - title' lines for songs matching a query filter expression."""
+    query_body = query_lib.compile_query(expression)
+    query_body["_source"] = ["artist", "title"]
+    _apply_rating_filter(query_body, sort=False)
+
+    # scan pages through the results server-side instead of pulling the catalog to the client
+    for hit in helpers.scan(es, index=index_name, query=query_body, size=1000):
+        source = hit.get("_source", {})
+        artist = source.get("artist")
+        title = source.get("title")
+        if artist and title:
+            yield f"{artist} - {title}"
@@ -0,0 +1,253 @@
+import os
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import unquote, urlparse
+from colorama import Fore, Style
+from apollo_lib import catalog
+from apollo_lib import settings
+from apollo_lib import tracks as tracks_lib
+
+# Reverse resolution: turn file-based M3U/PLS/XSPF playlists into Apollo 'artist - title' source lists.
+
+def _location_to_path(location: str, playlist_dir: str) -> str:
+    """Turn a playlist location (path or file:// url) into an absolute local path."""
+    location = location.strip()
+    if location.lower().startswith("file://"):
+        location = unquote(urlparse(location).path)
+    location = location.replace("\\", "/")
+    if not os.path.isabs(location) and not (len(location) > 1 and location[1] == ":"):
+        location = os.path.normpath(os.path.join(playlist_dir, location))
+    return location
+
+def parse_playlist(path: str) -> List[Tuple[str, Optional[str]]]:
+    """Return (location, 'artist - title' hint or None) pairs from an M3U, PLS or XSPF file."""
+    playlist_dir = os.path.dirname(os.path.abspath(path))
+    extension = os.path.splitext(path)[1].lower()
+    entries = []
+
+    if extension == ".xspf":
+        namespace = {"x": "http://xspf.org/ns/0/"}
+        root = ET.parse(path).getroot()
+        for track in root.iter("{http://xspf.org/ns/0/}track"):
+            location = track.findtext("x:location", default="", namespaces=namespace)
+            creator = track.findtext("x:creator", default="", namespaces=namespace)
+            title = track.findtext("x:title", default="", namespaces=namespace)
+            hint = f"{creator} - {title}" if creator and title else None
+            if location:
+                entries.append((_location_to_path(location, playlist_dir), hint))
+        return entries
+
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        lines = [line.strip() for line in f]
+
+    if extension == ".pls":
+        files = {}
+        titles = {}
+        for line in lines:
+            key, _, value = line.partition("=")
+            key = key.strip().lower()
+            if key.startswith("file"):
+                files[key[4:]] = value
+            elif key.startswith("title"):
+                titles[key[5:]] = value
+        for number in sorted(files, key=lambda n: int(n) if n.isdigit() else 0):
+            entries.append((_location_to_path(files[number], playlist_dir), titles.get(number)))
+        return entries
+
+    # M3U / M3U8
+    hint = None
+    for line in lines:
+        line = line.lstrip("\ufeff")
+        if not line:
+            continue
+        if line.startswith("#EXTINF"):
+            _, _, hint = line.partition(",")
+            hint = hint.strip() or None
+            continue
+        if line.startswith("#"):
+            continue
+        entries.append((_location_to_path(line, playlist_dir), hint))
+        hint = None
+    return entries
+
+def _path_tail(path: str, depth: int = 2) -> str:
+    """Return the last path components, casefolded, for matching files moved to another root."""
+    parts = [part for part in path.replace("\\", "/").split("/") if part]
+    return "/".join(parts[-depth:]).casefold()
+
+class CatalogLookup:
+    """Batched path to (artist, title) lookups against the scanned catalog."""
+
+    def __init__(self):
+        self.db = catalog.connect()
+        self.by_path: Dict[str, Optional[Tuple[str, str]]] = {}
+        self.by_tail = None
+
+    def close(self):
+        self.db.close()
+
+    def prefetch(self, paths: List[str]) -> None:
+        """Resolve exact catalog urls for many paths with a few IN queries."""
+        pending = [path for path in set(paths) if path not in self.by_path]
+        for start in range(0, len(pending), 500):
+            batch = pending[start:start + 500]
+            placeholders = ", ".join("?" for _ in batch)
+            rows = self.db.execute(f"SELECT url, artist, title FROM songs WHERE url IN ({placeholders})", batch)
+            for url, artist, title in rows:
+                if artist and title:
+                    self.by_path[url] = (artist, title)
+
+    TAIL_DEPTHS = (3, 2)
+
+    def _tail_index(self):
+        # Built once, on the first path that is not an exact catalog url. A tail shared by
+        # different songs (e.g. "Greatest Hits/01 - Intro.mp3") maps to None: it identifies nothing.
+        if self.by_tail is None:
+            self.by_tail = {}
+            for url, artist, title in self.db.execute("SELECT url, artist, title FROM songs"):
+                if artist and title:
+                    for depth in self.TAIL_DEPTHS:
+                        tail = _path_tail(url, depth)
+                        if tail in self.by_tail and self.by_tail[tail] != (artist, title):
+                            self.by_tail[tail] = None
+                        else:
+                            self.by_tail[tail] = (artist, title)
+        return self.by_tail
+
+    def lookup(self, path: str) -> Optional[Tuple[str, str]]:
+        """Return (artist, title) for a path, matching on the trailing folders if the root differs."""
+        if path in self.by_path:
+            return self.by_path[path]
+        index = self._tail_index()
+        found = None
+        # the longest tail that identifies a single song wins; ambiguous tails stay unresolved
+        for depth in self.TAIL_DEPTHS:
+            found = index.get(_path_tail(path, depth))
+            if found:
+                break
+        self.by_path[path] = found
+        return found
+
+def _tags_for_file(path: str) -> Optional[Tuple[str, str]]:
+    """Read artist/title tags from a file outside the catalog."""
+    if not os.path.exists(path):
+        return None
+    from mutagen import File as MutagenFile
+    from apollo_lib.scanner import get_tag_value
+    try:
+        audiofile = MutagenFile(path)
+    except Exception:
+        return None
+    if not audiofile or not getattr(audiofile, "tags", None):
+        return None
+    artist = get_tag_value(audiofile, ['TPE1', 'ARTIST', '\xa9ART'])
+    title = get_tag_value(audiofile, ['TIT2', 'TITLE', '\xa9nam'])
+    if artist and title:
+        return artist, title
+    return None
+
+def resolve_entry(lookup: CatalogLookup, path: str, hint: Optional[str]) -> Optional[Tuple[str, str]]:
+    """Map one playlist entry to (artist, title): catalog first, then tags, then the playlist's own title."""
+    found = lookup.lookup(path) or _tags_for_file(path)
+    if found:
+        return found
+    if hint:
+        return tracks_lib.split_track(hint)
+    return None
+
+def _output_name(path: str, used: Set[str]) -> str:
+    """Pick a source-list name for path that no earlier playlist in this import has taken."""
+    base, ext = os.path.splitext(os.path.basename(path))
+    candidates = [base]
+    if ext:
+        candidates.append(f"{base}-{ext.lstrip('.').lower()}")
+    for candidate in candidates:
+        if candidate.lower() not in used:
+            break
+    else:
+        counter = 2
+        while f"{candidates[-1]}-{counter}".lower() in used:
+            counter += 1
+        candidate = f"{candidates[-1]}-{counter}"
+    used.add(candidate.lower())
+    return candidate + ".txt"
+
+def import_playlists(paths: List[str], output_folder: Optional[str] = None, overwrite: bool = False) -> Dict[str, int]:
+    """Convert playlist files into 'artist - title' source lists and print a summary."""
+    if output_folder is None:
+        output_folder = settings.get_setting("PLAYLIST_SOURCE_FOLDER")
+
+    parsed = {}
+    for path in paths:
+        try:
+            parsed[path] = parse_playlist(path)
+        except (IOError, ET.ParseError) as e:
+            print(Fore.RED + f"Could not read {path}: {e}" + Style.RESET_ALL)
+
+    lookup = CatalogLookup()
+    try:
+        lookup.prefetch([location for entries in parsed.values() for location, _ in entries])
+
+        written = 0
+        skipped = 0
+        renamed = 0
+        used: Set[str] = set()
+        resolved_total = 0
+        unresolved: Dict[str, int] = {}
+        for path, entries in parsed.items():
+            name = _output_name(path, used)
+            target = os.path.join(output_folder, name)
+            if name != os.path.splitext(os.path.basename(path))[0] + ".txt":
+                print(Fore.YELLOW + f"Another playlist in this import is named like {path}, writing {name} instead" + Style.RESET_ALL)
+                renamed += 1
+            if os.path.exists(target) and not overwrite:
+                print(Fore.YELLOW + f"Skipping {path}: {target} exists (use --overwrite)" + Style.RESET_ALL)
+                skipped += 1
+                continue
+
+            lines = []
+            seen = set()
+            for location, hint in entries:
+                found = resolve_entry(lookup, location, hint)
+                if not found:
+                    unresolved[location] = unresolved.get(location, 0) + 1
+                    continue
+                key = tracks_lib.normalize_key(*found)
+                if key not in seen:
+                    seen.add(key)
+                    lines.append(f"{found[0]} - {found[1]}")
+
+            resolved_total += len(lines)
+            with open(target, "w") as f:
+                f.write(f"# Imported from {path}\n")
+                for line in lines:
+                    f.write(line + "\n")
+            written += 1
+            print(Fore.GREEN + f"Imported {len(lines)}/{len(entries)} tracks: {target}" + Style.RESET_ALL)
+    finally:
+        lookup.close()
+
+    print()
+    print(Fore.YELLOW + f"Playlists written: {written}")
+    print(Fore.YELLOW + f"Playlists skipped: {skipped}")
+    print(Fore.YELLOW + f"Playlists renamed: {renamed}")
+    print(Fore.YELLOW + f"Tracks resolved:   {resolved_total}")
+    print(Fore.RED + f"Unresolved files:  {len(unresolved)}" + Style.RESET_ALL)
+    ranked = sorted(unresolved.items(), key=lambda item: -item[1])
+    for location, count in ranked[:20]:
+        print(f"  {count:4d}  {location}")
+    if unresolved:
+        playlist_folder, apollo_folder, ai_folder, m3u_folder, missing_folder, sorted_folder = settings.get_apollo_folders()
+        report_path = os.path.join(missing_folder, "import-unresolved.txt")
+        with open(report_path, "w") as f:
+            for location, count in ranked:
+                f.write(f"{count}\t{location}\n")
+        print(f"Full list: {report_path}")
+
+    return {
+        "written": written,
+        "skipped": skipped,
+        "renamed": renamed,
+        "resolved": resolved_total,
+        "unresolved": len(unresolved),
+    }
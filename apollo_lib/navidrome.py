@@ -1,14 +1,20 @@
 import hashlib
 import json
 import os
+import random
 import re
 import secrets
+import threading
+import time
 from collections import Counter
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
 
 import requests
+from requests.adapters import HTTPAdapter
 
-from apollo_lib import estools, ratings, settings
+from apollo_lib import catalog, db, ratings, settings, state
+from apollo_lib import tracks as tracks_lib
 
 
 def _normalize_relative_path(filename):
@@ -51,25 +57,152 @@ def _auth_params():
     }
 
 
-def _subsonic_get(endpoint, params=None, timeout=15):
-    """Call a Subsonic endpoint and return the parsed response object."""
-    base_url, _, _ = _get_client_settings()
-    call_params = _auth_params()
-    if params:
-        call_params.update(params)
+class SubsonicError(RuntimeError):
+    """An error response from the Subsonic API, with its numeric error code."""
+
+    def __init__(self, code, message):
+        super().__init__(f"Navidrome API error ({code}): {message}")
+        self.code = code
+
+
+# Subsonic error code for "the requested data was not found", e.g. a song id that no longer exists
+NOT_FOUND = 70
+
+
+class RetryableError(Exception):
+    """A failed call worth retrying: connection problems, timeouts, 429 and 5xx responses."""
+
+
+class AdaptiveLimiter:
+    """Caps concurrent requests and adapts the cap to the server (additive increase, multiplicative decrease).
+
+    The limit grows by one after a full window of fast successes, and halves on a transport
+    error, timeout, 429 or 5xx, or when a call takes longer than target_latency seconds.
+    Subsonic API errors are answers, so they count as successes.
+    """
+
+    def __init__(self, max_limit, target_latency, initial=2):
+        self.max_limit = max(1, max_limit)
+        self.target_latency = target_latency
+        self.limit = min(initial, self.max_limit)
+        self.in_flight = 0
+        self.successes = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= self.limit:
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency=None, ok=True):
+        with self.condition:
+            self.in_flight -= 1
+            if not ok or (latency is not None and latency > self.target_latency):
+                self.limit = max(1, self.limit // 2)
+                self.successes = 0
+            else:
+                self.successes += 1
+                if self.successes >= self.limit and self.limit < self.max_limit:
+                    self.limit += 1
+                    self.successes = 0
+            self.condition.notify_all()
 
-    url = f"{base_url}/rest/{endpoint}.view"
-    response = requests.get(url, params=call_params, timeout=timeout)
-    response.raise_for_status()
 
-    payload = response.json()
-    sub = payload.get("subsonic-response", {})
-    if sub.get("status") != "ok":
-        error = sub.get("error", {})
-        code = error.get("code", "unknown")
-        message = error.get("message", "Unknown Subsonic API error")
-        raise RuntimeError(f"Navidrome API error ({code}): {message}")
-    return sub
+class NavidromeClient:
+    """Subsonic API client with a keep-alive session, concurrency limiting and retries with jitter.
+
+    Optional settings:
+      NAVIDROME_MAX_WORKERS     most concurrent requests (default 8)
+      NAVIDROME_TARGET_LATENCY  seconds per call before concurrency backs off (default 1.0)
+      NAVIDROME_RETRIES         attempts per call for retryable errors (default 3)
+    """
+
+    def __init__(self):
+        self.base_url, _, _ = _get_client_settings()
+        # one token per client: Subsonic accepts a salt/token pair for as long as the password is valid
+        self.auth = _auth_params()
+        self.max_workers = max(1, int(settings.get_optional_setting("NAVIDROME_MAX_WORKERS", 8)))
+        self.retries = max(1, int(settings.get_optional_setting("NAVIDROME_RETRIES", 3)))
+        self.limiter = AdaptiveLimiter(
+            self.max_workers, float(settings.get_optional_setting("NAVIDROME_TARGET_LATENCY", 1.0))
+        )
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _get_once(self, endpoint, params, timeout):
+        call_params = dict(self.auth)
+        if params:
+            call_params.update(params)
+        url = f"{self.base_url}/rest/{endpoint}.view"
+        try:
+            response = self.session.get(url, params=call_params, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as exc:
+            raise RetryableError(str(exc))
+        if response.status_code == 429 or response.status_code >= 500:
+            raise RetryableError(f"HTTP {response.status_code} from {endpoint}")
+        response.raise_for_status()
+
+        payload = response.json()
+        sub = payload.get("subsonic-response", {})
+        if sub.get("status") != "ok":
+            error = sub.get("error", {})
+            code = error.get("code", "unknown")
+            message = error.get("message", "Unknown Subsonic API error")
+            raise SubsonicError(code, message)
+        return sub
+
+    def get(self, endpoint, params=None, timeout=15):
+        """Call a Subsonic endpoint and return the parsed response object."""
+        for attempt in range(self.retries):
+            self.limiter.acquire()
+            start = time.monotonic()
+            ok = False
+            try:
+                sub = self._get_once(endpoint, params, timeout)
+                ok = True
+                return sub
+            except (SubsonicError, requests.HTTPError):
+                # the server answered promptly, e.g. error 70 for a stale id: not a reason to back off
+                ok = True
+                raise
+            except RetryableError:
+                if attempt + 1 == self.retries:
+                    raise
+            finally:
+                self.limiter.release(time.monotonic() - start, ok=ok)
+            # full jitter: sleep a random time up to the exponential backoff
+            time.sleep(random.uniform(0, 0.5 * (2 ** attempt)))
+
+    def map(self, func, items):
+        """Run func over items on the worker pool, yielding (item, result, error) as calls finish."""
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(func, item): item for item in items}
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result(), None
+                except Exception as exc:
+                    yield futures[future], None, exc
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the shared Navidrome client."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = NavidromeClient()
+    return _client
+
+
+def _subsonic_get(endpoint, params=None, timeout=15):
+    """Call a Subsonic endpoint and return the parsed response object."""
+    return get_client().get(endpoint, params, timeout=timeout)
 
 
 def _pick_song_by_filename(songs, filename):
@@ -231,6 +364,116 @@ def get_rating_by_filename(filename):
     return get_rating_by_song_id(song_id)
 
 
+def fetch_all_songs(page_size=500):
+    """Yield every song in the Navidrome library by paging search3 with an empty query."""
+    offset = 0
+    while True:
+        sub = _subsonic_get("search3", {
+            "query": "",
+            "artistCount": 0,
+            "albumCount": 0,
+            "songCount": page_size,
+            "songOffset": offset,
+        }, timeout=60)
+        batch = sub.get("searchResult3", {}).get("song", [])
+        if isinstance(batch, dict):
+            batch = [batch]
+        for song in batch:
+            yield song
+        if len(batch) < page_size:
+            return
+        offset += page_size
+
+
+def _path_tail(path, depth=2):
+    """Return the last path components, casefolded."""
+    parts = [part for part in path.casefold().split("/") if part]
+    return "/".join(parts[-depth:])
+
+
+def _add_unique(index, key, song):
+    """Index song under key, marking the key None once a second song shares it."""
+    if key in index and index[key] is not song:
+        index[key] = None
+    else:
+        index[key] = song
+
+
+class SongMap:
+    """The whole Navidrome library indexed for in-memory lookups by artist/title and by path.
+
+    Trailing folders and basenames are only used when a single song has them; a shared
+    one such as "Greatest Hits/01 - Intro.mp3" matches nothing.
+    """
+
+    def __init__(self, songs):
+        self.count = 0
+        self.by_artist_title = {}
+        self.by_artist = {}
+        self.by_title = {}
+        self.by_path = {}
+        self.by_tail = {}
+        self.by_basename = {}
+        for song in songs:
+            self.add(song)
+
+    @classmethod
+    def fetch(cls, page_size=500):
+        """Build the map from the live library."""
+        return cls(fetch_all_songs(page_size))
+
+    def add(self, song):
+        self.count += 1
+        artist = _normalize_text(song.get("artist"))
+        title = _normalize_text(song.get("title"))
+        self.by_artist_title.setdefault((artist, title), song)
+        self.by_artist.setdefault(artist, []).append(song)
+        self.by_title.setdefault(title, []).append(song)
+
+        path = (song.get("path") or "").replace("\\", "/").lstrip("/").casefold()
+        if path:
+            self.by_path.setdefault(path, song)
+            _add_unique(self.by_tail, _path_tail(path), song)
+            _add_unique(self.by_basename, os.path.basename(path), song)
+
+    def find_by_artist_title(self, artist, title):
+        """Match like find_song_by_artist_title: exact normalized pair, then containment."""
+        artist_norm = _normalize_text(artist)
+        title_norm = _normalize_text(title)
+        song = self.by_artist_title.get((artist_norm, title_norm))
+        if song:
+            return song
+
+        # containment, e.g. "Artist feat. Other" or "Title (Remastered)"
+        for song in self.by_title.get(title_norm, []):
+            if artist_norm in _normalize_text(song.get("artist")):
+                return song
+        for song in self.by_artist.get(artist_norm, []):
+            if title_norm in _normalize_text(song.get("title")):
+                return song
+        return None
+
+    def find_by_filename(self, filename):
+        """Match like _pick_song_by_filename: exact relative path, unique trailing folders, then unique basename."""
+        rel = _normalize_relative_path(filename).casefold()
+        return (
+            self.by_path.get(rel)
+            or self.by_tail.get(_path_tail(rel))
+            or self.by_basename.get(os.path.basename(rel))
+        )
+
+    def is_ambiguous(self, filename):
+        """True when filename has no exact match and its trailing folders or basename are shared."""
+        rel = _normalize_relative_path(filename).casefold()
+        if rel in self.by_path:
+            return False
+        tail = _path_tail(rel)
+        if tail in self.by_tail:
+            return self.by_tail[tail] is None
+        basename = os.path.basename(rel)
+        return basename in self.by_basename and self.by_basename[basename] is None
+
+
 def _normalize_user_rating(value):
     """Normalize Navidrome userRating into int 1..5 when possible."""
     try:
@@ -279,146 +522,249 @@ def apollo_rating_to_navidrome(calculated_rating):
     return int(round(mapped))
 
 
-def _get_best_filename_for_song(es, index_name, artist, title):
-    """Resolve the best local file path for an artist/title via Elasticsearch."""
-    result = estools.search_es(es, index_name, artist, title)
-    if not result or result.get("hits", {}).get("total", {}).get("value", 0) == 0:
-        return None
-
-    best, _, _ = estools.pick_best_hit(result)
-    if not best:
-        return None
-
-    source = best.get("hit", {}).get("_source", {})
-    url = source.get("url")
-    if not url:
-        return None
-    return url
+def _catalog_filenames(catalog_db, artist, title):
+    """Return the local files of an artist/title from the scanned catalog."""
+    if catalog_db is None:
+        return []
+    rows = catalog_db.execute(
+        "SELECT url FROM songs WHERE track_key = ?", (tracks_lib.normalize_key(artist, title),)
+    )
+    return [row[0] for row in rows]
 
 
-def update_all_ratings(verbose=False):
-    """Push all ratings from apollo_calculated_rating to Navidrome by filename."""
-    dbh, sth = ratings.get_db_connection()
-    if not dbh or not sth:
-        return {
-            "total": 0,
-            "updated": 0,
-            "missing_file": 0,
-            "unchanged": 0,
-            "failed": 0,
-        }
+def _match_row(song_map, catalog_db, artist, title):
+    """Find the Navidrome song for a rating row.
 
-    sth.execute("SELECT artist, title, calculated_rating FROM apollo_calculated_rating")
-    rows = sth.fetchall() or []
+    Returns (song, filename, error) where error is the reason no song matched.
+    """
+    song = song_map.find_by_artist_title(artist, title)
+    if song is not None:
+        return song, None, None
+
+    # Fallback to the song's local files when artist/title tags differ.
+    filenames = _catalog_filenames(catalog_db, artist, title)
+    if not filenames:
+        return None, None, "No catalog filename match"
+    for filename in filenames:
+        song = song_map.find_by_filename(filename)
+        if song is not None:
+            return song, filename, None
+    rel = _normalize_relative_path(filenames[0])
+    if song_map.is_ambiguous(filenames[0]):
+        return None, filenames[0], f"Several Navidrome songs share the filename: {rel}"
+    return None, filenames[0], f"Song not found in Navidrome for filename: {rel}"
+
+
+def _verified_at(verify):
+    """Return the verified_at to save: now after a full check, else the previous value."""
+    if verify:
+        return time.time()
+    return state.load_state("navidrome-sync").get("verified_at", 0)
+
+
+def _load_sync_state(verify):
+    """Return (songs, verify) from the saved sync state, switching to verify when it is due."""
+    sync_state = state.load_state("navidrome-sync")
+    songs = sync_state.get("songs") or {}
+    if verify:
+        return {}, True
+    if not songs:
+        print("No Navidrome sync state yet, checking every song against Navidrome")
+        return {}, True
+    verify_days = float(settings.get_optional_setting("NAVIDROME_VERIFY_DAYS", 7))
+    if verify_days and time.time() - sync_state.get("verified_at", 0) > verify_days * 86400:
+        print(f"Last full check was over {verify_days:g} days ago, checking every song against Navidrome")
+        return {}, True
+    return songs, False
+
+
+def update_all_ratings(verbose=False, verify=False):
+    """Push all ratings from apollo_calculated_rating to Navidrome.
+
+    The song id and last pushed rating of every song are kept in the navidrome-sync state,
+    so a run only sends ratings that changed since the last push. Songs without state, and
+    songs whose id Navidrome no longer knows, are matched against the whole library, fetched
+    once, by artist/title and then by the song's local files.
+
+    With verify (or every NAVIDROME_VERIFY_DAYS days) the state is ignored and every song is
+    compared with the rating Navidrome actually holds, which catches ratings changed elsewhere.
+    Writes are sent several at a time through the shared client (see NavidromeClient).
+    """
+    empty = {
+        "total": 0,
+        "updated": 0,
+        "missing_file": 0,
+        "unchanged": 0,
+        "skipped": 0,
+        "failed": 0,
+    }
+    try:
+        with db.session() as (dbh, sth):
+            sth.execute("SELECT artist, title, calculated_rating FROM apollo_calculated_rating")
+            rows = sth.fetchall() or []
+    except db.DatabaseError:
+        return empty
 
     total = len(rows)
     if total == 0:
         print("No rows found in apollo_calculated_rating.")
-        return {
-            "total": 0,
-            "updated": 0,
-            "missing_file": 0,
-            "unchanged": 0,
-            "failed": 0,
-        }
-
-    # Fail fast if Navidrome is unreachable or auth is invalid.
-    _subsonic_get("ping", timeout=5)
+        return empty
 
-    es, index_name = estools.get_es()
+    known, verify = _load_sync_state(verify)
+    synced = {}
 
     updated = 0
     missing_file = 0
     unchanged = 0
+    skipped = 0
     failed = 0
-    processed = 0
     failed_items = []
 
-    print(f"Starting Navidrome rating sync for {total} songs...")
-
+    def record_failure(artist, title, nd_rating, filename, exc):
+        failed_items.append({
+            "artist": artist,
+            "title": title,
+            "target_rating": nd_rating,
+            "artist_title_error": None,
+            "filename": filename,
+            "fallback_error": str(exc),
+        })
+        if verbose:
+            print(f"Failed to update {artist} - {title}: {exc}")
+        elif len(failed_items) <= 3:
+            print(f"Sample failure {artist} - {title}: {exc}")
+
+    # (key, song id, artist, title, path, nd_rating) of each rating to push
+    pending = []
+    unresolved = []
     for row in rows:
-        processed += 1
         artist = row.get("artist")
         title = row.get("title")
-        calculated = row.get("calculated_rating")
-
-        nd_rating = apollo_rating_to_navidrome(calculated)
-
-        try:
-            song = find_song_by_artist_title(artist, title)
-            song_id = song.get("id")
-            if not song_id:
-                raise LookupError(f"Navidrome song has no id for: {artist} - {title}")
-            current_rating = _normalize_user_rating(song.get("userRating"))
-            if current_rating is None:
-                current_rating = _normalize_user_rating(get_rating_by_song_id(song_id))
-
-            if current_rating == nd_rating:
-                unchanged += 1
-                if verbose:
-                    print(f"Unchanged rating {nd_rating}: {artist} - {title}")
+        key = tracks_lib.normalize_key(artist, title)
+        nd_rating = apollo_rating_to_navidrome(row.get("calculated_rating"))
+        entry = known.get(key)
+        if entry is None:
+            unresolved.append((key, artist, title, nd_rating))
+        elif entry.get("rating") != nd_rating:
+            if entry.get("id"):
+                pending.append((key, entry["id"], artist, title, entry.get("path"), nd_rating))
             else:
-                set_rating_by_song_id(song_id, nd_rating)
+                unresolved.append((key, artist, title, nd_rating))
+        elif entry.get("id"):
+            unchanged += 1
+            synced[key] = entry
+        else:
+            # did not match last time and the rating has not changed since; --verify retries
+            skipped += 1
+            synced[key] = entry
+
+    if not pending and not unresolved:
+        print(f"Navidrome is up to date for all {total} songs")
+        state.save_state("navidrome-sync", {"songs": synced, "verified_at": _verified_at(verify)})
+        return {**empty, "total": total, "unchanged": unchanged, "skipped": skipped}
+
+    # Fail fast if Navidrome is unreachable or auth is invalid.
+    _subsonic_get("ping", timeout=5)
+    client = get_client()
+    processed = total - len(pending) - len(unresolved)
+
+    def write(item):
+        set_rating_by_song_id(item[1], item[5])
+
+    def push(items, label):
+        nonlocal processed, updated, failed
+        if not items:
+            return []
+        print(f"Sending {len(items)} {label} (up to {client.max_workers} at a time)...")
+        stale = []
+        for item, _, exc in client.map(write, items):
+            key, song_id, artist, title, path, nd_rating = item
+            if isinstance(exc, SubsonicError) and exc.code == NOT_FOUND:
+                stale.append((key, artist, title, nd_rating))
+                continue
+            processed += 1
+            if exc is None:
+                synced[key] = {"id": song_id, "rating": nd_rating, "path": path}
                 updated += 1
                 if verbose:
-                    print(f"Updated rating {nd_rating}: {artist} - {title}")
-        except Exception as exc:
-            # Fallback to filename-based lookup when artist/title lookup fails.
-            filename = _get_best_filename_for_song(es, index_name, artist, title)
-            if not filename:
-                missing_file += 1
-                failed += 1
-                failed_items.append({
-                    "artist": artist,
-                    "title": title,
-                    "target_rating": nd_rating,
-                    "artist_title_error": str(exc),
-                    "filename": None,
-                    "fallback_error": "No ES filename match",
-                })
-                if verbose:
-                    print(f"Missing filename in ES for: {artist} - {title}")
+                    print(f"Updated rating {nd_rating}: {artist} - {title}" + (f" ({path})" if path else ""))
             else:
-                try:
-                    song = find_song_by_filename(filename)
-                    song_id = song.get("id")
-                    if not song_id:
-                        raise LookupError(f"Navidrome song has no id for filename: {filename}")
-
-                    current_rating = _normalize_user_rating(song.get("userRating"))
-                    if current_rating is None:
-                        current_rating = _normalize_user_rating(get_rating_by_song_id(song_id))
-
-                    if current_rating == nd_rating:
-                        unchanged += 1
-                        if verbose:
-                            print(f"Unchanged rating {nd_rating}: {artist} - {title} ({filename})")
-                    else:
-                        set_rating_by_song_id(song_id, nd_rating)
-                        updated += 1
-                        if verbose:
-                            print(f"Updated rating {nd_rating}: {artist} - {title} ({filename})")
-                except Exception as fallback_exc:
+                failed += 1
+                if key in known:
+                    synced[key] = known[key]
+                record_failure(artist, title, nd_rating, path, exc)
+
+            if not verbose and (processed % 100 == 0 or processed == total):
+                print(
+                    f"Progress {processed}/{total} | "
+                    f"updated={updated} unchanged={unchanged} "
+                    f"missing_file={missing_file} failed={failed} "
+                    f"concurrency={client.limiter.limit}"
+                )
+        return stale
+
+    stale = push(pending, "rating changes")
+    if stale:
+        print(f"{len(stale)} song ids are no longer in Navidrome, matching them again")
+    unresolved.extend(stale)
+
+    if unresolved:
+        print("Loading Navidrome library...")
+        song_map = SongMap.fetch()
+        print(f"Loaded {song_map.count} Navidrome songs")
+
+        try:
+            catalog_db = catalog.connect()
+        except FileNotFoundError as exc:
+            print(f"Filename matching disabled: {exc}")
+            catalog_db = None
+
+        matched = []
+        try:
+            for key, artist, title, nd_rating in unresolved:
+                song, filename, error = _match_row(song_map, catalog_db, artist, title)
+                if song is None:
+                    processed += 1
                     failed += 1
+                    if filename is None:
+                        missing_file += 1
+                    synced[key] = {"id": None, "rating": nd_rating, "path": None}
                     failed_items.append({
                         "artist": artist,
                         "title": title,
                         "target_rating": nd_rating,
-                        "artist_title_error": str(exc),
+                        "artist_title_error": f"Song not found in Navidrome for: {artist} - {title}",
                         "filename": filename,
-                        "fallback_error": str(fallback_exc),
+                        "fallback_error": error,
                     })
                     if verbose:
-                        print(f"Failed to update {artist} - {title}: {fallback_exc}")
-                    elif processed <= 3:
-                        print(f"Sample failure {artist} - {title}: {fallback_exc}")
-
-        if not verbose and (processed % 100 == 0 or processed == total):
-            print(
-                f"Progress {processed}/{total} | "
-                f"updated={updated} unchanged={unchanged} "
-                f"missing_file={missing_file} failed={failed}"
-            )
+                        print(f"Failed to match {artist} - {title}: {error}")
+                elif not song.get("id"):
+                    processed += 1
+                    failed += 1
+                    record_failure(artist, title, nd_rating, filename,
+                                   LookupError(f"Navidrome song has no id for: {artist} - {title}"))
+                # search3 results carry userRating for rated songs, so a missing one means unrated
+                elif _normalize_user_rating(song.get("userRating")) == nd_rating:
+                    processed += 1
+                    unchanged += 1
+                    synced[key] = {"id": song["id"], "rating": nd_rating, "path": song.get("path")}
+                    if verbose:
+                        label = f"{artist} - {title}" + (f" ({filename})" if filename else "")
+                        print(f"Unchanged rating {nd_rating}: {label}")
+                else:
+                    matched.append((key, song["id"], artist, title, song.get("path"), nd_rating))
+        finally:
+            if catalog_db is not None:
+                catalog_db.close()
+
+        for key, artist, title, nd_rating in push(matched, "ratings for newly matched songs"):
+            processed += 1
+            failed += 1
+            record_failure(artist, title, nd_rating, None,
+                           LookupError(f"Navidrome song disappeared during sync: {artist} - {title}"))
+
+    state.save_state("navidrome-sync", {"songs": synced, "verified_at": _verified_at(verify)})
 
     fail_log_path = _write_fail_log(failed_items)
     reason_counter = Counter()
@@ -439,6 +785,242 @@ def update_all_ratings(verbose=False):
         "updated": updated,
         "missing_file": missing_file,
         "unchanged": unchanged,
+        "skipped": skipped,
         "failed": failed,
         "fail_log": fail_log_path,
-    }
\ No newline at end of file
+    }
+
+
+def _parse_timestamp(value):
+    """Parse a Subsonic (RFC 3339) timestamp into an aware datetime, or None when missing or invalid."""
+    if not value:
+        return None
+    match = re.match(r"^(.*?T\d{2}:\d{2}:\d{2})(?:\.(\d+))?(Z|[+-]\d{2}:?\d{2})?$", value.strip())
+    if not match:
+        return None
+    base, fraction, zone = match.groups()
+    # fromisoformat before Python 3.11 wants exactly six fraction digits and no Z
+    text = base + ("." + (fraction + "000000")[:6] if fraction else "")
+    if zone and zone != "Z":
+        text += zone if ":" in zone else zone[:3] + ":" + zone[3:]
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def _later(a, b):
+    """Return the later of two optional datetimes."""
+    if a is None or b is None:
+        return a or b
+    return max(a, b)
+
+
+def _insert_batches(sth, sql, rows, chunk_size=1000):
+    for start in range(0, len(rows), chunk_size):
+        sth.executemany(sql, rows[start:start + chunk_size])
+
+
+def pull_ratings(verbose=False, full=False, page_size=1000):
+    """Import ratings, stars and plays made in Navidrome clients into Apollo.
+
+    A Navidrome rating that differs from both the latest apollo_rating and the rating Apollo
+    last pushed (see update_all_ratings) becomes a new apollo_rating row. A song starred since
+    the last pull becomes a good vote. Apollo has no play events, so new plays are only counted.
+
+    The library is paged once and compared with the Apollo data in memory. The newest played
+    and starred timestamps seen are kept in the navidrome-pull state as watermarks, along
+    with the ratings pulled, so the next run only moves new activity; full ignores them.
+    """
+    pull_state = {} if full else state.load_state("navidrome-pull")
+    played_mark = _parse_timestamp(pull_state.get("played"))
+    starred_mark = _parse_timestamp(pull_state.get("starred"))
+    pulled = pull_state.get("ratings", {})
+    plays = pull_state.get("plays", {})
+    pushed = state.load_state("navidrome-sync").get("songs", {})
+
+    with db.session() as (dbh, sth):
+        sth.execute(ratings.aggregate_ratings_sql())
+        current = {}
+        for row in sth.fetchall() or []:
+            current[tracks_lib.normalize_key(row["artist"], row["title"])] = {
+                "artist": row["artist"],
+                "title": row["title"],
+                "rating": float(row["rating"]) if row.get("rating") is not None else None,
+                "good_votes": int(row.get("good_votes") or 0),
+            }
+
+    _subsonic_get("ping", timeout=5)
+    print("Loading Navidrome library...")
+    new_ratings = []
+    new_votes = []
+    new_plays = 0
+    songs = 0
+    seen_ratings = {}
+    seen_plays = {}
+    newest_played = played_mark
+    newest_starred = starred_mark
+    for song in fetch_all_songs(page_size):
+        songs += 1
+        artist = song.get("artist")
+        title = song.get("title")
+        if not artist or not title:
+            continue
+        key = tracks_lib.normalize_key(artist, title)
+        # store events under Apollo's spelling when the song is already known
+        known = current.get(key, {})
+        names = (known.get("artist") or artist, known.get("title") or title, song.get("album"))
+
+        user_rating = _normalize_user_rating(song.get("userRating"))
+        if user_rating:
+            seen_ratings[key] = user_rating
+            if (
+                user_rating != pulled.get(key)
+                and user_rating != pushed.get(key, {}).get("rating")
+                and user_rating != known.get("rating")
+            ):
+                new_ratings.append(names + (user_rating,))
+                if verbose:
+                    print(f"Rating {user_rating}: {artist} - {title}")
+
+        # timestamps are parsed: fractional seconds vary in length, so the strings do not sort
+        starred = _parse_timestamp(song.get("starred"))
+        newest_starred = _later(newest_starred, starred)
+        if starred and (starred_mark is None or starred > starred_mark):
+            # on a first pull, a star only counts for songs without a good vote
+            if starred_mark or not known.get("good_votes"):
+                new_votes.append(names + ("good",))
+                if verbose:
+                    print(f"Starred: {artist} - {title}")
+
+        play_count = int(song.get("playCount") or 0)
+        played = _parse_timestamp(song.get("played"))
+        newest_played = _later(newest_played, played)
+        if play_count:
+            seen_plays[key] = play_count
+            if played and (played_mark is None or played > played_mark):
+                new_plays += max(0, play_count - plays.get(key, 0))
+
+    print(f"Loaded {songs} Navidrome songs")
+    if new_ratings or new_votes:
+        with db.session() as (dbh, sth):
+            _insert_batches(sth, "INSERT INTO apollo_rating (artist, title, album, rating) VALUES (%s, %s, %s, %s)", new_ratings)
+            _insert_batches(sth, "INSERT INTO apollo_vote (artist, title, album, rating) VALUES (%s, %s, %s, %s)", new_votes)
+            dbh.commit()
+
+    state.save_state("navidrome-pull", {
+        "played": newest_played.isoformat() if newest_played else "",
+        "starred": newest_starred.isoformat() if newest_starred else "",
+        "ratings": seen_ratings,
+        "plays": seen_plays,
+    })
+    return {"songs": songs, "ratings": len(new_ratings), "stars": len(new_votes), "plays": new_plays}
+
+
+# Library map shared by playlist publishes in one process; rebuilt after SONG_MAP_TTL seconds
+# so a long-running watcher picks up newly added songs.
+SONG_MAP_TTL = 300
+_song_map = None
+_song_map_loaded = 0
+
+
+def get_song_map():
+    """Return the cached library map, fetching it when missing or older than SONG_MAP_TTL."""
+    global _song_map, _song_map_loaded
+    if _song_map is None or time.monotonic() - _song_map_loaded > SONG_MAP_TTL:
+        _song_map = SongMap.fetch(page_size=1000)
+        _song_map_loaded = time.monotonic()
+    return _song_map
+
+
+def playlist_diff(current, desired):
+    """Return (indexes to remove, song ids to append) that turn current into desired.
+
+    Subsonic's updatePlaylist can only remove by index and append, so whatever is kept must
+    already be the start of desired: the longest start of desired found in current, in order,
+    is kept and the rest removed. Removing from the end and appending is cheap; a song inserted
+    or moved at position i means every song after i is removed and appended again.
+    """
+    remove = []
+    kept = 0
+    for index, song_id in enumerate(current):
+        if kept < len(desired) and song_id == desired[kept]:
+            kept += 1
+        else:
+            remove.append(index)
+    return remove, desired[kept:]
+
+
+def _playlist_song_ids(playlist_id):
+    sub = _subsonic_get("getPlaylist", {"id": playlist_id})
+    entries = sub.get("playlist", {}).get("entry", [])
+    if isinstance(entries, dict):
+        entries = [entries]
+    return [entry.get("id") for entry in entries]
+
+
+def publish_playlist(name, paths, chunk_size=200):
+    """Publish a playlist of file paths as a Navidrome playlist.
+
+    Paths are mapped to song ids through the library path index. The playlist id is kept
+    in the navidrome-playlists state; an existing playlist is diffed against its current
+    songs and patched with updatePlaylist, or replaced whole when the diff would send more
+    songs than the playlist holds. A missing playlist is created with createPlaylist.
+    Returns (added, removed, unmatched).
+    """
+    song_map = get_song_map()
+    desired = []
+    unmatched = 0
+    for path in paths:
+        song = song_map.find_by_filename(path)
+        if song is None or not song.get("id"):
+            unmatched += 1
+        else:
+            desired.append(song["id"])
+
+    playlists = state.load_state("navidrome-playlists")
+    playlist_id = playlists.get(name)
+    current = None
+    if playlist_id:
+        try:
+            current = _playlist_song_ids(playlist_id)
+        except SubsonicError as exc:
+            if exc.code != NOT_FOUND:
+                raise
+
+    if current is not None:
+        remove, add = playlist_diff(current, desired)
+        if desired and len(remove) + len(add) > len(desired):
+            # an insert near the top; createPlaylist with an id replaces the songs in one go
+            _subsonic_get("createPlaylist", {"playlistId": playlist_id, "songId": desired[:chunk_size]})
+            for start in range(chunk_size, len(desired), chunk_size):
+                _subsonic_get("updatePlaylist", {"playlistId": playlist_id, "songIdToAdd": desired[start:start + chunk_size]})
+            return len(desired), len(current), unmatched
+
+    created = current is None
+    if created:
+        sub = _subsonic_get("createPlaylist", {"name": name, "songId": desired[:chunk_size]})
+        playlist_id = sub.get("playlist", {}).get("id")
+        if not playlist_id:
+            # servers on API versions before 1.14 return no playlist, so look it up by name
+            found = _subsonic_get("getPlaylists").get("playlists", {}).get("playlist", [])
+            if isinstance(found, dict):
+                found = [found]
+            playlist_id = next((p.get("id") for p in reversed(found) if p.get("name") == name), None)
+        if not playlist_id:
+            raise RuntimeError(f"Navidrome did not return an id for playlist {name}")
+        playlists[name] = playlist_id
+        state.save_state("navidrome-playlists", playlists)
+        current = desired[:chunk_size]
+
+    remove, add = playlist_diff(current, desired)
+    # remove from the end first so the remaining indexes stay valid
+    remove.sort(reverse=True)
+    for start in range(0, len(remove), chunk_size):
+        _subsonic_get("updatePlaylist", {"playlistId": playlist_id, "songIndexToRemove": remove[start:start + chunk_size]})
+    for start in range(0, len(add), chunk_size):
+        _subsonic_get("updatePlaylist", {"playlistId": playlist_id, "songIdToAdd": add[start:start + chunk_size]})
+    return len(add) + (len(current) if created else 0), len(remove), unmatched
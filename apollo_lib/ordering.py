@@ -0,0 +1,76 @@
+import heapq
+import random
+from collections import deque
+from typing import Dict, List, Optional
+from apollo_lib import tracks as tracks_lib
+
+# Ordering stage for published playlists, applied to the resolved entries.
+
+ORDER_MODES = ["alpha", "random", "artist", "album"]
+
+def _artist_spaced(entries: List[dict], rng: random.Random, gap: int) -> List[dict]:
+    """Shuffle so the same artist repeats at most once every gap+1 tracks where possible.
+
+    Artists are kept in a heap keyed by remaining tracks; an artist that just played waits in
+    a FIFO cooldown queue for gap positions. O(n log k) for n tracks by k artists.
+    """
+    groups: Dict[str, List[dict]] = {}
+    for entry in entries:
+        groups.setdefault(tracks_lib.normalize_text(entry.get("artist")), []).append(entry)
+
+    heap = []
+    for artist, group in groups.items():
+        rng.shuffle(group)
+        heap.append((-len(group), rng.random(), artist))
+    heapq.heapify(heap)
+
+    cooldown = deque()
+    ordered = []
+    position = 0
+    while heap or cooldown:
+        while cooldown and cooldown[0][0] <= position:
+            _, artist = cooldown.popleft()
+            heapq.heappush(heap, (-len(groups[artist]), rng.random(), artist))
+
+        if heap:
+            _, _, artist = heapq.heappop(heap)
+        else:
+            # every remaining artist is cooling down; relax the gap for the one closest to release
+            _, artist = cooldown.popleft()
+
+        ordered.append(groups[artist].pop())
+        if groups[artist]:
+            cooldown.append((position + gap + 1, artist))
+        position += 1
+    return ordered
+
+def _album_grouped(entries: List[dict], rng: random.Random) -> List[dict]:
+    """Keep each album together in file order, with the albums in shuffled order."""
+    albums: Dict[tuple, List[dict]] = {}
+    for entry in entries:
+        key = (tracks_lib.normalize_text(entry.get("artist")), tracks_lib.normalize_text(entry.get("album")))
+        albums.setdefault(key, []).append(entry)
+
+    keys = sorted(albums)
+    rng.shuffle(keys)
+    ordered = []
+    for key in keys:
+        ordered.extend(sorted(albums[key], key=lambda e: e["url"]))
+    return ordered
+
+def order_entries(entries: List[dict], mode: str = "alpha", seed: Optional[str] = None, gap: int = 3) -> List[dict]:
+    """Return entries ordered by mode (alpha, random, artist or album), reproducible for a given seed."""
+    # start from a stable order so the seed alone decides the result
+    entries = sorted(entries, key=lambda e: e["url"])
+    if mode == "alpha":
+        return entries
+
+    rng = random.Random(seed)
+    if mode == "random":
+        rng.shuffle(entries)
+        return entries
+    if mode == "artist":
+        return _artist_spaced(entries, rng, max(0, int(gap)))
+    if mode == "album":
+        return _album_grouped(entries, rng)
+    raise ValueError(f"Unknown playlist order '{mode}', choose from: {', '.join(ORDER_MODES)}")
@@ -1,18 +1,25 @@
 import os
 import re
-import json
+from datetime import datetime, timezone
 from typing import List, Tuple, Optional
 from colorama import Fore, Style
 from apollo_lib import aitools
+from apollo_lib import catalog
 from apollo_lib import estools
+from apollo_lib import ordering
+from apollo_lib import ratings
 from apollo_lib import settings
+from apollo_lib import state
+from apollo_lib import targets as targets_lib
+from apollo_lib import tracks as tracks_lib
 
-def get_tracks_by_type(ptype: str, input_str: str) -> List[str]:
-    """Return track strings based on playlist type and input."""
+def get_tracks_by_type(ptype: str, input_str: str, fields: Optional[List[str]] = None, refresh: bool = False) -> List[str]:
+    """Return track strings based on playlist type and input. fields limits which columns `any` searches;
+    refresh asks the AI again instead of using a cached response."""
     playlist_folder,apollo_folder, ai_folder, m3u_folder, missing_folder, sorted_folder = settings.get_apollo_folders()
 
     if ptype == "ai":
-        result = aitools.get_playlist(input_str, 50)
+        result = aitools.get_playlist(input_str, 50, refresh=refresh)
         lines = result.split("\n")
         lines = list(set(lines))
         lines = [line for line in lines if not line.startswith('#')]
@@ -31,22 +38,24 @@ def get_tracks_by_type(ptype: str, input_str: str) -> List[str]:
         tracks = estools.get_all_by_path(es, index_name, input_str)
         return sorted(list(set(tracks)))
 
+    if ptype == "query":
+        es, index_name = estools.get_es()
+        try:
+            tracks = list(estools.get_all_by_query(es, index_name, input_str))
+        except ValueError as e:
+            print(Fore.RED + f"Invalid query: {e}" + Style.RESET_ALL)
+            return []
+        return sorted(list(set(tracks)))
+
     if ptype == "any":
-        pattern = re.compile(input_str, re.IGNORECASE)
-        tracks: List[str] = []
-        with open(os.path.join(ai_folder, "es.jsonl"), "r") as f:
-            input_lines = f.readlines()
-            for input_line in input_lines:
-                try:
-                    if pattern.search(input_line):
-                        parsed = json.loads(input_line, strict=False)
-                        artist = parsed["artist"]
-                        title = parsed["title"]
-                        tracks.append(f"{artist} - {title}")
-                except Exception as e:
-                    print(Fore.RED + "Caught error:", e)
-                    print(Fore.YELLOW + "  ", input_line)
-                    continue
+        try:
+            tracks: List[str] = [f"{artist} - {title}" for artist, title in catalog.search(input_str, fields)]
+        except re.error as e:
+            print(Fore.RED + f"Invalid pattern: {e}" + Style.RESET_ALL)
+            return []
+        except (ValueError, FileNotFoundError) as e:
+            print(Fore.RED + f"{e}" + Style.RESET_ALL)
+            return []
         return sorted(list(set(tracks)))
 
     return []
@@ -64,26 +73,49 @@ def log_playlist_creation(input_str: str, tracks: str, date_time: str):
     return
 
 
+def _load_default_index(source_path: str, default_playlist_file: str) -> set:
+    """Return the normalized key set of the default playlist, using the cache in .apollo when current."""
+    cache_name = f"default-index-{default_playlist_file}"
+    stat = os.stat(source_path)
+    cached = state.load_state(cache_name)
+    if cached.get("mtime") == stat.st_mtime and cached.get("size") == stat.st_size:
+        return set(cached.get("keys", []))
+
+    keys = set()
+    with open(source_path, "r") as f:
+        for line in f:
+            key = tracks_lib.track_key(line)
+            if key:
+                keys.add(key)
+
+    state.save_state(cache_name, {"mtime": stat.st_mtime, "size": stat.st_size, "keys": sorted(keys)})
+    return keys
+
+
 def diff_against_default(tracks: List[str], default_playlist_file: str) -> Tuple[List[str], List[str]]:
-    """Split tracks into existing vs new compared to default file."""
+    """Split tracks into existing vs new compared to default file, keeping their order.
+
+    Tracks are compared by normalized artist/title key, so case and whitespace variants count as existing.
+    """
     playlist_folder, apollo_folder, ai_folder, m3u_folder, missing_folder, sorted_folder = settings.get_apollo_folders()
     existing: List[str] = []
+    new_tracks: List[str] = []
     source_path = os.path.join(playlist_folder, f"{default_playlist_file}.txt")
     if os.path.exists(source_path):
-        with open(source_path, "r") as f:
-            random_lines = f.readlines()
-            random_lines = list(set(random_lines))
-            random_lines.sort()
-            for line in random_lines:
-                line = line.strip()
-                if line.startswith("#"):
-                    continue
-                if line in tracks:
-                    tracks.remove(line)
-                    existing.append(line)
+        default_keys = _load_default_index(source_path, default_playlist_file)
     else:
         print(Fore.YELLOW + f"Note: default playlist file not found: {source_path}")
-    return existing, tracks
+        default_keys = set()
+
+    seen = set()
+    for line in tracks:
+        key = tracks_lib.track_key(line) or line.strip().casefold()
+        if key in default_keys:
+            existing.append(line)
+        elif key not in seen:
+            seen.add(key)
+            new_tracks.append(line)
+    return existing, new_tracks
 
 
 def print_summary(ptype: str, input_str: str, existing: List[str], new_tracks: List[str]) -> None:
@@ -112,19 +144,34 @@ def append_to_default_playlist(default_playlist_file: str, date_time: str, scrip
     """Append tracks to the configured default playlist file."""
     playlist_folder, apollo_folder, ai_folder, m3u_folder, missing_folder, sorted_folder = settings.get_apollo_folders()
     print(f"Adding to {default_playlist_file} playlist")
-    with open(os.path.join(playlist_folder, f"{default_playlist_file}.txt"), "a") as f:
+    source_path = os.path.join(playlist_folder, f"{default_playlist_file}.txt")
+    cache_name = f"default-index-{default_playlist_file}"
+    cached = state.load_state(cache_name)
+    cache_current = False
+    if os.path.exists(source_path):
+        stat = os.stat(source_path)
+        cache_current = cached.get("mtime") == stat.st_mtime and cached.get("size") == stat.st_size
+
+    with open(source_path, "a") as f:
         f.write("\n# Added at " + date_time)
         f.write(f"\n# apollo.py - \"{input_str}\"\n")
         for line in tracks:
             f.write(line + "\n")
 
+    # Keep the cached key index in step with the file instead of rebuilding it next time
+    if cache_current:
+        keys = set(cached.get("keys", []))
+        keys.update(key for key in (tracks_lib.track_key(line) for line in tracks) if key)
+        stat = os.stat(source_path)
+        state.save_state(cache_name, {"mtime": stat.st_mtime, "size": stat.st_size, "keys": sorted(keys)})
+
 
-def create_playlist(ptype: str, input_str: str, dynamic: bool, default_playlist_file: Optional[str], auto_yes: bool, date_time: Optional[str] = None) -> None:
+def create_playlist(ptype: str, input_str: str, dynamic: bool, default_playlist_file: Optional[str], auto_yes: bool, date_time: Optional[str] = None, fields: Optional[List[str]] = None, refresh: bool = False) -> None:
     """End-to-end flow to build and optionally append a playlist."""
     playlist_folder, apollo_folder, ai_folder, m3u_folder, missing_folder, sorted_folder = settings.get_apollo_folders()
     dt = date_time or os.popen("date +'%Y-%m-%d-%H-%M-%S'").read().strip()
     dpf = default_playlist_file or settings.get_setting('DEFAULT_PLAYLIST_FILE')
-    tracks = get_tracks_by_type(ptype, input_str)
+    tracks = get_tracks_by_type(ptype, input_str, fields, refresh=refresh)
     log_playlist_creation(input_str, tracks, dt)
 
     # before pruning, write the dynamic playlist if requested
@@ -172,99 +219,293 @@ def create_playlist(ptype: str, input_str: str, dynamic: bool, default_playlist_
     print(Style.RESET_ALL)
 
 
-def sort_source_playlists(playlist_folder, sorted_folder):
-    """Normalize, de-duplicate, and sort source playlist .txt files."""
-    print(Fore.YELLOW + "Sorting source playlists..." + Style.RESET_ALL)
+def _sort_source_lines(lines: List[str]) -> List[str]:
+    """De-duplicate (case-insensitively) and casefold-sort source playlist lines."""
+    minimal_lines = []
+    marker = set()
+    for l in lines:
+        if l.startswith("#"):
+            continue
+        if l.startswith("\n"):
+            continue
+        if not l.endswith("\n"):
+            l = l + "\n"
+        ll = l.lower()
+        if ll not in marker:
+            marker.add(ll)
+            minimal_lines.append(l)
+
+    return sorted(minimal_lines, key=str.casefold)
+
+
+def _find_source_playlists(playlist_folder: str, single_file: Optional[str] = None, known: Optional[dict] = None) -> List[str]:
+    """Return source .txt paths under playlist_folder, optionally only those named single_file."""
+    if single_file and known:
+        # Avoid walking the whole source tree when the manifest already knows where the file lives
+        paths = [os.path.join(playlist_folder, rel) for rel in known
+                 if os.path.basename(rel) == single_file and os.path.exists(os.path.join(playlist_folder, rel))]
+        if paths:
+            return paths
+
+    paths = []
     for root, dirs, filenames in os.walk(playlist_folder):
         sub = root.replace(playlist_folder, "").strip(os.sep)
         if(sub.startswith(".apollo")):
+            dirs[:] = []
             continue
         for filename in filenames:
-            file = os.path.join(root, filename)
-            sorted_file = os.path.join(sorted_folder, filename)
-
-            if file.lower().endswith(".txt"):
-                with open(file, "r") as f:
-                    lines = f.readlines()
-
-                minimal_lines = []
-                marker = set()
-                for l in lines:
-                    if l.startswith("#"):
-                        continue
-                    if l.startswith("\n"):
-                        continue
-                    ll = l.lower()
-                    if ll not in marker:
-                        marker.add(ll)
-                        minimal_lines.append(l)
-                    else:
-                        t = l.strip()
-
-                sorted_lines = sorted(minimal_lines, key=str.casefold)
-
-                with open(sorted_file, "w") as f:
-                    for line in sorted_lines:
-                        f.write(line)
-
-                new_size = len(sorted_lines)
-
-
-def write_m3u_files(single_file: str | None = None):
-    """Generate .m3u files (and missing lists) from sorted playlists."""
+            if not filename.lower().endswith(".txt"):
+                continue
+            if single_file and filename != single_file:
+                continue
+            paths.append(os.path.join(root, filename))
+    return paths
+
+
+def sort_source_playlists(playlist_folder, sorted_folder, single_file: Optional[str] = None):
+    """Normalize, de-duplicate, and sort source playlist .txt files.
+
+    Only sources whose mtime/size changed since the last sort are re-read, and a sorted
+    file is only rewritten when its content changes. With single_file, only that source is considered.
+    """
+    print(Fore.YELLOW + "Sorting source playlists..." + Style.RESET_ALL)
+    manifest = state.load_state("sort-manifest")
+    changed = 0
+
+    for file in _find_source_playlists(playlist_folder, single_file, manifest):
+        filename = os.path.basename(file)
+        rel = os.path.relpath(file, playlist_folder)
+        sorted_file = os.path.join(sorted_folder, filename)
+
+        stat = os.stat(file)
+        entry = manifest.get(rel, {})
+        if (entry.get("mtime") == stat.st_mtime and entry.get("size") == stat.st_size
+                and os.path.exists(sorted_file)):
+            continue
+
+        with open(file, "rb") as f:
+            source_bytes = f.read()
+        source_hash = state.content_hash(source_bytes)
+
+        if entry.get("hash") != source_hash or not os.path.exists(sorted_file):
+            lines = source_bytes.decode("utf-8").splitlines(keepends=True)
+            sorted_lines = _sort_source_lines(lines)
+            if state.write_if_changed(sorted_file, "".join(sorted_lines)):
+                changed += 1
+
+        manifest[rel] = {
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "hash": source_hash,
+        }
+
+    state.save_state("sort-manifest", manifest)
+    if changed:
+        print(Fore.YELLOW + f"Sorted {changed} changed source playlists" + Style.RESET_ALL)
+
+
+def _publish_signature(index_generation, ratings_version, publish_targets):
+    """Return the non-source inputs that decide whether a published playlist is still valid."""
+    return {
+        "index_generation": index_generation,
+        "ratings_version": ratings_version,
+        "publish_targets": publish_targets,
+    }
+
+
+def _utc_now() -> str:
+    """Return the current UTC time as an ISO string."""
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def update_missing_ledger(ledger: dict, playlist_file: str, missing: List[str]) -> None:
+    """Record the songs a playlist could not resolve, and drop the ones it now resolves."""
+    now = _utc_now()
+    missing_keys = {}
+    for raw in missing:
+        parts = tracks_lib.split_track(raw)
+        if parts is None:
+            continue
+        missing_keys[tracks_lib.normalize_key(*parts)] = parts
+
+    for key in list(ledger.keys()):
+        entry = ledger[key]
+        if playlist_file in entry["playlists"] and key not in missing_keys:
+            entry["playlists"].remove(playlist_file)
+            if not entry["playlists"]:
+                del ledger[key]
+
+    for key, (artist, title) in missing_keys.items():
+        entry = ledger.setdefault(key, {
+            "artist": artist,
+            "title": title,
+            "playlists": [],
+            "first_seen": now,
+        })
+        if playlist_file not in entry["playlists"]:
+            entry["playlists"].append(playlist_file)
+            entry["playlists"].sort()
+        entry["last_tried"] = now
+
+
+def prune_missing_ledger(ledger: dict, playlist_files: List[str]) -> None:
+    """Forget references to playlists that no longer exist."""
+    existing = set(playlist_files)
+    for key in list(ledger.keys()):
+        entry = ledger[key]
+        entry["playlists"] = [p for p in entry["playlists"] if p in existing]
+        if not entry["playlists"]:
+            del ledger[key]
+
+
+def reresolve_missing(new_artists: set) -> List[str]:
+    """Retry ledger entries whose artist was just indexed and republish the playlists they fill."""
+    ledger = state.load_state("missing-ledger")
+    candidates = [entry for entry in ledger.values() if tracks_lib.normalize_text(entry["artist"]) in new_artists]
+    if not candidates:
+        return []
+
+    print(Fore.YELLOW + f"Re-resolving {len(candidates)} missing songs by newly indexed artists..." + Style.RESET_ALL)
+    es, index_name = estools.get_es()
+    now = _utc_now()
+    affected = set()
+    for entry in candidates:
+        entry["last_tried"] = now
+        result = estools.search_es(es, index_name, entry["artist"], entry["title"])
+        if result and result.get("hits", {}).get("total", {}).get("value", 0) > 0:
+            print(Fore.GREEN + f"  Found {entry['artist']} - {entry['title']}" + Style.RESET_ALL)
+            affected.update(entry["playlists"])
+    state.save_state("missing-ledger", ledger)
+
+    if affected:
+        write_m3u_files(files=sorted(affected), force=True)
+    return sorted(affected)
+
+
+def print_missing_report(limit: int = 50) -> None:
+    """Print missing songs ranked by how many playlists they would fill."""
+    ledger = state.load_state("missing-ledger")
+    if not ledger:
+        print("No missing songs recorded. Run 'apollo publish -a' first.")
+        return
+
+    ranked = sorted(ledger.values(), key=lambda e: (-len(e["playlists"]), e.get("first_seen", ""), e["artist"].casefold()))
+    print(Fore.CYAN + f"Missing songs: {len(ranked)} ({sum(len(e['playlists']) for e in ranked)} playlist slots)" + Style.RESET_ALL)
+    print()
+    for entry in ranked[:limit]:
+        count = len(entry["playlists"])
+        print(Fore.YELLOW + f"{count:4d}  {entry['artist']} - {entry['title']}" + Style.RESET_ALL)
+        print(f"      Playlists: {', '.join(p.replace('.txt', '') for p in entry['playlists'])}")
+        print(f"      First seen: {entry.get('first_seen', '')}  Last tried: {entry.get('last_tried', '')}")
+
+
+def write_m3u_files(single_file: str | None = None, force: bool = False, files: Optional[List[str]] = None,
+                    order: Optional[str] = None, seed: Optional[str] = None, gap: Optional[int] = None):
+    """Generate .m3u files (and missing lists) from sorted playlists.
+
+    A publish manifest in .apollo records, per playlist, the hash of its sorted source,
+    the index generation and the ratings version. Playlists whose inputs all match are
+    skipped without resolving; everything else is resolved and written only if changed.
+
+    Tracks are ordered by order (PLAYLIST_ORDER: alpha, random, artist, album), seeded per
+    playlist with seed (PLAYLIST_ORDER_SEED) and spaced by gap (PLAYLIST_ARTIST_GAP) for artist.
+    """
     playlist_folder, apollo_folder, ai_folder, m3u_folder, missing_folder, sorted_folder = settings.get_apollo_folders()
     es, index_name = estools.get_es()
 
     # Sort source playlists
-    sort_source_playlists(playlist_folder, sorted_folder)
+    if files:
+        for file in files:
+            sort_source_playlists(playlist_folder, sorted_folder, single_file=file)
+    else:
+        sort_source_playlists(playlist_folder, sorted_folder, single_file=single_file)
 
-    if single_file:
+    if files:
+        all_files = list(files)
+    elif single_file:
         all_files = [single_file]
     else:
         all_files = os.listdir(sorted_folder)
         all_files.sort()
 
+    publish_targets = targets_lib.get_publish_targets()
+    order = order or settings.get_optional_setting("PLAYLIST_ORDER", "alpha")
+    seed = seed if seed is not None else str(settings.get_optional_setting("PLAYLIST_ORDER_SEED", ""))
+    gap = gap if gap is not None else settings.get_optional_setting("PLAYLIST_ARTIST_GAP", 3)
+    manifest = state.load_state("publish-manifest")
+    ledger = state.load_state("missing-ledger")
+    if not files and not single_file:
+        prune_missing_ledger(ledger, all_files)
+    signature = _publish_signature(estools.get_index_generation(), ratings.get_ratings_version(), publish_targets)
+    signature["order"] = [order, seed, gap]
+    skipped = 0
+
     for file in all_files:
         if file.endswith(".txt"):
-            print(Fore.GREEN + f"Reading {file}")
-
             # Skip .apollo directory files
             if file.startswith(".apollo"):
                 continue
 
-            with open(os.path.join(sorted_folder, file), "r") as f:
-                duration = 0
-                lines = f.readlines()
-                lines = [line for line in lines if not line.startswith("#")]
-                lines = list(set(lines))
+            sorted_path = os.path.join(sorted_folder, file)
+            if not os.path.exists(sorted_path):
+                print(Fore.RED + f"Playlist not found: {file}" + Style.RESET_ALL)
+                continue
 
-                urls, tracks, duration, missing = estools.get_playlist_from_lines(es, index_name, lines)
+            with open(sorted_path, "rb") as f:
+                source_bytes = f.read()
+
+            output_filename = file.replace(".txt", ".m3u")
+            m3u_path = os.path.join(m3u_folder, output_filename)
+            entry = manifest.get(file)
+            source_hash = state.content_hash(source_bytes)
+            if (not force and entry
+                    and entry.get("source_hash") == source_hash
+                    and entry.get("signature") == signature
+                    and os.path.exists(m3u_path)):
+                skipped += 1
+                continue
 
-                urls.sort()
-                line_count = len(urls)
+            print(Fore.GREEN + f"Reading {file}")
+
+            lines = source_bytes.decode("utf-8").splitlines(keepends=True)
+            lines = [line for line in lines if not line.startswith("#")]
+            lines = list(set(lines))
+
+            # resolve once, then render every target from the same entries
+            entries, missing = estools.resolve_lines(es, index_name, lines)
 
-                playlist = "#EXTM3U\n" + "\n".join(urls)
+            entries = ordering.order_entries(entries, order, seed=f"{seed}:{file}", gap=gap)
+            line_count = len(entries)
+            duration = sum(e["duration"] or 0 for e in entries)
 
-                duration = round(duration, 0)
-                hours = round(duration // 3600, 0)
-                minutes = round((duration % 3600) // 60, 0)
-                duration = f"{hours} hours {minutes} minutes"
+            playlist = "#EXTM3U\n" + "\n".join(e["url"] for e in entries)
 
-                print(Fore.YELLOW + f"  Duration: {duration}")
-                print(Fore.YELLOW + f"  Count: {line_count}")
-                print(Style.RESET_ALL)
+            duration = round(duration, 0)
+            hours = round(duration // 3600, 0)
+            minutes = round((duration % 3600) // 60, 0)
+            duration = f"{hours} hours {minutes} minutes"
 
-                output_filename = file.replace(".txt", ".m3u")
-                with open(os.path.join(m3u_folder, output_filename), "w") as f:
-                    f.write(playlist)
+            print(Fore.YELLOW + f"  Duration: {duration}")
+            print(Fore.YELLOW + f"  Count: {line_count}")
+            print(Style.RESET_ALL)
+
+            state.write_if_changed(m3u_path, playlist)
+            state.write_if_changed(os.path.join(missing_folder, file), "\n".join(missing))
+            update_missing_ledger(ledger, file, missing)
+
+            # write the playlist to every PLAYLIST_PUBLISHED_FOLDER target
+            if not targets_lib.publish_entries(output_filename, entries, publish_targets):
+                # leave it out of the manifest so the next publish retries it
+                if manifest.pop(file, None) is not None:
+                    state.save_state("publish-manifest", manifest)
+                continue
 
-                with open(os.path.join(missing_folder, file), "w") as f:
-                    f.write("\n".join(missing))
+            manifest[file] = {
+                "source_hash": source_hash,
+                "signature": signature,
+            }
+            state.save_state("publish-manifest", manifest)
 
-                # copy the file to PLAYLIST_PUBLISHED_FOLDER
-                published_folder = settings.get_setting("PLAYLIST_PUBLISHED_FOLDER")
-                if published_folder:
-                    published_file = os.path.join(published_folder, output_filename)
-                    with open(published_file, "w") as f:
-                        f.write(playlist)
-                    print(Fore.YELLOW + f"  Published to {published_file}")
+    state.save_state("missing-ledger", ledger)
+    if skipped:
+        print(Fore.CYAN + f"Skipped {skipped} unchanged playlists" + Style.RESET_ALL)
@@ -0,0 +1,121 @@
+import re
+import shlex
+
+# A small filter expression language for `create -t query`, compiled into one Elasticsearch bool query.
+#
+# Terms are separated by whitespace and must all match:
+#   year:1990-1999        range (inclusive), also year>=1990, year<2000, year:1995
+#   genre:rock,metal      text match, comma separated values match any
+#   artist:"foo fighters" quote values with spaces
+#   ext:flac              file extension (leading dot optional)
+#   bitrate>=320k         bits per second, k suffix allowed
+#   duration<5m           seconds, s/m suffix allowed
+#   rating>60             calculated rating, once it is stored in the index
+#   -genre:christmas      prefix a term with - to exclude it
+
+TEXT_FIELDS = {
+    "artist": "artist",
+    "albumartist": "albumartist",
+    "title": "title",
+    "album": "album",
+    "genre": "genre",
+    "path": "url",
+}
+
+NUMERIC_FIELDS = {
+    "year": "year",
+    "bitrate": "bitrate",
+    "samplerate": "samplerate",
+    "duration": "duration",
+    "size": "size",
+    "rating": "calculated_rating",
+}
+
+EXTENSION_FIELDS = {"ext", "extension"}
+
+_TERM_RE = re.compile(r"^(-?)([a-z]+)(>=|<=|>|<|:|=)(.+)$", re.IGNORECASE)
+
+_RANGE_OPS = {">=": "gte", "<=": "lte", ">": "gt", "<": "lt"}
+
+def _parse_number(field, value):
+    """Parse a numeric filter value, allowing k (bitrate) and s/m (duration) suffixes."""
+    text = value.strip().lower()
+    multiplier = 1
+    if field == "bitrate" and text.endswith("k"):
+        text, multiplier = text[:-1], 1000
+    elif field == "duration" and text.endswith("m"):
+        text, multiplier = text[:-1], 60
+    elif field == "duration" and text.endswith("s"):
+        text = text[:-1]
+    try:
+        number = float(text) * multiplier
+    except ValueError:
+        raise ValueError(f"Invalid number for {field}: {value}")
+    return int(number) if number.is_integer() else number
+
+def _compile_term(name, op, value):
+    """Compile one field/operator/value triple into an Elasticsearch clause."""
+    name = name.lower()
+    values = [v for v in value.split(",") if v]
+
+    if name in TEXT_FIELDS:
+        if op not in (":", "="):
+            raise ValueError(f"Field '{name}' only supports ':'")
+        clauses = [{"match_phrase": {TEXT_FIELDS[name]: v}} for v in values]
+    elif name in EXTENSION_FIELDS:
+        if op not in (":", "="):
+            raise ValueError(f"Field '{name}' only supports ':'")
+        clauses = [{"match": {"extension": v if v.startswith(".") else "." + v}} for v in values]
+    elif name in NUMERIC_FIELDS:
+        field = NUMERIC_FIELDS[name]
+        if op in _RANGE_OPS:
+            clauses = [{"range": {field: {_RANGE_OPS[op]: _parse_number(name, value)}}}]
+        else:
+            clauses = []
+            for v in values:
+                if "-" in v:
+                    low, high = v.split("-", 1)
+                    bounds = {}
+                    if low:
+                        bounds["gte"] = _parse_number(name, low)
+                    if high:
+                        bounds["lte"] = _parse_number(name, high)
+                    clauses.append({"range": {field: bounds}})
+                else:
+                    clauses.append({"term": {field: _parse_number(name, v)}})
+    else:
+        known = sorted(list(TEXT_FIELDS) + list(NUMERIC_FIELDS) + list(EXTENSION_FIELDS))
+        raise ValueError(f"Unknown field '{name}', choose from: {', '.join(known)}")
+
+    if not clauses:
+        raise ValueError(f"Missing value for '{name}'")
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"bool": {"should": clauses, "minimum_should_match": 1}}
+
+def compile_query(expression):
+    """Compile a filter expression into an Elasticsearch query body."""
+    try:
+        terms = shlex.split(expression)
+    except ValueError as e:
+        raise ValueError(f"Invalid query expression: {e}")
+    if not terms:
+        raise ValueError("Empty query expression")
+
+    filters = []
+    exclusions = []
+    for term in terms:
+        match = _TERM_RE.match(term)
+        if not match:
+            raise ValueError(f"Invalid term '{term}', expected field:value or field>=value")
+        negate, name, op, value = match.groups()
+        clause = _compile_term(name, op, value)
+        if negate:
+            exclusions.append(clause)
+        else:
+            filters.append(clause)
+
+    query = {"bool": {"filter": filters}}
+    if exclusions:
+        query["bool"]["must_not"] = exclusions
+    return {"query": query}
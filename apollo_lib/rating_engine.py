@@ -0,0 +1,147 @@
+import time
+from colorama import Fore, Style
+from apollo_lib import ratings
+from apollo_lib import settings
+
+# Columnar ratings: every song's rating, votes and skips held as NumPy arrays, so the
+# rating formula runs over the whole library in one vectorized expression. Used to try
+# alternative formula settings and see how many songs would cross RATING_THRESHOLD.
+# NumPy is optional and only needed for these commands.
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("The ratings engine needs NumPy: pip install numpy")
+    return numpy
+
+class RatingEngine:
+    """Ratings, vote counts and skip counts as arrays, indexed by an interned song number."""
+
+    def __init__(self, songs):
+        """
+        Build the arrays from calculated_ratings style dicts keyed by (artist, title).
+        Songs carrying time-decayed counts (RATING_DECAY_HALF_LIFE_DAYS) are weighed by those,
+        as the stored ratings are.
+        """
+        np = _numpy()
+        self.np = np
+        self.keys = list(songs)
+        self.index = {key: i for i, key in enumerate(self.keys)}
+        artist_ids = {}
+
+        values = [songs[key] for key in self.keys]
+        self.rating = np.array([data.get("rating") or 0 for data in values], dtype=np.float64)
+        counts = [
+            data.get("decayed") or (data.get("good_votes", 0), data.get("bad_votes", 0), data.get("skips", 0))
+            for data in values
+        ]
+        self.good_votes = np.array([count[0] for count in counts], dtype=np.float64)
+        self.bad_votes = np.array([count[1] for count in counts], dtype=np.float64)
+        self.skips = np.array([count[2] for count in counts], dtype=np.float64)
+        self.artist_id = np.array(
+            [artist_ids.setdefault(key[0], len(artist_ids)) for key in self.keys], dtype=np.int32
+        )
+        self.artists = list(artist_ids)
+
+        # same as rating_formula: a missing (or zero) rating counts as 2.5
+        self.base = np.where(self.rating != 0, self.rating, 2.5) * 20
+
+    def compute(self, vote_strength, skip_strength):
+        """Return the calculated rating of every song, truncated like rating_formula."""
+        np = self.np
+        # same order of operations as rating_formula, so fractional decayed counts truncate alike
+        scores = self.base + self.good_votes * vote_strength - self.bad_votes * vote_strength - self.skips * skip_strength
+        return np.trunc(scores).astype(np.int64)
+
+    def artist_aggregates(self, scores):
+        """Return (song_count, total_rating, average_rating) arrays indexed like self.artists."""
+        np = self.np
+        counts = np.bincount(self.artist_id, minlength=len(self.artists))
+        totals = np.bincount(self.artist_id, weights=scores, minlength=len(self.artists))
+        return counts, totals, totals / np.maximum(counts, 1)
+
+    def histogram(self, scores, width=10):
+        """Return (counts, edges) of the rating distribution in buckets of width points."""
+        np = self.np
+        if len(scores) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(1)
+        low = int(np.floor(scores.min() / width) * width)
+        high = int(np.floor(scores.max() / width) * width) + width
+        return np.histogram(scores, bins=np.arange(low, high + width, width))
+
+    def crossings(self, baseline, candidate, threshold, new_threshold=None):
+        """Return the song indexes that drop below, and rise to or above, the threshold.
+        new_threshold, if given, is applied to candidate instead of threshold."""
+        np = self.np
+        if new_threshold is None:
+            new_threshold = threshold
+        dropped = np.flatnonzero((baseline >= threshold) & (candidate < new_threshold))
+        added = np.flatnonzero((baseline < threshold) & (candidate >= new_threshold))
+        return dropped, added
+
+def _print_histogram(engine, baseline, candidate, width=10, bar_width=30):
+    np = engine.np
+    _, edges = engine.histogram(np.concatenate([baseline, candidate]), width)
+    counts_base, _ = np.histogram(baseline, bins=edges)
+    counts_new, _ = np.histogram(candidate, bins=edges)
+    peak = max(int(counts_base.max(initial=0)), int(counts_new.max(initial=0)), 1)
+    print(Fore.YELLOW + f"{'Rating':>10}  {'Current':>8}  {'What if':>8}" + Style.RESET_ALL)
+    for low, now, then in zip(edges[:-1], counts_base, counts_new):
+        bar = "#" * int(round(then / peak * bar_width))
+        print(f"{int(low):>4}..{int(low) + width - 1:<4}  {int(now):>8}  {int(then):>8}  {bar}")
+
+def what_if(vote_strength=None, skip_strength=None, threshold=None, limit=10):
+    """Compare the current rating settings with alternatives across the whole library."""
+    current_vote = settings.get_setting("VOTE_STRENGTH", 5)
+    current_skip = settings.get_setting("SKIP_STRENGTH", 1)
+    current_threshold = settings.get_setting("RATING_THRESHOLD", 45)
+    vote_strength = current_vote if vote_strength is None else vote_strength
+    skip_strength = current_skip if skip_strength is None else skip_strength
+    threshold = current_threshold if threshold is None else threshold
+
+    if ratings.calculated_ratings is None:
+        ratings.calculate_all_ratings(verbose=False)
+    start = time.perf_counter()
+    engine = RatingEngine(ratings.calculated_ratings or {})
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    baseline = engine.compute(current_vote, current_skip)
+    candidate = engine.compute(vote_strength, skip_strength)
+    compute_seconds = time.perf_counter() - start
+
+    print(Fore.CYAN + f"{len(engine.keys)} songs, {len(engine.artists)} artists "
+          f"(arrays built in {load_seconds * 1000:.1f} ms, two formulas in {compute_seconds * 1000:.2f} ms)" + Style.RESET_ALL)
+    print(f"Current: VOTE_STRENGTH={current_vote} SKIP_STRENGTH={current_skip} RATING_THRESHOLD={current_threshold}")
+    print(f"What if: VOTE_STRENGTH={vote_strength} SKIP_STRENGTH={skip_strength} RATING_THRESHOLD={threshold}")
+    print()
+    _print_histogram(engine, baseline, candidate)
+    print()
+
+    kept_now = int((baseline >= current_threshold).sum())
+    kept_then = int((candidate >= threshold).sum())
+    print(f"Songs at or above the threshold: {kept_now} now, {kept_then} with the new settings")
+
+    dropped, added = engine.crossings(baseline, candidate, current_threshold, threshold)
+    print(Fore.RED + f"Would drop out of playlists: {len(dropped)}" + Style.RESET_ALL)
+    for i in dropped[:limit]:
+        artist, title = engine.keys[i]
+        print(f"  {artist} - {title}: {baseline[i]} -> {candidate[i]}")
+    print(Fore.GREEN + f"Would come back into playlists: {len(added)}" + Style.RESET_ALL)
+    for i in added[:limit]:
+        artist, title = engine.keys[i]
+        print(f"  {artist} - {title}: {baseline[i]} -> {candidate[i]}")
+
+    counts, totals, averages = engine.artist_aggregates(candidate)
+    _, _, averages_now = engine.artist_aggregates(baseline)
+    shift = averages - averages_now
+    moved = engine.np.argsort(-engine.np.abs(shift))[:limit]
+    moved = [i for i in moved if shift[i] != 0]
+    if moved:
+        print()
+        print(Fore.YELLOW + "Artists whose average moves the most:" + Style.RESET_ALL)
+        for i in moved:
+            print(f"  {engine.artists[i]} ({counts[i]} songs): {averages_now[i]:.1f} -> {averages[i]:.1f}")
+
+    return {"songs": len(engine.keys), "dropped": len(dropped), "added": len(added)}
@@ -1,36 +1,14 @@
-import pymysql
 import os
 from colorama import Fore, Style
 import json
 import sys
+import threading
+import time
+from apollo_lib import db
 from apollo_lib import settings
-
-def get_db_connection():
-    """Establish and return a pymysql connection and cursor with utf8mb4 encoding."""
-    db_host = settings.get_setting("DATABASE_HOST")
-    db_user = settings.get_setting("DATABASE_UN")
-    db_pass = settings.get_setting("DATABASE_PWD")
-    db_name = settings.get_setting("DATABASE_NAME")
-
-    try:
-        dbh = pymysql.connect(
-            host=db_host,
-            user=db_user,
-            password=db_pass,
-            database=db_name,
-            charset='utf8mb4',
-            cursorclass=pymysql.cursors.DictCursor
-        )
-        sth = dbh.cursor()
-        # Set UTF8MB4 for the session
-        sth.execute("SET NAMES utf8mb4")
-        dbh.commit()
-        return dbh, sth
-    except pymysql.MySQLError as e:
-        print(f"Failed to connect to '{db_host}:{db_name}' using username: {db_user}")
-        print(e)
-        return None, None
-
+from apollo_lib import snapshot
+from apollo_lib import storage
+from apollo_lib import tracks as tracks_lib
 
 def rating_formula(rating, good_votes, bad_votes, skips):
     """
@@ -54,223 +32,582 @@ def calculate_rating(artist, title):
     and calculates the final rating based on the formula.
     It is used to calculate the final rating during playback, not during playlist creation.
     """
-    dbh, sth = get_db_connection()
-
-    # votes
-    good_votes = 0
-    bad_votes = 0
+    with db.session() as (dbh, sth):
+        # votes
+        good_votes = 0
+        bad_votes = 0
 
-    sth.execute("SELECT * FROM apollo_vote WHERE artist=%s AND title=%s", (artist, title))
-    ratings = sth.fetchall()
+        sth.execute("SELECT * FROM apollo_vote WHERE artist=%s AND title=%s", (artist, title))
+        ratings = sth.fetchall()
 
-    if ratings:
-        for row in ratings:
-            vote = row['rating']
-            if(vote == "good"):
-                good_votes += 1
-            elif(vote == "bad"):
-                bad_votes += 1
+        if ratings:
+            for row in ratings:
+                vote = row['rating']
+                if(vote == "good"):
+                    good_votes += 1
+                elif(vote == "bad"):
+                    bad_votes += 1
 
-    # skips
-    skips = 0
-    sth.execute("SELECT COUNT(*) AS skip_count FROM apollo_skip WHERE artist=%s AND title=%s", (artist, title))
-    rows = sth.fetchone()
-    skips = rows['skip_count'] if rows and 'skip_count' in rows else 0
+        # skips
+        skips = 0
+        sth.execute("SELECT COUNT(*) AS skip_count FROM apollo_skip WHERE artist=%s AND title=%s", (artist, title))
+        rows = sth.fetchone()
+        skips = rows['skip_count'] if rows and 'skip_count' in rows else 0
 
-    # ratings
-    rating = 0
-    sth.execute("SELECT * FROM apollo_rating WHERE artist=%s AND title=%s ORDER BY modifiedon ASC", (artist, title))
-    ratings = sth.fetchall()
+        # ratings
+        rating = 0
+        sth.execute("SELECT * FROM apollo_rating WHERE artist=%s AND title=%s ORDER BY modifiedon ASC", (artist, title))
+        ratings = sth.fetchall()
 
-    if ratings:
-        for row in ratings:
-            rating = int(row['rating'])
+        if ratings:
+            for row in ratings:
+                rating = int(row['rating'])
 
-    if(rating == 0):
-        rating = 2.5
+        if(rating == 0):
+            rating = 2.5
 
-    calculated_rating = rating_formula(rating, good_votes, bad_votes, skips)
+        calculated_rating = rating_formula(rating, good_votes, bad_votes, skips)
 
-    json_data = {
-        "artist": artist,
-        "title": title,
-        "calculated_rating": calculated_rating,
-        "good_votes": good_votes,
-        "bad_votes": bad_votes,
-        "skips": skips,
-        "rating": rating
-    }
+        json_data = {
+            "artist": artist,
+            "title": title,
+            "calculated_rating": calculated_rating,
+            "good_votes": good_votes,
+            "bad_votes": bad_votes,
+            "skips": skips,
+            "rating": rating
+        }
 
-    json_string = json.dumps(json_data)
+        json_string = json.dumps(json_data)
 
-    print(json_string)
+        print(json_string)
 
 
 calculated_ratings = None
 
-def calculate_all_ratings(verbose=False):
+def aggregate_ratings_sql(where=""):
     """
-    Calculate ratings for all songs in the database into an in-memory dictionary.
-    This function connects to the database, retrieves all ratings, votes, and skips,
-    and calculates the final ratings for each song based on the formula.
-    It is used to calculate ratings for all songs at playlist creation time.
+    Build the grouped query that reduces apollo_rating, apollo_vote and apollo_skip to one row per song:
+    the latest rating, good/bad vote counts and skip count.
+    where is applied to each of the three event tables, e.g. "WHERE artist=%s",
+    so its parameters must be passed once per table.
     """
-    dbh, sth = get_db_connection()
+    return storage.dialect().aggregate_ratings_sql(where)
 
-    sth.execute("SELECT artist, title, rating FROM apollo_rating")
-    ratings_rows = sth.fetchall()
+def _song_from_aggregate(row, decayed=None):
+    """
+    Turn one aggregate row into the in-memory rating dict used by calculated_ratings.
+    With decayed (the map from _decayed_counts), the formula uses the time-decayed vote
+    and skip counts; the dict keeps the raw counts, and the decayed ones under 'decayed'.
+    """
+    r = row.get('rating')
+    try:
+        r_val = float(r) if r is not None else 0
+    except (TypeError, ValueError):
+        r_val = 0
+    data = {
+        "artist": row.get('artist'),
+        "title": row.get('title'),
+        "rating": r_val if r is not None else None,
+        "good_votes": int(row.get('good_votes') or 0),
+        "bad_votes": int(row.get('bad_votes') or 0),
+        "skips": int(row.get('skips') or 0),
+    }
+    if decayed is None:
+        data['calculated_rating'] = rating_formula(r_val, data['good_votes'], data['bad_votes'], data['skips'])
+    else:
+        good, bad, skips = decayed.get(tracks_lib.normalize_key(data['artist'], data['title']), (0, 0, 0))
+        data['decayed'] = (good, bad, skips)
+        data['calculated_rating'] = rating_formula(r_val, good, bad, skips)
+    return data
 
-    sth.execute("SELECT artist, title, rating FROM apollo_vote")
-    vote_rows = sth.fetchall()
+def _stored_rating(rating_val):
+    """Normalize a rating for storage in apollo_calculated_rating (2.5 when unrated)."""
+    try:
+        return float(rating_val) if rating_val is not None else 2.5
+    except (TypeError, ValueError):
+        return 2.5
+
+def _stored_values(data):
+    """Return the apollo_calculated_rating column values for one song, used to detect changes."""
+    return (
+        int(data.get("calculated_rating", 50)),
+        _stored_rating(data.get("rating")),
+        int(data.get("good_votes", 0)),
+        int(data.get("bad_votes", 0)),
+        int(data.get("skips", 0)),
+    )
 
-    sth.execute("SELECT artist, title FROM apollo_skip")
-    skip_rows = sth.fetchall()
+def ensure_calculated_tables(sth):
+    """Create apollo_calculated_rating and the watermark table if they do not exist."""
+    storage.dialect().create_tables(sth, ["apollo_calculated_rating", "apollo_rating_watermark"])
+
+# Each event table is tracked by the column that only grows when new events arrive
+WATERMARK_COLUMNS = {
+    "apollo_rating": "modifiedon",
+    "apollo_vote": "id",
+    "apollo_skip": "id",
+}
+
+def get_current_watermarks(sth):
+    """Return the current high-water mark of each event table."""
+    marks = {}
+    for table, column in WATERMARK_COLUMNS.items():
+        sth.execute(f"SELECT MAX({column}) AS mark FROM {table}")
+        row = sth.fetchone() or {}
+        mark = row.get("mark")
+        marks[table] = str(mark) if mark is not None else None
+    return marks
+
+def get_stored_watermarks(sth):
+    """Return the watermarks recorded by the last stored calculation."""
+    sth.execute("SELECT source, mark FROM apollo_rating_watermark")
+    return {row["source"]: row["mark"] for row in sth.fetchall() if row["source"] in WATERMARK_COLUMNS}
+
+def get_changed_songs(sth, since):
+    """Return (artist, title) keys with events newer than the since watermarks."""
+    changed = set()
+    for table, column in WATERMARK_COLUMNS.items():
+        mark = since.get(table)
+        if mark is None:
+            sth.execute(f"SELECT DISTINCT artist, title FROM {table}")
+        else:
+            # >= on timestamps, so events in the same second as the mark are never missed
+            op = ">=" if column == "modifiedon" else ">"
+            sth.execute(f"SELECT DISTINCT artist, title FROM {table} WHERE {column} {op} %s", (mark,))
+        for row in sth.fetchall():
+            changed.add((row["artist"], row["title"]))
+    return changed
+
+# Time decay (optional, RATING_DECAY_HALF_LIFE_DAYS): each vote and skip counts 2^(-age / half_life).
+# Forward decay keeps this incremental: apollo_decayed_rating holds per-song sums of
+# 2^((event_time - landmark) / half_life), which never change for old events, so new events are
+# simply added on. Decayed counts for "now" are the sums times one factor, 2^(-(now - landmark) / half_life).
+
+def _decay_half_life_seconds():
+    """Return the decay half-life in seconds, or None when decay is off."""
+    days = settings.get_optional_setting("RATING_DECAY_HALF_LIFE_DAYS")
+    if not days:
+        return None
+    return float(days) * 86400
 
-    merged = {}
+def ensure_decay_table(sth):
+    """Create the per-song forward-decay accumulator table if it does not exist."""
+    storage.dialect().create_tables(sth, ["apollo_decayed_rating"])
 
-    for row in ratings_rows:
-        key = (row.get('artist'), row.get('title'))
-        if key not in merged:
-            merged[key] = {"artist": key[0], "title": key[1], "rating": None, "good_votes": 0, "bad_votes": 0, "skips": 0}
-        merged[key]["rating"] = row.get('rating')
-
-    for row in vote_rows:
-        key = (row.get('artist'), row.get('title'))
-        if key not in merged:
-            merged[key] = {"artist": key[0], "title": key[1], "rating": None, "good_votes": 0, "bad_votes": 0, "skips": 0}
-        v = row.get('rating')
-        if v == 'good':
-            merged[key]["good_votes"] += 1
-        elif v == 'bad':
-            merged[key]["bad_votes"] += 1
-
-    for row in skip_rows:
-        key = (row.get('artist'), row.get('title'))
-        if key not in merged:
-            merged[key] = {"artist": key[0], "title": key[1], "rating": None, "good_votes": 0, "bad_votes": 0, "skips": 0}
-        merged[key]["skips"] += 1
-
-    for key, data in merged.items():
-        try:
-            r = data.get('rating')
-            try:
-                r_val = float(r) if r is not None else 0
-            except (TypeError, ValueError):
-                r_val = 0
-            calculated_rating = rating_formula(r_val, data.get('good_votes', 0), data.get('bad_votes', 0), data.get('skips', 0))
-            # print(f"Calculated rating for {key}: {calculated_rating}")
-            data['calculated_rating'] = calculated_rating
-        except Exception:
-            pass
+def _set_watermark(sth, source, mark):
+    upsert = storage.dialect().on_conflict(["source"], {"mark": "replace", "modifiedon": "now"})
+    sth.execute(f"INSERT INTO apollo_rating_watermark (source, mark) VALUES (%s, %s) {upsert}", (source, mark))
 
-    if verbose:
-        # sort based on calculated_rating
-        sorted_data = sorted(merged.values(), key=lambda x: x.get('calculated_rating', 0), reverse=True)
-
-        for data in sorted_data:
-            artist = data.get('artist', 'Unknown Artist')
-            title = data.get('title', 'Unknown Title')
-            rating = data.get('rating', 0)
-            good_votes = data.get('good_votes', 0)
-            bad_votes = data.get('bad_votes', 0)
-            skips = data.get('skips', 0)
-            calculated_rating = data.get('calculated_rating', 0)
-            # estools.set_rating(artist, title, calculated_rating)
+def _decay_events_sql():
+    """
+    The per-song weighted sums of votes and skips with ids in (previous, current], relative to a landmark.
+    Parameters: landmark, half_life, previous and current vote id, then the same four for skips.
+    """
+    time_column = settings.get_optional_setting("RATING_DECAY_TIME_COLUMN", "modifiedon")
+    weight = f"POW(2, (UNIX_TIMESTAMP({time_column}) - %s) / %s)"
+    # WHERE 1 keeps SQLite from reading a following upsert clause as part of the SELECT
+    return f"""
+        SELECT artist, title,
+               COALESCE(SUM(CASE WHEN vote = 'good' THEN w ELSE 0 END), 0) AS good_acc,
+               COALESCE(SUM(CASE WHEN vote = 'bad' THEN w ELSE 0 END), 0) AS bad_acc,
+               COALESCE(SUM(is_skip * w), 0) AS skip_acc
+        FROM (
+            SELECT artist, title, rating AS vote, 0 AS is_skip, {weight} AS w
+            FROM apollo_vote WHERE id > %s AND id <= %s
+            UNION ALL
+            SELECT artist, title, NULL, 1, {weight}
+            FROM apollo_skip WHERE id > %s AND id <= %s
+        ) events
+        WHERE 1
+        GROUP BY artist, title
+    """
 
-            
-            print(Fore.YELLOW + f"{artist} - {title}")
-            print(Fore.CYAN + f"Rating: {rating}, Good Votes: {good_votes}, Bad Votes: {bad_votes}, Skips: {skips}")
-            print(Fore.GREEN + f"Calculated Rating: {calculated_rating}")
-            print(Style.RESET_ALL)
+def _decay_marks(sth, half_life):
+    """
+    Return (landmark, {table: last id}) of the stored accumulators, or (None, {}) when there
+    are none yet or they were built for another half-life.
+    """
+    try:
+        sth.execute("SELECT source, mark FROM apollo_rating_watermark WHERE source LIKE 'decay%'")
+        marks = {row["source"]: row["mark"] for row in sth.fetchall()}
+    except db.DatabaseError:
+        return None, {}
+    if not marks.get("decay"):
+        return None, {}
+    stored_landmark, stored_half_life = marks["decay"].split("|")
+    if float(stored_half_life) != half_life:
+        return None, {}
+    return int(stored_landmark), {table: int(marks.get(f"decay:{table}") or 0) for table in ("apollo_vote", "apollo_skip")}
+
+def _event_marks(sth):
+    """Return the newest vote and skip ids."""
+    current = {}
+    for table in ("apollo_vote", "apollo_skip"):
+        sth.execute(f"SELECT MAX(id) AS mark FROM {table}")
+        current[table] = int((sth.fetchone() or {}).get("mark") or 0)
+    return current
+
+def _decay_events_params(landmark, half_life, previous, current):
+    return (
+        landmark, half_life, previous.get("apollo_vote", 0), current["apollo_vote"],
+        landmark, half_life, previous.get("apollo_skip", 0), current["apollo_skip"],
+    )
 
-    global calculated_ratings
-    calculated_ratings = merged
+def update_decay_accumulators(dbh, sth, half_life, full=False):
+    """
+    Add votes and skips recorded since the last update to apollo_decayed_rating and return the landmark.
+    The accumulators are rebuilt from scratch on the first run, when the half-life changes or with full,
+    and rescaled to a new landmark when their weights grow large. Runs under an exclusive lock, so
+    concurrent updates cannot both read the same marks and add the same events twice.
+    Called when storing ratings (rating -ca -u); the read path only reads the accumulators.
+    """
+    ensure_calculated_tables(sth)
+    ensure_decay_table(sth)
+    half_life = float(half_life)  # SQLite divides integers as integers
+    now = int(time.time())
+
+    with storage.dialect().exclusive(dbh, sth, "apollo_decay"):
+        landmark, previous = (None, {}) if full else _decay_marks(sth, half_life)
+        if landmark is None:
+            sth.execute("DELETE FROM apollo_decayed_rating")
+            landmark = now
+        elif (now - landmark) / half_life > 256:
+            # weights of new events approach 2^256; fold the elapsed decay into the sums and move the landmark
+            factor = 2 ** (-(now - landmark) / half_life)
+            sth.execute(
+                "UPDATE apollo_decayed_rating SET good_acc = good_acc * %s, bad_acc = bad_acc * %s, skip_acc = skip_acc * %s",
+                (factor, factor, factor),
+            )
+            landmark = now
+
+        current = _event_marks(sth)
+        if any(current[table] != previous.get(table, 0) for table in current):
+            upsert = storage.dialect().on_conflict(["artist", "title"], {"good_acc": "add", "bad_acc": "add", "skip_acc": "add"})
+            sth.execute(
+                f"INSERT INTO apollo_decayed_rating (artist, title, good_acc, bad_acc, skip_acc) {_decay_events_sql()} {upsert}",
+                _decay_events_params(landmark, half_life, previous, current),
+            )
+
+        # the accumulators and their marks are committed together, so no event is ever added twice
+        for table, mark in current.items():
+            _set_watermark(sth, f"decay:{table}", str(mark))
+        _set_watermark(sth, "decay", f"{landmark}|{half_life}")
+    return landmark
+
+def _decayed_counts(dbh, sth, artist=None):
+    """
+    Return {normalized key: (good_votes, bad_votes, skips)} decayed to now, or None when decay is off.
+    Read only: the stored accumulators plus, in memory, the events recorded since they were
+    last updated (all events when there are no usable accumulators). Only songs with votes
+    or skips are included.
+    """
+    half_life = _decay_half_life_seconds()
+    if not half_life:
+        return None
+    landmark, previous = _decay_marks(sth, half_life)
+    rows = []
+    if landmark is None:
+        landmark = int(time.time())
+    else:
+        if artist is None:
+            sth.execute("SELECT artist, title, good_acc, bad_acc, skip_acc FROM apollo_decayed_rating")
+        else:
+            sth.execute("SELECT artist, title, good_acc, bad_acc, skip_acc FROM apollo_decayed_rating WHERE artist=%s", (artist,))
+        rows = list(sth.fetchall())
+
+    current = _event_marks(sth)
+    pending = []
+    if any(current[table] != previous.get(table, 0) for table in current):
+        sth.execute(_decay_events_sql(), _decay_events_params(landmark, half_life, previous, current))
+        pending = sth.fetchall()
+    sums = {}
+    for row in rows + list(pending):
+        key = tracks_lib.normalize_key(row["artist"], row["title"])
+        good, bad, skips = sums.get(key, (0, 0, 0))
+        sums[key] = (good + row["good_acc"], bad + row["bad_acc"], skips + row["skip_acc"])
+
+    factor = 2 ** (-(time.time() - landmark) / half_life)
+    return {key: (good * factor, bad * factor, skips * factor) for key, (good, bad, skips) in sums.items()}
+
+def _aggregate_songs(dbh, keys, chunk_size=500):
+    """Yield aggregate rows for the given (artist, title) keys."""
+    keys = list(keys)
+    sth = dbh.cursor()
+    try:
+        for start in range(0, len(keys), chunk_size):
+            chunk = keys[start:start + chunk_size]
+            params = [value for key in chunk for value in key]
+            sth.execute(aggregate_ratings_sql(f"WHERE {storage.dialect().keys_in(len(chunk))}"), params * 3)
+            for row in sth.fetchall():
+                yield row
+    finally:
+        sth.close()
+
+# Songs whose stored row in apollo_calculated_rating is out of date (None means all of them),
+# and the watermarks to record once they are stored.
+_dirty_keys = None
+_pending_watermarks = None
+
+def reset_calculated_ratings():
+    """Forget the ratings calculated in this process, e.g. before switching backends."""
+    global calculated_ratings, _dirty_keys, _pending_watermarks, _rating_lookup
+    calculated_ratings = None
+    _dirty_keys = None
+    _pending_watermarks = None
+    _rating_lookup = None
+
+def _load_incremental(dbh, sth, decayed=None):
+    """
+    Build the rating map from apollo_calculated_rating plus the songs with events since the
+    stored watermarks. Returns (merged, dirty_keys, watermarks), or None if a full run is needed.
+    Nothing is created here; until the first store the tables are missing and a full run is done.
+    """
+    try:
+        stored_marks = get_stored_watermarks(sth)
+    except db.DatabaseError:
+        return None
+    if not stored_marks:
+        return None
 
+    watermarks = get_current_watermarks(sth)
+    changed = get_changed_songs(sth, stored_marks)
 
-def store_calculated_ratings(verbose=False):
-    """Create/update apollo_calculated_rating table with upserted calculated ratings."""
-    global calculated_ratings
+    merged = {}
+    dirty = set()
+    stream = db.stream_cursor(dbh)
+    try:
+        stream.execute("SELECT artist, title, rating, good_votes, bad_votes, skips, calculated_rating FROM apollo_calculated_rating")
+        for row in stream:
+            data = _song_from_aggregate(row, decayed)
+            key = (data['artist'], data['title'])
+            merged[key] = data
+            # the formula settings (or, with decay, the time) may have changed since the row was stored
+            if data['calculated_rating'] != int(row.get('calculated_rating') or 0):
+                dirty.add(key)
+    finally:
+        stream.close()
+
+    for row in _aggregate_songs(dbh, changed):
+        data = _song_from_aggregate(row, decayed)
+        key = (data['artist'], data['title'])
+        previous = merged.get(key)
+        if previous is None or _stored_values(previous) != _stored_values(data):
+            dirty.add(key)
+        merged[key] = data
+
+    return merged, dirty, watermarks
+
+def calculate_all_ratings(verbose=False, full=False, update_decay=False):
+    """
+    Calculate ratings for all songs in the database into an in-memory dictionary.
+    Votes and skips are counted by the database in a single grouped query, and the
+    per-song rows are streamed with an unbuffered cursor, so only one row per song
+    crosses the network.
+    Unless full is set, only songs with new ratings, votes or skips since the watermarks
+    recorded by the last store_calculated_ratings are recomputed; everything else comes
+    from apollo_calculated_rating. A full run is needed to pick up deleted events.
+    With RATING_DECAY_HALF_LIFE_DAYS set, votes and skips are time-decayed (see update_decay_accumulators);
+    update_decay, used when the ratings are about to be stored, brings the accumulators up to date first.
+    It is used to calculate ratings for all songs at playlist creation time.
+    """
+    global _dirty_keys, _pending_watermarks
+    with db.session() as (dbh, sth):
+        half_life = _decay_half_life_seconds()
+        if update_decay and half_life:
+            update_decay_accumulators(dbh, sth, half_life, full=full)
+        decayed = _decayed_counts(dbh, sth)
+        incremental = None if full else _load_incremental(dbh, sth, decayed)
+        if incremental is not None:
+            merged, _dirty_keys, _pending_watermarks = incremental
+            if verbose:
+                print(Fore.CYAN + f"Incremental ratings: {len(_dirty_keys)} changed of {len(merged)} songs" + Style.RESET_ALL)
+        else:
+            _pending_watermarks = get_current_watermarks(sth)
+            _dirty_keys = None
+            merged = {}
+            stream = db.stream_cursor(dbh)
+            try:
+                stream.execute(aggregate_ratings_sql())
+                for row in stream:
+                    data = _song_from_aggregate(row, decayed)
+                    merged[(data['artist'], data['title'])] = data
+            finally:
+                stream.close()
+
+        if verbose:
+            # sort based on calculated_rating
+            sorted_data = sorted(merged.values(), key=lambda x: x.get('calculated_rating', 0), reverse=True)
+
+            for data in sorted_data:
+                artist = data.get('artist', 'Unknown Artist')
+                title = data.get('title', 'Unknown Title')
+                rating = data.get('rating', 0)
+                good_votes = data.get('good_votes', 0)
+                bad_votes = data.get('bad_votes', 0)
+                skips = data.get('skips', 0)
+                calculated_rating = data.get('calculated_rating', 0)
+            
+                print(Fore.YELLOW + f"{artist} - {title}")
+                print(Fore.CYAN + f"Rating: {rating}, Good Votes: {good_votes}, Bad Votes: {bad_votes}, Skips: {skips}")
+                print(Fore.GREEN + f"Calculated Rating: {calculated_rating}")
+                print(Style.RESET_ALL)
+
+        global calculated_ratings
+        calculated_ratings = merged
+
+
+UPSERT_COLUMNS = "(artist, title, calculated_rating, rating, good_votes, bad_votes, skips)"
+
+def _upsert_update():
+    return storage.dialect().on_conflict(["artist", "title"], {
+        "calculated_rating": "replace",
+        "rating": "replace",
+        "good_votes": "replace",
+        "bad_votes": "replace",
+        "skips": "replace",
+        "modifiedon": "now",
+    })
+
+def _upsert_chunked(dbh, sth, rows, chunk_size):
+    """Upsert rows with multi-row executemany statements, committing once per chunk."""
+    upsert_sql = f"INSERT INTO apollo_calculated_rating {UPSERT_COLUMNS} VALUES (%s, %s, %s, %s, %s, %s, %s) {_upsert_update()}"
+    for start in range(0, len(rows), chunk_size):
+        sth.executemany(upsert_sql, rows[start:start + chunk_size])
+        dbh.commit()
+
+def _upsert_bulk(dbh, sth, rows, chunk_size):
+    """Load rows into a temp table, then merge them with one INSERT ... SELECT ... ON DUPLICATE KEY UPDATE."""
+    if not storage.dialect().supports_bulk_merge:
+        # SQLite writes locally, the chunked upsert is already the fast path
+        _upsert_chunked(dbh, sth, rows, chunk_size)
+        return
+    sth.execute("DROP TEMPORARY TABLE IF EXISTS apollo_calculated_rating_load")
+    sth.execute("CREATE TEMPORARY TABLE apollo_calculated_rating_load LIKE apollo_calculated_rating")
+    load_sql = f"INSERT INTO apollo_calculated_rating_load {UPSERT_COLUMNS} VALUES (%s, %s, %s, %s, %s, %s, %s)"
+    for start in range(0, len(rows), chunk_size):
+        sth.executemany(load_sql, rows[start:start + chunk_size])
+    sth.execute(
+        f"INSERT INTO apollo_calculated_rating {UPSERT_COLUMNS} "
+        f"SELECT artist, title, calculated_rating, rating, good_votes, bad_votes, skips "
+        f"FROM apollo_calculated_rating_load {_upsert_update()}"
+    )
+    dbh.commit()
+    sth.execute("DROP TEMPORARY TABLE apollo_calculated_rating_load")
+
+def store_calculated_ratings(verbose=False, bulk=False):
+    """
+    Create/update apollo_calculated_rating table with upserted calculated ratings.
+    After an incremental calculation only the changed rows are written, then the
+    watermarks are advanced so the next run starts from here.
+    Rows are sent in multi-row chunks of RATINGS_UPSERT_CHUNK_SIZE, each committed on its own;
+    with bulk they are loaded into a temp table and merged in one statement.
+    """
+    global calculated_ratings, _dirty_keys
 
     if calculated_ratings is None:
-        calculate_all_ratings(verbose=False)
+        calculate_all_ratings(verbose=False, update_decay=True)
 
     if not calculated_ratings:
         print("No calculated ratings available to store.")
         return
 
-    dbh, sth = get_db_connection()
-    if not dbh or not sth:
-        return
+    with db.session() as (dbh, sth):
+        ensure_calculated_tables(sth)
 
-    sth.execute(
-        """
-        CREATE TABLE IF NOT EXISTS apollo_calculated_rating (
-            artist VARCHAR(255) NOT NULL,
-            title VARCHAR(255) NOT NULL,
-            calculated_rating INT NOT NULL,
-            rating DECIMAL(4,2) NOT NULL DEFAULT 2.50,
-            good_votes INT NOT NULL DEFAULT 0,
-            bad_votes INT NOT NULL DEFAULT 0,
-            skips INT NOT NULL DEFAULT 0,
-            modifiedon TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-            PRIMARY KEY (artist, title)
-        )
-        """
-    )
+        if _dirty_keys is None:
+            songs = calculated_ratings.values()
+        else:
+            songs = [calculated_ratings[key] for key in _dirty_keys if key in calculated_ratings]
+
+        rows = [
+            (data.get("artist"), data.get("title")) + _stored_values(data)
+            for data in songs
+            if data.get("artist") and data.get("title")
+        ]
+
+        chunk_size = int(settings.get_optional_setting("RATINGS_UPSERT_CHUNK_SIZE", 1000))
+        start_time = time.perf_counter()
+        if bulk:
+            _upsert_bulk(dbh, sth, rows, chunk_size)
+        else:
+            _upsert_chunked(dbh, sth, rows, chunk_size)
+        elapsed = time.perf_counter() - start_time
 
-    upsert_sql = """
-        INSERT INTO apollo_calculated_rating
-            (artist, title, calculated_rating, rating, good_votes, bad_votes, skips)
-        VALUES
-            (%s, %s, %s, %s, %s, %s, %s)
-        ON DUPLICATE KEY UPDATE
-            calculated_rating = VALUES(calculated_rating),
-            rating = VALUES(rating),
-            good_votes = VALUES(good_votes),
-            bad_votes = VALUES(bad_votes),
-            skips = VALUES(skips),
-            modifiedon = CURRENT_TIMESTAMP
-    """
-
-    upsert_count = 0
-    for data in calculated_ratings.values():
-        artist = data.get("artist")
-        title = data.get("title")
-        if not artist or not title:
-            continue
-
-        rating_val = data.get("rating")
-        try:
-            normalized_rating = float(rating_val) if rating_val is not None else 2.5
-        except (TypeError, ValueError):
-            normalized_rating = 2.5
-
-        sth.execute(
-            upsert_sql,
-            (
-                artist,
-                title,
-                int(data.get("calculated_rating", 50)),
-                normalized_rating,
-                int(data.get("good_votes", 0)),
-                int(data.get("bad_votes", 0)),
-                int(data.get("skips", 0)),
-            ),
-        )
-        upsert_count += 1
+        if _pending_watermarks:
+            for source, mark in _pending_watermarks.items():
+                if mark is None:
+                    continue
+                _set_watermark(sth, source, mark)
+
+        dbh.commit()
 
+        if _dirty_keys is None:
+            refresh_artist_summary(dbh, sth)
+        else:
+            refresh_artist_summary(dbh, sth, {row[0] for row in rows})
+        _dirty_keys = set()
+
+        rate = len(rows) / elapsed if elapsed > 0 else 0
+        print(f"Stored {len(rows)} rows in apollo_calculated_rating in {elapsed:.2f}s ({rate:.0f} rows/s)")
+
+def ensure_artist_table(sth):
+    """Create the cached per-artist summary table if it does not exist."""
+    storage.dialect().create_tables(sth, ["apollo_artist_rating"])
+
+def refresh_artist_summary(dbh, sth, artists=None, chunk_size=500):
+    """Rebuild apollo_artist_rating from apollo_calculated_rating, for all artists or only the given ones."""
+    ensure_artist_table(sth)
+    summary_sql = """
+        REPLACE INTO apollo_artist_rating (artist, song_count, total_rating, average_rating)
+        SELECT artist, COUNT(*), SUM(calculated_rating), AVG(calculated_rating)
+        FROM apollo_calculated_rating {where}
+        GROUP BY artist
+    """
+    if artists is None:
+        sth.execute("DELETE FROM apollo_artist_rating")
+        sth.execute(summary_sql.format(where=""))
+    else:
+        artists = sorted(artists)
+        for start in range(0, len(artists), chunk_size):
+            chunk = artists[start:start + chunk_size]
+            placeholders = ", ".join("%s" for _ in chunk)
+            sth.execute(summary_sql.format(where=f"WHERE artist IN ({placeholders})"), chunk)
     dbh.commit()
 
-    if verbose:
-        print(f"Stored {upsert_count} rows in apollo_calculated_rating")
+def _artist_summary(artist, songs):
+    """Build the per-artist result dict from a list of song dicts."""
+    total_rating = sum(song['calculated_rating'] for song in songs)
+    return {
+        "artist": artist,
+        "song_count": len(songs),
+        "average_rating": total_rating / len(songs),
+        "total_rating": total_rating,
+        "songs": songs,
+    }
 
 def calculate_all_artists_ratings():
     """
     Calculate and return all artists with their ratings, sorted from highest to lowest.
-    Uses data from calculate_all_ratings() function.
+    Reads the cached apollo_artist_rating summary (kept current by store_calculated_ratings);
+    when it is empty, falls back to a single pass over calculate_all_ratings().
     """
     global calculated_ratings
     if calculated_ratings is None:
+        with db.session() as (dbh, sth):
+            try:
+                sth.execute("SELECT artist, song_count, total_rating, average_rating FROM apollo_artist_rating ORDER BY average_rating DESC")
+                rows = sth.fetchall()
+            except db.DatabaseError:
+                # not stored yet
+                rows = []
+            if rows:
+                return [{
+                    'artist': row['artist'],
+                    'total_rating': int(row['total_rating']),
+                    'song_count': int(row['song_count']),
+                    'average_rating': float(row['average_rating']),
+                } for row in rows]
         calculate_all_ratings(verbose=False)
     
     if calculated_ratings is None:
@@ -306,179 +643,242 @@ def calculate_all_artists_ratings():
 def calculate_artist_rating(artist):
     """
     Calculate the rating for a given artist across all their songs.
-    This function connects to the database, retrieves all songs by the artist,
-    and calculates the average rating based on the formula.
+    Songs come from apollo_calculated_rating when the artist has been stored there,
+    otherwise from one grouped query over the artist's ratings, votes and skips.
     """
-    dbh, sth = get_db_connection()
-    
-    # Get all songs by this artist
-    sth.execute("SELECT DISTINCT title FROM apollo_rating WHERE artist=%s", (artist,))
-    songs = sth.fetchall()
-    
-    if not songs:
-        print(f"No songs found for artist: {artist}")
-        return
-    
-    total_rating = 0
-    song_count = 0
-    song_details = []
-    
-    for song in songs:
-        title = song['title']
-        
-        # votes
-        good_votes = 0
-        bad_votes = 0
-        
-        sth.execute("SELECT * FROM apollo_vote WHERE artist=%s AND title=%s", (artist, title))
-        votes = sth.fetchall()
-        
-        for vote in votes:
-            v = vote['rating']
-            if v == "good":
-                good_votes += 1
-            elif v == "bad":
-                bad_votes += 1
-        
-        # skips
-        skips = 0
-        sth.execute("SELECT COUNT(*) AS skip_count FROM apollo_skip WHERE artist=%s AND title=%s", (artist, title))
-        skip_result = sth.fetchone()
-        skips = skip_result['skip_count'] if skip_result and 'skip_count' in skip_result else 0
-        
-        # ratings
-        rating = 0
-        sth.execute("SELECT * FROM apollo_rating WHERE artist=%s AND title=%s ORDER BY modifiedon ASC", (artist, title))
-        ratings = sth.fetchall()
-        
-        if ratings:
-            for row in ratings:
-                rating = int(row['rating'])
-        
-        if rating == 0:
-            rating = 2.5
-        
-        calculated_rating = rating_formula(rating, good_votes, bad_votes, skips)
-        total_rating += calculated_rating
-        song_count += 1
-        
-        song_details.append({
-            "title": title,
-            "calculated_rating": calculated_rating,
-            "good_votes": good_votes,
-            "bad_votes": bad_votes,
-            "skips": skips,
-            "rating": rating
-        })
-    
-    if song_count > 0:
-        avg_rating = total_rating / song_count
-        
-        json_data = {
-            "artist": artist,
-            "song_count": song_count,
-            "average_rating": avg_rating,
-            "total_rating": total_rating,
-            "songs": song_details
+    with db.session() as (dbh, sth):
+        try:
+            sth.execute(
+                "SELECT artist, title, rating, good_votes, bad_votes, skips FROM apollo_calculated_rating WHERE artist=%s",
+                (artist,),
+            )
+            rows = sth.fetchall()
+        except db.DatabaseError:
+            # not stored yet
+            rows = []
+        if not rows:
+            sth.execute(aggregate_ratings_sql("WHERE artist=%s"), (artist, artist, artist))
+            rows = sth.fetchall()
+
+        if not rows:
+            print(f"No songs found for artist: {artist}")
+            return
+
+        decayed = _decayed_counts(dbh, sth, artist=artist)
+        song_details = []
+        for row in rows:
+            data = _song_from_aggregate(row, decayed)
+            song_details.append({
+                "title": data["title"],
+                "calculated_rating": data["calculated_rating"],
+                "good_votes": data["good_votes"],
+                "bad_votes": data["bad_votes"],
+                "skips": data["skips"],
+                "rating": data["rating"] if data["rating"] is not None else 2.5,
+            })
+
+        return _artist_summary(rows[0]["artist"], song_details)
+
+
+def _query_ratings_version(sth):
+    """Build the ratings version string from the event tables and the formula settings."""
+    sth.execute(
+        """
+        SELECT
+            (SELECT MAX(modifiedon) FROM apollo_rating) AS rating_mark,
+            (SELECT COUNT(*) FROM apollo_rating) AS rating_count,
+            (SELECT MAX(id) FROM apollo_vote) AS vote_mark,
+            (SELECT MAX(id) FROM apollo_skip) AS skip_mark
+        """
+    )
+    row = sth.fetchone() or {}
+    threshold = settings.get_setting('RATING_THRESHOLD', 45)
+    vote_strength = settings.get_setting("VOTE_STRENGTH", 5)
+    skip_strength = settings.get_setting("SKIP_STRENGTH", 1)
+    version = (
+        f"{row.get('rating_mark')}|{row.get('rating_count')}|{row.get('vote_mark')}|{row.get('skip_mark')}"
+        f"|{threshold}|{vote_strength}|{skip_strength}"
+    )
+    half_life = _decay_half_life_seconds()
+    if half_life:
+        # decayed ratings drift with time alone; let them count as changed once a day
+        version += f"|decay={half_life:.0f}@{int(time.time() // 86400)}"
+    return version
+
+def get_ratings_version():
+    """
+    Return a cheap fingerprint of the ratings data used during playlist creation.
+    It changes whenever a rating, vote or skip is recorded, or the threshold or formula
+    settings change, so publish can tell whether previously resolved playlists are still valid.
+    A snapshot younger than RATINGS_SNAPSHOT_TTL seconds is trusted, as in load_rating_lookup,
+    and its version is returned without touching MySQL. When MySQL is unreachable, the
+    version of an older snapshot is returned instead.
+    """
+    current = snapshot.read_snapshot()
+    if current is not None and current.age() < _snapshot_ttl():
+        return current.version
+    try:
+        with db.session() as (dbh, sth):
+            return _query_ratings_version(sth)
+    except db.DatabaseError:
+        return current.version if current else None
+
+def _snapshot_ttl():
+    return float(settings.get_optional_setting("RATINGS_SNAPSHOT_TTL", 3600))
+
+# Normalized 'artist - title' key -> calculated rating, used by get_calculated_rating
+_rating_lookup = None
+_refresh_thread = None
+
+def refresh_ratings_snapshot(current=None, verbose=False):
+    """
+    Bring the local ratings snapshot up to date and return its rating map.
+    If the ratings version still matches the snapshot, it is only marked as fresh;
+    otherwise ratings are recalculated (incrementally when watermarks exist) and rewritten.
+    """
+    with db.session() as (dbh, sth):
+        version = _query_ratings_version(sth)
+
+    if current is not None and current.version == version:
+        snapshot.touch_snapshot()
+        if verbose:
+            print(Fore.CYAN + f"Ratings snapshot is current ({len(current.ratings)} songs)" + Style.RESET_ALL)
+        return current.ratings
+
+    calculate_all_ratings(verbose=False)
+    lookup = {
+        tracks_lib.normalize_key(artist, title): data.get('calculated_rating', 50)
+        for (artist, title), data in calculated_ratings.items()
+    }
+    snapshot.write_snapshot(lookup, version)
+    if verbose:
+        print(Fore.GREEN + f"Ratings snapshot written ({len(lookup)} songs): {snapshot.get_snapshot_path()}" + Style.RESET_ALL)
+    return lookup
+
+def _refresh_in_background(current):
+    try:
+        refresh_ratings_snapshot(current)
+    except db.DatabaseError:
+        pass
+
+def load_rating_lookup(fresh=False):
+    """
+    Return the rating map used during playlist creation.
+    A snapshot younger than RATINGS_SNAPSHOT_TTL seconds is used without touching MySQL.
+    An older one is checked against the ratings version and refreshed if needed, either
+    before continuing or, with RATINGS_SNAPSHOT_REFRESH: background, while the stale copy
+    is used for this run. fresh always checks the version and refreshes before returning.
+    If MySQL is unreachable the stale snapshot is used as is.
+    """
+    global _refresh_thread
+    if calculated_ratings is not None:
+        return {
+            tracks_lib.normalize_key(artist, title): data.get('calculated_rating', 50)
+            for (artist, title), data in calculated_ratings.items()
         }
-        
-        return json_data
-    else:
-        return None
 
+    current = snapshot.read_snapshot()
+    if current is not None and current.age() < _snapshot_ttl() and not fresh:
+        return current.ratings
+
+    if current is not None and not fresh and settings.get_optional_setting("RATINGS_SNAPSHOT_REFRESH", "sync") == "background":
+        # not a daemon thread, so the refresh finishes before the process exits
+        _refresh_thread = threading.Thread(target=_refresh_in_background, args=(current,))
+        _refresh_thread.start()
+        return current.ratings
+
+    try:
+        return refresh_ratings_snapshot(current)
+    except db.DatabaseError:
+        if current is not None:
+            print(Fore.YELLOW + f"Database unavailable, using ratings snapshot from {current.age() / 3600:.1f} hours ago" + Style.RESET_ALL)
+            return current.ratings
+        print(Fore.YELLOW + "Database unavailable and no ratings snapshot, every song is treated as unrated" + Style.RESET_ALL)
+        return {}
 
 def get_calculated_rating(artist, title):
     """Called for each line during playlist creation to get the calculated rating."""
-    global calculated_ratings
-    if calculated_ratings is None:
-        calculate_all_ratings(verbose=False)
-    
-    if calculated_ratings is not None:
-        key = (artist, title)
-        data = calculated_ratings.get(key)
-        if data:
-            return data.get('calculated_rating', 50)
-    return 50
+    global _rating_lookup
+    if _rating_lookup is None:
+        _rating_lookup = load_rating_lookup()
+    return _rating_lookup.get(tracks_lib.normalize_key(artist, title), 50)
 
 # The 3 print functions below are used to print the ratings, skips, and votes from the database.
 # They are primarily used for debugging and manual inspection of the ratings data.
 def print_skips():
     """Print all skips from the database."""
-    dbh, sth = get_db_connection()
-
-    sth.execute("SELECT * FROM apollo_skip")
-    ratings = sth.fetchall()
-    for rating in ratings:
-        id = rating['id']
-        artist = rating['artist']
-        title = rating['title']
-        album = rating['album']
-        rating = rating['rating']
+    with db.session() as (dbh, sth):
+        sth.execute("SELECT * FROM apollo_skip")
+        ratings = sth.fetchall()
+        for rating in ratings:
+            id = rating['id']
+            artist = rating['artist']
+            title = rating['title']
+            album = rating['album']
+            rating = rating['rating']
         
 
-        # print id in yellow
-        print(Fore.CYAN + f"{id}")
-        print(Fore.YELLOW + f"  {artist} - {title}")
-        print(Fore.WHITE + f"  Album: {album}")
+            # print id in yellow
+            print(Fore.CYAN + f"{id}")
+            print(Fore.YELLOW + f"  {artist} - {title}")
+            print(Fore.WHITE + f"  Album: {album}")
 
-        if(rating == "good"):
-            print(Fore.GREEN + f"  {rating}")
-        elif(rating == "bad"):
-            print(Fore.RED + f"  {rating}")
-        else:
-            print(Fore.CYAN + f"  {rating}")
+            if(rating == "good"):
+                print(Fore.GREEN + f"  {rating}")
+            elif(rating == "bad"):
+                print(Fore.RED + f"  {rating}")
+            else:
+                print(Fore.CYAN + f"  {rating}")
             
         
-        print(Style.RESET_ALL)
+            print(Style.RESET_ALL)
             
-    return
+        return
 
 def print_votes():
     """Print all votes from the database."""
-    dbh, sth = get_db_connection()
-
-    sth.execute("SELECT * FROM apollo_vote")
-    ratings = sth.fetchall()
-    for rating in ratings:
-        id = rating['id']
-        artist = rating['artist']
-        title = rating['title']
-        album = rating['album']
-        rating = rating['rating']
+    with db.session() as (dbh, sth):
+        sth.execute("SELECT * FROM apollo_vote")
+        ratings = sth.fetchall()
+        for rating in ratings:
+            id = rating['id']
+            artist = rating['artist']
+            title = rating['title']
+            album = rating['album']
+            rating = rating['rating']
         
 
-        # print id in yellow
-        print(Fore.CYAN + f"{id}")
-        print(Fore.YELLOW + f"  {artist} - {title}")
-        print(Fore.WHITE + f"  Album: {album}")
+            # print id in yellow
+            print(Fore.CYAN + f"{id}")
+            print(Fore.YELLOW + f"  {artist} - {title}")
+            print(Fore.WHITE + f"  Album: {album}")
 
-        if(rating == "good"):
-            print(Fore.GREEN + f"  {rating}")
-        elif(rating == "bad"):
-            print(Fore.RED + f"  {rating}")
-        else:
-            print(Fore.CYAN + f"  {rating}")
+            if(rating == "good"):
+                print(Fore.GREEN + f"  {rating}")
+            elif(rating == "bad"):
+                print(Fore.RED + f"  {rating}")
+            else:
+                print(Fore.CYAN + f"  {rating}")
             
         
-        print(Style.RESET_ALL)
+            print(Style.RESET_ALL)
 
 def print_ratings():
     """Print all ratings from the database."""
-    dbh, sth = get_db_connection()
-
-    sth.execute("SELECT * FROM apollo_rating")
-    rows = sth.fetchall()
-    for row in rows:
-        id = row['id'] if 'id' in row else None
-        artist = row['artist']
-        title = row['title']
-        album = row.get('album', '') if 'album' in row else ''
-        rating = row['rating']
-
-        if id is not None:
-            print(Fore.CYAN + f"{id}")
-        print(Fore.YELLOW + f"  {artist} - {title}")
-        if album:
-            print(Fore.WHITE + f"  Album: {album}")
-        print(Fore.GREEN + f"  Rating: {rating}")
-        print(Style.RESET_ALL)
\ No newline at end of file
+    with db.session() as (dbh, sth):
+        sth.execute("SELECT * FROM apollo_rating")
+        rows = sth.fetchall()
+        for row in rows:
+            id = row['id'] if 'id' in row else None
+            artist = row['artist']
+            title = row['title']
+            album = row.get('album', '') if 'album' in row else ''
+            rating = row['rating']
+
+            if id is not None:
+                print(Fore.CYAN + f"{id}")
+            print(Fore.YELLOW + f"  {artist} - {title}")
+            if album:
+                print(Fore.WHITE + f"  Album: {album}")
+            print(Fore.GREEN + f"  Rating: {rating}")
+            print(Style.RESET_ALL)
\ No newline at end of file
@@ -12,8 +12,10 @@ import unicodedata
 import re
 import json
 import subprocess
+from apollo_lib import catalog
 from apollo_lib import estools
 from apollo_lib import settings
+from apollo_lib import tracks
 
 def remove_emojis(string):
     """Strip emoji characters from a string."""
@@ -60,7 +62,10 @@ def ffprobe_bitrate(file_path):
     return duration, bitrate
 
 def scan_music_folder_into_es():
-    """Scan MUSIC_FOLDER and upsert audio file metadata into Elasticsearch."""
+    """Scan MUSIC_FOLDER and upsert audio file metadata into Elasticsearch.
+
+    Returns the normalized artists of newly indexed files.
+    """
     playlist_folder,apollo_folder, ai_folder, m3u_folder, missing_folder, sorted_folder = settings.get_apollo_folders()
 
     input_directory = settings.get_setting("MUSIC_FOLDER")
@@ -103,6 +108,7 @@ def scan_music_folder_into_es():
 
     count = 0
     new_songs = 0
+    new_artists = set()
 
     doc = None
     try:
@@ -267,18 +273,26 @@ def scan_music_folder_into_es():
                     # insert the document into Elasticsearch using upsert and file path as the ID
                     es.update(index=es_index, id=url, body=update_body)
                     new_songs += 1
+                    for name in (artist, albumartist):
+                        if name:
+                            new_artists.add(tracks.normalize_text(name))
                     
     
         
         print(f"Total songs: {count}")
         print(f"New songs: {new_songs}")
 
-        prune_missing_files_from_es(input_directory, scanned_files, es, es_index)
+        pruned = prune_missing_files_from_es(input_directory, scanned_files, es, es_index)
+        if new_songs or pruned:
+            generation = estools.bump_index_generation()
+            print(Fore.CYAN + f"Index generation: {generation}" + Style.RESET_ALL)
 
     except Exception as e:
         print(f"An error occurred: {e}")
         print(f"Document: {doc}")
 
+    return new_artists
+
 
 def prune_missing_files_from_es(input_directory, scanned_files, es, es_index):
     """Delete ES docs for files no longer present on disk and write jsonl."""
@@ -336,9 +350,13 @@ def prune_missing_files_from_es(input_directory, scanned_files, es, es_index):
     output_path = os.path.join(ai_folder, "es.jsonl")
     with open(output_path, "w") as f:
         f.write(output)
+
+    # rebuild the searchable catalog from the export we just wrote
+    catalog.rebuild_from_jsonl()
     
     print(Fore.YELLOW + f"\nFound: {found}")
     print(Fore.RED + f"Missing: {missing}")
 
 
-    print(Fore.BLUE + f"Output written to: {output_path}" + Style.RESET_ALL)
\ No newline at end of file
+    print(Fore.BLUE + f"Output written to: {output_path}" + Style.RESET_ALL)
+    return missing
\ No newline at end of file
@@ -43,6 +43,11 @@ def get_setting(key, default=None):
         
     return settings.get(key, default)
 
+def get_optional_setting(key, default=None):
+    """Return a setting by key, or default if it is not configured."""
+    settings = load_settings()
+    return settings.get(key, default)
+
 def save_settings(settings_dict):
     """Persist settings to ~/.config/apollo/settings.yml."""
     # Create config directory if it doesn't exist
@@ -0,0 +1,72 @@
+import os
+import sqlite3
+import time
+from apollo_lib import settings
+
+# A local copy of the calculated rating map, so playlist creation can start without MySQL.
+# Ratings are keyed by tracks.normalize_key(artist, title); the meta table holds the
+# ratings version the snapshot was built from and when it was last confirmed current.
+
+def get_snapshot_path():
+    """Return the path of the ratings snapshot database."""
+    playlist_folder, apollo_folder, ai_folder, m3u_folder, missing_folder, sorted_folder = settings.get_apollo_folders()
+    return os.path.join(apollo_folder, "ratings-snapshot.sqlite")
+
+class Snapshot:
+    """A loaded ratings snapshot: the rating map plus its version and save time."""
+
+    def __init__(self, ratings, version, saved_at):
+        self.ratings = ratings
+        self.version = version
+        self.saved_at = saved_at
+
+    def age(self):
+        """Seconds since the snapshot was written or last confirmed current."""
+        return time.time() - self.saved_at
+
+def read_snapshot(path=None):
+    """Load the snapshot, or return None if it is missing or unreadable."""
+    path = path or get_snapshot_path()
+    if not os.path.exists(path):
+        return None
+    try:
+        db = sqlite3.connect(path)
+        try:
+            meta = dict(db.execute("SELECT name, value FROM meta"))
+            ratings = dict(db.execute("SELECT key, calculated_rating FROM ratings"))
+        finally:
+            db.close()
+        return Snapshot(ratings, meta.get("version"), float(meta.get("saved_at") or 0))
+    except (sqlite3.Error, ValueError) as e:
+        print(f"Warning: Could not read ratings snapshot {path}: {e}")
+        return None
+
+def write_snapshot(ratings, version, path=None):
+    """Write a new snapshot into a temp file and swap it in, so readers never see a partial file."""
+    path = path or get_snapshot_path()
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    db = sqlite3.connect(tmp_path)
+    try:
+        db.execute("CREATE TABLE ratings (key TEXT PRIMARY KEY, calculated_rating INTEGER) WITHOUT ROWID")
+        db.execute("CREATE TABLE meta (name TEXT PRIMARY KEY, value TEXT)")
+        db.executemany("INSERT OR REPLACE INTO ratings (key, calculated_rating) VALUES (?, ?)", ratings.items())
+        db.executemany(
+            "INSERT INTO meta (name, value) VALUES (?, ?)",
+            [("version", version), ("saved_at", str(time.time()))],
+        )
+        db.commit()
+    finally:
+        db.close()
+    os.replace(tmp_path, path)
+
+def touch_snapshot(path=None):
+    """Mark the snapshot as confirmed current without rewriting the ratings."""
+    path = path or get_snapshot_path()
+    db = sqlite3.connect(path)
+    try:
+        db.execute("UPDATE meta SET value = ? WHERE name = 'saved_at'", (str(time.time()),))
+        db.commit()
+    finally:
+        db.close()
@@ -0,0 +1,75 @@
+import hashlib
+import json
+import os
+import stat
+import tempfile
+from apollo_lib import settings
+
+# Small helpers for the JSON state files Apollo keeps under PLAYLIST_SOURCE_FOLDER/.apollo
+
+# Read once at import: os.umask can only be read by setting it, which is not thread-safe
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+def get_state_path(name):
+    """Return the path of a named JSON state file inside the .apollo folder."""
+    playlist_folder, apollo_folder, ai_folder, m3u_folder, missing_folder, sorted_folder = settings.get_apollo_folders()
+    return os.path.join(apollo_folder, f"{name}.json")
+
+def load_state(name, default=None):
+    """Load a named JSON state file, returning default when missing or unreadable."""
+    path = get_state_path(name)
+    if not os.path.exists(path):
+        return {} if default is None else default
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (json.JSONDecodeError, IOError) as e:
+        print(f"Warning: Could not load state from {path}: {e}")
+        return {} if default is None else default
+
+def save_state(name, data):
+    """Atomically persist a named JSON state file."""
+    content = json.dumps(data, ensure_ascii=False, indent=1, sort_keys=True)
+    write_atomic(get_state_path(name), content.encode("utf-8"))
+
+def content_hash(data):
+    """Return a sha256 hex digest for str or bytes content."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+def write_atomic(path, data):
+    """
+    Write bytes to path via a temp file in the same folder plus rename.
+    The file keeps the mode of the one it replaces, or gets the usual 0666 minus umask when new
+    (mkstemp creates 0600, which players running as another user could not read).
+    """
+    folder = os.path.dirname(os.path.abspath(path))
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        mode = 0o666 & ~_UMASK
+    fd, tmp_path = tempfile.mkstemp(prefix=".apollo-", suffix=".tmp", dir=folder)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def write_if_changed(path, content, encoding="utf-8"):
+    """Atomically write content only when the bytes on disk differ. Returns True if written."""
+    data = content.encode(encoding) if isinstance(content, str) else content
+    if os.path.exists(path):
+        try:
+            with open(path, "rb") as f:
+                if f.read() == data:
+                    return False
+        except IOError:
+            pass
+    write_atomic(path, data)
+    return True
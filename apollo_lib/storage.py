@@ -0,0 +1,298 @@
+import time
+from contextlib import contextmanager
+from colorama import Fore, Style
+from apollo_lib import db
+
+# The ratings schema and the SQL that differs between the MySQL and SQLite backends.
+# ratings.py writes portable SQL where it can and asks dialect() for the rest.
+
+# Column types are either a key of the dialect's TYPES or a literal type both databases accept
+SCHEMA = {
+    "apollo_rating": {
+        "columns": [
+            ("id", "id"), ("artist", "name"), ("title", "name"), ("album", "optional_name"),
+            ("rating", "DECIMAL(4,2)"), ("modifiedon", "timestamp"),
+        ],
+        "primary_key": ["id"],
+        "indexes": {"idx_artist_title": ["artist", "title"], "idx_modifiedon": ["modifiedon"]},
+    },
+    "apollo_vote": {
+        "columns": [
+            ("id", "id"), ("artist", "name"), ("title", "name"), ("album", "optional_name"),
+            ("rating", "VARCHAR(16)"), ("modifiedon", "timestamp"),
+        ],
+        "primary_key": ["id"],
+        "indexes": {"idx_artist_title": ["artist", "title"]},
+    },
+    "apollo_skip": {
+        "columns": [
+            ("id", "id"), ("artist", "name"), ("title", "name"), ("album", "optional_name"),
+            ("rating", "VARCHAR(16)"), ("modifiedon", "timestamp"),
+        ],
+        "primary_key": ["id"],
+        "indexes": {"idx_artist_title": ["artist", "title"]},
+    },
+    "apollo_calculated_rating": {
+        "columns": [
+            ("artist", "name"), ("title", "name"), ("calculated_rating", "INT NOT NULL"),
+            ("rating", "DECIMAL(4,2) NOT NULL DEFAULT 2.50"), ("good_votes", "INT NOT NULL DEFAULT 0"),
+            ("bad_votes", "INT NOT NULL DEFAULT 0"), ("skips", "INT NOT NULL DEFAULT 0"),
+            ("modifiedon", "timestamp"),
+        ],
+        "primary_key": ["artist", "title"],
+        "indexes": {},
+    },
+    "apollo_rating_watermark": {
+        "columns": [("source", "VARCHAR(32) NOT NULL"), ("mark", "VARCHAR(64) NOT NULL"), ("modifiedon", "timestamp")],
+        "primary_key": ["source"],
+        "indexes": {},
+    },
+    "apollo_decayed_rating": {
+        "columns": [
+            ("artist", "name"), ("title", "name"), ("good_acc", "DOUBLE NOT NULL DEFAULT 0"),
+            ("bad_acc", "DOUBLE NOT NULL DEFAULT 0"), ("skip_acc", "DOUBLE NOT NULL DEFAULT 0"),
+        ],
+        "primary_key": ["artist", "title"],
+        "indexes": {},
+    },
+    "apollo_artist_rating": {
+        "columns": [
+            ("artist", "name"), ("song_count", "INT NOT NULL DEFAULT 0"), ("total_rating", "INT NOT NULL DEFAULT 0"),
+            ("average_rating", "DECIMAL(8,3) NOT NULL DEFAULT 0"), ("modifiedon", "timestamp"),
+        ],
+        "primary_key": ["artist"],
+        "indexes": {"idx_average_rating": ["average_rating"]},
+    },
+}
+
+EVENT_TABLES = ["apollo_rating", "apollo_vote", "apollo_skip"]
+
+class MySQLDialect:
+    """SQL for MySQL/MariaDB."""
+
+    name = "mysql"
+    supports_bulk_merge = True
+    TYPES = {
+        "id": "INT NOT NULL AUTO_INCREMENT",
+        "name": "VARCHAR(255) NOT NULL",
+        "optional_name": "VARCHAR(255)",
+        "timestamp": "TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP",
+    }
+
+    def create_table_sql(self, table):
+        """Return the statements that create table and its indexes if missing."""
+        spec = SCHEMA[table]
+        parts = [f"{column} {self.TYPES.get(kind, kind)}" for column, kind in spec["columns"]]
+        parts.append(f"PRIMARY KEY ({', '.join(spec['primary_key'])})")
+        for index, columns in spec["indexes"].items():
+            parts.append(f"KEY {index} ({', '.join(columns)})")
+        return [f"CREATE TABLE IF NOT EXISTS {table} (\n    " + ",\n    ".join(parts) + "\n)"]
+
+    def create_tables(self, sth, tables):
+        """Create the given tables if they do not exist."""
+        for table in tables:
+            for sql in self.create_table_sql(table):
+                sth.execute(sql)
+
+    def on_conflict(self, keys, update):
+        """
+        Return the clause that turns an INSERT into an upsert on the keys.
+        update maps columns to 'replace' (take the new value), 'add' (add it to the stored one)
+        or 'now' (set CURRENT_TIMESTAMP).
+        """
+        sets = []
+        for column, mode in update.items():
+            if mode == "add":
+                sets.append(f"{column} = {column} + VALUES({column})")
+            elif mode == "now":
+                sets.append(f"{column} = CURRENT_TIMESTAMP")
+            else:
+                sets.append(f"{column} = VALUES({column})")
+        return "ON DUPLICATE KEY UPDATE " + ", ".join(sets)
+
+    @contextmanager
+    def exclusive(self, dbh, sth, name, timeout=60):
+        """
+        Run the block as the only writer of name across processes, committing at the end.
+        MySQL holds a named lock (GET_LOCK) for the block; the caller's open transaction is committed first.
+        """
+        dbh.commit()
+        sth.execute("SELECT GET_LOCK(%s, %s) AS acquired", (name, timeout))
+        if not (sth.fetchone() or {}).get("acquired"):
+            raise RuntimeError(f"Timed out waiting for database lock {name}")
+        try:
+            yield
+            dbh.commit()
+        except BaseException:
+            dbh.rollback()
+            raise
+        finally:
+            sth.execute("SELECT RELEASE_LOCK(%s) AS released", (name,))
+            sth.fetchall()
+
+    def keys_in(self, count):
+        """Return a WHERE condition matching count (artist, title) pairs."""
+        return "(artist, title) IN (" + ", ".join("(%s, %s)" for _ in range(count)) + ")"
+
+    def aggregate_ratings_sql(self, where=""):
+        """The grouped per-song query; see ratings.aggregate_ratings_sql."""
+        return f"""
+            SELECT artist, title,
+                   SUBSTRING_INDEX(GROUP_CONCAT(rating_value ORDER BY rated_on DESC SEPARATOR '|'), '|', 1) AS rating,
+                   COALESCE(SUM(vote = 'good'), 0) AS good_votes,
+                   COALESCE(SUM(vote = 'bad'), 0) AS bad_votes,
+                   COALESCE(SUM(is_skip), 0) AS skips
+            FROM (
+                SELECT artist, title, CAST(rating AS CHAR) AS rating_value, modifiedon AS rated_on, NULL AS vote, 0 AS is_skip
+                FROM apollo_rating {where}
+                UNION ALL
+                SELECT artist, title, NULL, NULL, rating, 0 FROM apollo_vote {where}
+                UNION ALL
+                SELECT artist, title, NULL, NULL, NULL, 1 FROM apollo_skip {where}
+            ) events
+            GROUP BY artist, title
+        """
+
+class SQLiteDialect(MySQLDialect):
+    """SQL for the embedded SQLite backend. Names compare case-insensitively, as with MySQL's default collation."""
+
+    name = "sqlite"
+    supports_bulk_merge = False
+    TYPES = {
+        "id": "INTEGER NOT NULL",
+        "name": "TEXT NOT NULL COLLATE NOCASE",
+        "optional_name": "TEXT COLLATE NOCASE",
+        "timestamp": "TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP",
+    }
+
+    def create_table_sql(self, table):
+        spec = SCHEMA[table]
+        parts = [f"{column} {self.TYPES.get(kind, kind)}" for column, kind in spec["columns"]]
+        # an INTEGER primary key is the rowid, so ids are assigned like AUTO_INCREMENT
+        parts.append(f"PRIMARY KEY ({', '.join(spec['primary_key'])})")
+        statements = [f"CREATE TABLE IF NOT EXISTS {table} (\n    " + ",\n    ".join(parts) + "\n)"]
+        for index, columns in spec["indexes"].items():
+            statements.append(f"CREATE INDEX IF NOT EXISTS {table}_{index} ON {table} ({', '.join(columns)})")
+        # SQLite has no ON UPDATE CURRENT_TIMESTAMP; a trigger bumps the timestamp on in-place updates
+        # that do not set it themselves, so incremental runs see rows changed by UPDATE
+        for column, kind in spec["columns"]:
+            if kind == "timestamp":
+                statements.append(
+                    f"CREATE TRIGGER IF NOT EXISTS {table}_{column}_on_update AFTER UPDATE ON {table} "
+                    f"FOR EACH ROW WHEN NEW.{column} IS OLD.{column} "
+                    f"BEGIN UPDATE {table} SET {column} = CURRENT_TIMESTAMP WHERE rowid = NEW.rowid; END"
+                )
+        return statements
+
+    def on_conflict(self, keys, update):
+        sets = []
+        for column, mode in update.items():
+            if mode == "add":
+                sets.append(f"{column} = {column} + excluded.{column}")
+            elif mode == "now":
+                sets.append(f"{column} = CURRENT_TIMESTAMP")
+            else:
+                sets.append(f"{column} = excluded.{column}")
+        return f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET " + ", ".join(sets)
+
+    @contextmanager
+    def exclusive(self, dbh, sth, name, timeout=60):
+        # BEGIN IMMEDIATE takes the database write lock up front, so reads in the block
+        # cannot go stale before the writes; the connection's busy timeout does the waiting
+        dbh.commit()
+        sth.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+            dbh.commit()
+        except BaseException:
+            dbh.rollback()
+            raise
+
+    def keys_in(self, count):
+        return "(artist, title) IN (VALUES " + ", ".join("(%s, %s)" for _ in range(count)) + ")"
+
+    def aggregate_ratings_sql(self, where=""):
+        # With a single MAX() aggregate, SQLite takes bare columns from the row holding the maximum,
+        # so rating_value is the latest rating (NULL when the song only has votes or skips).
+        return f"""
+            SELECT artist, title,
+                   rating_value AS rating,
+                   MAX(rated_on) AS rated_on,
+                   COALESCE(SUM(vote = 'good'), 0) AS good_votes,
+                   COALESCE(SUM(vote = 'bad'), 0) AS bad_votes,
+                   COALESCE(SUM(is_skip), 0) AS skips
+            FROM (
+                SELECT artist, title, CAST(rating AS TEXT) AS rating_value, modifiedon AS rated_on, NULL AS vote, 0 AS is_skip
+                FROM apollo_rating {where}
+                UNION ALL
+                SELECT artist, title, NULL, NULL, rating, 0 FROM apollo_vote {where}
+                UNION ALL
+                SELECT artist, title, NULL, NULL, NULL, 1 FROM apollo_skip {where}
+            ) events
+            GROUP BY artist, title
+        """
+
+DIALECTS = {"mysql": MySQLDialect(), "sqlite": SQLiteDialect()}
+
+def dialect(backend=None):
+    """Return the SQL dialect of the given or active backend."""
+    return DIALECTS[backend or db.backend_name()]
+
+def _table_exists(sth, table):
+    try:
+        sth.execute(f"SELECT 1 FROM {table} LIMIT 1")
+        sth.fetchall()
+        return True
+    except db.DatabaseError:
+        return False
+
+def migrate(source, target, tables=None, chunk_size=5000):
+    """
+    Copy the ratings tables from one backend to another in bulk.
+    Each target table is created if needed and its rows replaced by the source's.
+    Tables missing from the source are skipped; columns are matched by name.
+    """
+    if source == target:
+        raise ValueError("Source and target backend are the same")
+    tables = tables or list(SCHEMA)
+    totals = {}
+    with db.session(source) as (src_dbh, src_sth), db.session(target) as (dst_dbh, dst_sth):
+        dialect(target).create_tables(dst_sth, tables)
+        dst_dbh.commit()
+        known = {table: [column for column, _ in SCHEMA[table]["columns"]] for table in tables}
+
+        for table in tables:
+            if not _table_exists(src_sth, table):
+                print(Fore.YELLOW + f"{table}: not in {source}, skipped" + Style.RESET_ALL)
+                continue
+
+            start = time.perf_counter()
+            dst_sth.execute(f"DELETE FROM {table}")
+            stream = db.stream_cursor(src_dbh)
+            copied = 0
+            try:
+                stream.execute(f"SELECT * FROM {table}")
+                columns = None
+                batch = []
+                for row in stream:
+                    if columns is None:
+                        columns = [column for column in known[table] if column in row]
+                        placeholders = ", ".join("%s" for _ in columns)
+                        insert_sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+                    batch.append(tuple(row[column] for column in columns))
+                    if len(batch) >= chunk_size:
+                        dst_sth.executemany(insert_sql, batch)
+                        copied += len(batch)
+                        batch = []
+                if batch:
+                    dst_sth.executemany(insert_sql, batch)
+                    copied += len(batch)
+            finally:
+                stream.close()
+            dst_dbh.commit()
+
+            elapsed = time.perf_counter() - start
+            rate = copied / elapsed if elapsed > 0 else 0
+            print(Fore.GREEN + f"{table}: {copied} rows in {elapsed:.2f}s ({rate:.0f} rows/s)" + Style.RESET_ALL)
+            totals[table] = copied
+    return totals
@@ -0,0 +1,122 @@
+import os
+from colorama import Fore, Style
+from apollo_lib import navidrome
+from apollo_lib import settings
+from apollo_lib import state
+
+# Publish targets for resolved playlists.
+#
+# PLAYLIST_PUBLISHED_FOLDER is either a single folder, or a list of targets:
+#
+#   PLAYLIST_PUBLISHED_FOLDER:
+#     - path: "/mnt/user/mpd/playlists"
+#     - path: "/mnt/user/phone/Playlists"
+#       rewrite: {from: "/mnt/user/music", to: "/sdcard/Music"}
+#       relative: true            # paths relative to relative_to (default: the playlist folder, rewritten;
+#                                 # required when the folder is outside rewrite.from)
+#       relative_to: "/sdcard/Playlists"
+#       extinf: true              # add #EXTINF lines from indexed durations
+#     - path: "/mnt/windows/playlists"
+#       rewrite: {from: "/mnt/user/music", to: "D:/Music"}
+#       separator: "\\"
+#       encoding: "cp1252"
+#       crlf: true
+#     - type: navidrome           # a Navidrome playlist, patched in place via the Subsonic API
+#       music_folder: "/mnt/user/music"   # local folder Navidrome's library maps to (default: MUSIC_FOLDER)
+
+def get_publish_targets():
+    """Return the configured publish targets as a list of dicts."""
+    published = settings.get_setting("PLAYLIST_PUBLISHED_FOLDER")
+    if not published:
+        return []
+    if isinstance(published, str):
+        return [{"path": published}]
+    if isinstance(published, dict):
+        published = [published]
+    targets = [target if isinstance(target, dict) else {"path": target} for target in published]
+    for target in targets:
+        check_target(target)
+    return targets
+
+def check_target(target):
+    """Exit with a config error for targets whose paths cannot be worked out."""
+    source_prefix = (target.get("rewrite") or {}).get("from")
+    if target.get("relative") and not target.get("relative_to") and source_prefix \
+            and not target.get("path", "").startswith(source_prefix):
+        # the playlist folder has no name on the player, so relpath would mix both filesystems
+        print(Fore.RED + f"Error: publish target {target['path']} is relative with a rewrite from {source_prefix}, "
+              f"but the folder is outside it; set relative_to to the folder as the player sees it." + Style.RESET_ALL)
+        exit(1)
+
+def _rewrite_prefix(path, target):
+    rewrite = target.get("rewrite") or {}
+    source_prefix = rewrite.get("from")
+    if source_prefix and path.startswith(source_prefix):
+        path = rewrite.get("to", "") + path[len(source_prefix):]
+    return path
+
+def rewrite_url(url, target):
+    """Apply a target's prefix rewrite, relative mode and path separator to one url."""
+    url = _rewrite_prefix(url, target)
+
+    if target.get("relative"):
+        # urls are already rewritten, so the playlist folder is taken as the player sees it too
+        start = target.get("relative_to") or _rewrite_prefix(target["path"], target)
+        url = os.path.relpath(url, start).replace(os.sep, "/")
+
+    separator = target.get("separator", "/")
+    if separator != "/":
+        url = url.replace("/", separator)
+    return url
+
+def render_m3u(entries, target):
+    """Render resolved playlist entries as M3U text for a target."""
+    lines = ["#EXTM3U"]
+    for entry in entries:
+        if target.get("extinf"):
+            duration = int(round(entry.get("duration") or 0))
+            lines.append(f"#EXTINF:{duration},{entry.get('artist', '')} - {entry.get('title', '')}")
+        lines.append(rewrite_url(entry["url"], target))
+    line_ending = "\r\n" if target.get("crlf") else "\n"
+    return line_ending.join(lines)
+
+def library_path(url, target):
+    """Return url relative to the library root, which is how Navidrome stores song paths."""
+    music_folder = target.get("music_folder") or settings.get_setting("MUSIC_FOLDER")
+    return os.path.relpath(url, music_folder).replace(os.sep, "/")
+
+def publish_to_navidrome(output_filename, entries, target):
+    """Create or update the Navidrome playlist named after output_filename. Returns False on failure."""
+    name = os.path.splitext(output_filename)[0]
+    paths = [library_path(entry["url"], target) for entry in entries]
+    try:
+        added, removed, unmatched = navidrome.publish_playlist(name, paths)
+    except Exception as exc:
+        print(Fore.RED + f"  Navidrome publish failed for {name}: {exc}" + Style.RESET_ALL)
+        return False
+    if added or removed:
+        print(Fore.YELLOW + f"  Published to Navidrome playlist {name} (+{added} -{removed})" + Style.RESET_ALL)
+    else:
+        print(Fore.YELLOW + f"  Unchanged Navidrome playlist {name}" + Style.RESET_ALL)
+    if unmatched:
+        print(Fore.RED + f"  {unmatched} songs not found in Navidrome" + Style.RESET_ALL)
+    return True
+
+def publish_entries(output_filename, entries, targets):
+    """
+    Write one resolved playlist to every target, skipping files whose bytes are unchanged.
+    Returns False if any target failed, so the playlist is published again next time.
+    """
+    ok = True
+    for target in targets:
+        if target.get("type") == "navidrome":
+            ok = publish_to_navidrome(output_filename, entries, target) and ok
+            continue
+        content = render_m3u(entries, target)
+        data = content.encode(target.get("encoding", "utf-8"), errors="replace")
+        published_file = os.path.join(target["path"], output_filename)
+        if state.write_if_changed(published_file, data):
+            print(Fore.YELLOW + f"  Published to {published_file}" + Style.RESET_ALL)
+        else:
+            print(Fore.YELLOW + f"  Unchanged {published_file}" + Style.RESET_ALL)
+    return ok
@@ -0,0 +1,34 @@
+import re
+from typing import Optional, Tuple
+
+# Helpers for parsing and normalizing 'artist - title' lines
+
+def split_track(line: str) -> Optional[Tuple[str, str]]:
+    """Split an 'artist - title' line into (artist, title), or None if it is not a track line."""
+    song = line.strip()
+    if not song or song.startswith('#'):
+        return None
+
+    song = re.sub(r"\s*-\s*", " - ", song, count=1)
+    if " - " not in song:
+        return None
+
+    artist, title = [part.strip() for part in song.split(" - ", 1)]
+    if not artist or not title:
+        return None
+    return artist, title
+
+def normalize_text(value: str) -> str:
+    """Collapse whitespace and casefold a single artist or title."""
+    return re.sub(r"\s+", " ", str(value or "")).strip().casefold()
+
+def normalize_key(artist: str, title: str) -> str:
+    """Return a case and whitespace insensitive key for an artist/title pair."""
+    return f"{normalize_text(artist)} - {normalize_text(title)}"
+
+def track_key(line: str) -> Optional[str]:
+    """Return the normalized key of an 'artist - title' line, or None if it is not a track line."""
+    parts = split_track(line)
+    if parts is None:
+        return None
+    return normalize_key(*parts)
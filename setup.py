@@ -9,6 +9,11 @@ setup(
     install_requires=[
         "colorama",
     ],
+    extras_require={
+        # rating --what-if
+        "whatif": ["numpy"],
+        "test": ["pytest", "numpy"],
+    },
     entry_points={
         "console_scripts": [
             "apollo=apollo_lib.cli:main",
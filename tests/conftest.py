@@ -0,0 +1,44 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from apollo_lib import settings
+
+
+@pytest.fixture
+def apollo_settings(tmp_path, monkeypatch):
+    """Point Apollo at a throwaway settings dict rooted in tmp_path."""
+    values = {
+        "PLAYLIST_SOURCE_FOLDER": str(tmp_path / "playlists"),
+        "MUSIC_FOLDER": str(tmp_path / "music"),
+    }
+    os.makedirs(values["PLAYLIST_SOURCE_FOLDER"])
+    monkeypatch.setattr(settings, "_settings", values)
+    return values
+
+
+@pytest.fixture
+def song_catalog(monkeypatch):
+    """An in-memory catalog; call it with (url, artist, title) rows."""
+    from apollo_lib import catalog
+
+    def make(rows):
+        db = sqlite3.connect(":memory:")
+        db.execute("CREATE TABLE songs (url TEXT, artist TEXT, title TEXT)")
+        db.executemany("INSERT INTO songs VALUES (?, ?, ?)", rows)
+        monkeypatch.setattr(catalog, "connect", lambda: db)
+        return db
+
+    return make
+
+
+@pytest.fixture
+def sqlite_ratings(apollo_settings, tmp_path):
+    """Use the SQLite ratings backend in tmp_path."""
+    apollo_settings["DATABASE_BACKEND"] = "sqlite"
+    apollo_settings["DATABASE_PATH"] = str(tmp_path / "ratings.db")
+    return apollo_settings
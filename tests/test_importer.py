@@ -0,0 +1,58 @@
+import os
+
+from apollo_lib import importer
+
+
+SONGS = [
+    ("/music/Artist A/Greatest Hits/01 - Intro.mp3", "Artist A", "Intro"),
+    ("/music/Artist B/Greatest Hits/01 - Intro.mp3", "Artist B", "Intro"),
+    ("/music/Artist C/Debut/02 - Song.mp3", "Artist C", "Song"),
+]
+
+
+def test_lookup_exact_url(song_catalog):
+    song_catalog(SONGS)
+    lookup = importer.CatalogLookup()
+    lookup.prefetch(["/music/Artist B/Greatest Hits/01 - Intro.mp3"])
+    assert lookup.lookup("/music/Artist B/Greatest Hits/01 - Intro.mp3") == ("Artist B", "Intro")
+
+
+def test_lookup_uses_longest_unique_tail(song_catalog):
+    song_catalog(SONGS)
+    lookup = importer.CatalogLookup()
+    assert lookup.lookup("D:/Other/Artist A/Greatest Hits/01 - Intro.mp3") == ("Artist A", "Intro")
+    assert lookup.lookup("/phone/Debut/02 - Song.mp3") == ("Artist C", "Song")
+
+
+def test_lookup_leaves_shared_tail_unresolved(song_catalog):
+    song_catalog(SONGS)
+    lookup = importer.CatalogLookup()
+    assert lookup.lookup("/phone/Greatest Hits/01 - Intro.mp3") is None
+
+
+def test_output_names_are_unique_within_an_import():
+    used = set()
+    names = [importer._output_name(path, used) for path in
+             ["a/mix.m3u", "b/mix.m3u", "old.m3u", "old.pls", "old.xspf", "b/MIX.m3u"]]
+    assert len({name.lower() for name in names}) == len(names)
+    assert names[0] == "mix.txt"
+    assert names[3] == "old-pls.txt"
+
+
+def test_import_does_not_overwrite_its_own_output(apollo_settings, song_catalog, tmp_path):
+    song_catalog(SONGS)
+    sources = tmp_path / "in"
+    sources.mkdir()
+    (sources / "old.m3u").write_text("/music/Artist A/Greatest Hits/01 - Intro.mp3\n")
+    (sources / "old.pls").write_text("[playlist]\nFile1=/music/Artist C/Debut/02 - Song.mp3\n")
+    out = tmp_path / "out"
+    out.mkdir()
+
+    result = importer.import_playlists([str(sources / "old.m3u"), str(sources / "old.pls")],
+                                       output_folder=str(out), overwrite=True)
+
+    assert result["written"] == 2
+    assert result["renamed"] == 1
+    assert "Artist A - Intro" in (out / "old.txt").read_text()
+    assert "Artist C - Song" in (out / "old-pls.txt").read_text()
+    assert sorted(os.listdir(out)) == ["old-pls.txt", "old.txt"]
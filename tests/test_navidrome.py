@@ -0,0 +1,140 @@
+import pytest
+
+from apollo_lib import navidrome, state
+
+
+def test_playlist_diff_unchanged():
+    assert navidrome.playlist_diff(["a", "b"], ["a", "b"]) == ([], [])
+
+
+def test_playlist_diff_append_and_remove_at_end():
+    assert navidrome.playlist_diff(["a", "b", "c"], ["a", "b", "d"]) == ([2], ["d"])
+    assert navidrome.playlist_diff(["a", "b", "c"], ["a", "c"]) == ([1], [])
+
+
+def test_playlist_diff_insert_rewrites_the_tail():
+    remove, add = navidrome.playlist_diff(["a", "b", "c"], ["a", "x", "b", "c"])
+    assert (remove, add) == ([1, 2], ["x", "b", "c"])
+    kept = [song for index, song in enumerate(["a", "b", "c"]) if index not in remove]
+    assert kept + add == ["a", "x", "b", "c"]
+
+
+@pytest.fixture
+def navidrome_server(apollo_settings, monkeypatch):
+    """Fake Subsonic calls against one stored playlist; returns the list of calls made."""
+    songs = [{"id": f"id-{name}", "path": f"A/{name}.mp3"} for name in "abcdx"]
+    monkeypatch.setattr(navidrome, "get_song_map", lambda: navidrome.SongMap(songs))
+    state.save_state("navidrome-playlists", {"Mix": "pl-1"})
+    calls = []
+    server = {"songs": [], "calls": calls}
+
+    def fake_get(endpoint, params=None, timeout=15):
+        calls.append((endpoint, params))
+        if endpoint == "getPlaylist":
+            return {"playlist": {"entry": [{"id": song} for song in server["songs"]]}}
+        return {}
+
+    monkeypatch.setattr(navidrome, "_subsonic_get", fake_get)
+    return server
+
+
+def test_publish_appends_at_the_end(navidrome_server):
+    navidrome_server["songs"] = ["id-a", "id-b", "id-c"]
+    added, removed, unmatched = navidrome.publish_playlist("Mix", ["A/a.mp3", "A/b.mp3", "A/c.mp3", "A/d.mp3"])
+    assert (added, removed, unmatched) == (1, 0, 0)
+    assert navidrome_server["calls"][-1] == ("updatePlaylist", {"playlistId": "pl-1", "songIdToAdd": ["id-d"]})
+
+
+def test_publish_replaces_after_insert_near_the_top(navidrome_server):
+    navidrome_server["songs"] = ["id-a", "id-b", "id-c"]
+    added, removed, unmatched = navidrome.publish_playlist("Mix", ["A/a.mp3", "A/x.mp3", "A/b.mp3", "A/c.mp3"])
+    assert (added, removed) == (4, 3)
+    assert navidrome_server["calls"][1:] == [
+        ("createPlaylist", {"playlistId": "pl-1", "songId": ["id-a", "id-x", "id-b", "id-c"]}),
+    ]
+
+
+class _Response:
+    def __init__(self, status_code, payload=None):
+        self.status_code = status_code
+        self.payload = payload or {}
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+
+@pytest.fixture
+def client(apollo_settings, monkeypatch):
+    apollo_settings.update({"NAVIDROME_URL": "http://navidrome", "NAVIDROME_UN": "u", "NAVIDROME_PWD": "p",
+                            "NAVIDROME_MAX_WORKERS": 8, "NAVIDROME_RETRIES": 2})
+    monkeypatch.setattr(navidrome.time, "sleep", lambda seconds: None)
+    client = navidrome.NavidromeClient()
+    client.limiter.limit = 8
+    return client
+
+
+def test_subsonic_errors_do_not_shrink_the_limit(client, monkeypatch):
+    not_found = {"subsonic-response": {"status": "failed", "error": {"code": navidrome.NOT_FOUND, "message": "gone"}}}
+    monkeypatch.setattr(client.session, "get", lambda *args, **kwargs: _Response(200, not_found))
+    for _ in range(5):
+        with pytest.raises(navidrome.SubsonicError):
+            client.get("getSong", {"id": "stale"})
+    assert client.limiter.limit == 8
+
+
+def test_server_errors_shrink_the_limit(client, monkeypatch):
+    monkeypatch.setattr(client.session, "get", lambda *args, **kwargs: _Response(503))
+    with pytest.raises(navidrome.RetryableError):
+        client.get("getSong", {"id": "1"})
+    assert client.limiter.limit == 2
+
+
+LIBRARY = [
+    {"id": "1", "artist": "Artist A", "title": "Intro", "path": "Artist A/Greatest Hits/01 - Intro.mp3"},
+    {"id": "2", "artist": "Artist B", "title": "Intro", "path": "Artist B/Greatest Hits/01 - Intro.mp3"},
+    {"id": "3", "artist": "Artist C", "title": "Song", "path": "Artist C/Debut/02 - Song.mp3"},
+]
+
+
+def test_song_map_matches_exact_paths(apollo_settings):
+    song_map = navidrome.SongMap(LIBRARY)
+    assert song_map.find_by_filename("Artist B/Greatest Hits/01 - Intro.mp3")["id"] == "2"
+    assert not song_map.is_ambiguous("Artist B/Greatest Hits/01 - Intro.mp3")
+
+
+def test_song_map_matches_unique_tail_and_basename(apollo_settings):
+    song_map = navidrome.SongMap(LIBRARY)
+    assert song_map.find_by_filename("Other/Debut/02 - Song.mp3")["id"] == "3"
+    assert song_map.find_by_filename("Elsewhere/02 - Song.mp3")["id"] == "3"
+
+
+def test_song_map_ignores_shared_tail_and_basename(apollo_settings):
+    song_map = navidrome.SongMap(LIBRARY)
+    assert song_map.find_by_filename("Other/Greatest Hits/01 - Intro.mp3") is None
+    assert song_map.is_ambiguous("Other/Greatest Hits/01 - Intro.mp3")
+    assert song_map.find_by_filename("Elsewhere/01 - Intro.mp3") is None
+    assert song_map.is_ambiguous("Elsewhere/01 - Intro.mp3")
+
+
+def test_parse_timestamp_orders_fractions_and_zones():
+    earlier = navidrome._parse_timestamp("2024-05-01T10:00:05Z")
+    later = navidrome._parse_timestamp("2024-05-01T10:00:05.5Z")
+    assert later > earlier
+    assert navidrome._parse_timestamp("2024-05-01T12:00:05+02:00") == earlier
+    assert navidrome._parse_timestamp("2024-05-01T10:00:05.123456789Z").microsecond == 123456
+
+
+def test_parse_timestamp_rejects_missing_and_invalid():
+    assert navidrome._parse_timestamp(None) is None
+    assert navidrome._parse_timestamp("") is None
+    assert navidrome._parse_timestamp("yesterday") is None
+
+
+def test_later_keeps_the_newest():
+    stamp = navidrome._parse_timestamp("2024-05-01T10:00:05Z")
+    assert navidrome._later(None, stamp) is stamp
+    assert navidrome._later(stamp, None) is stamp
+    assert navidrome._later(stamp, navidrome._parse_timestamp("2024-05-01T10:00:04.9Z")) is stamp
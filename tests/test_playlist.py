@@ -0,0 +1,26 @@
+import sqlite3
+
+from apollo_lib import catalog, playlist
+
+
+def _catalog(monkeypatch):
+    db = sqlite3.connect(":memory:")
+    db.execute("CREATE TABLE songs (id INTEGER PRIMARY KEY, artist TEXT, title TEXT, album TEXT, genre TEXT)")
+    db.execute("INSERT INTO songs (artist, title, album, genre) VALUES ('Artist', 'Song', 'Album', 'Rock')")
+    monkeypatch.setattr(catalog, "connect", lambda: db)
+
+
+def test_any_matches_catalog(apollo_settings, monkeypatch):
+    _catalog(monkeypatch)
+    assert playlist.get_tracks_by_type("any", "rock", ["genre"]) == ["Artist - Song"]
+
+
+def test_any_reports_invalid_pattern(apollo_settings, monkeypatch, capsys):
+    _catalog(monkeypatch)
+    assert playlist.get_tracks_by_type("any", "(unclosed", ["title"]) == []
+    assert "Invalid pattern" in capsys.readouterr().out
+
+
+def test_any_reports_missing_catalog(apollo_settings, capsys):
+    assert playlist.get_tracks_by_type("any", "rock") == []
+    assert "Catalog not found" in capsys.readouterr().out
@@ -0,0 +1,46 @@
+import random
+
+import pytest
+
+from apollo_lib import ratings
+
+np = pytest.importorskip("numpy")
+from apollo_lib.rating_engine import RatingEngine
+
+
+def _songs(count, decayed=False, seed=1):
+    rng = random.Random(seed)
+    songs = {}
+    for i in range(count):
+        data = {
+            "rating": rng.choice([None, 0, 1, 2.5, 3.5, 4.75, 5]),
+            "good_votes": rng.randint(0, 20),
+            "bad_votes": rng.randint(0, 20),
+            "skips": rng.randint(0, 40),
+        }
+        if decayed:
+            data["decayed"] = (rng.uniform(0, 20), rng.uniform(0, 20), rng.uniform(0, 40))
+        songs[(f"Artist {i % 50}", f"Song {i}")] = data
+    return songs
+
+
+@pytest.mark.parametrize("decayed", [False, True])
+@pytest.mark.parametrize("vote_strength,skip_strength", [(5, 1), (3, 2), (7.5, 0.5)])
+def test_engine_matches_rating_formula(apollo_settings, decayed, vote_strength, skip_strength):
+    apollo_settings.update({"VOTE_STRENGTH": vote_strength, "SKIP_STRENGTH": skip_strength})
+    songs = _songs(2000, decayed=decayed)
+    scores = RatingEngine(songs).compute(vote_strength, skip_strength)
+    for i, data in enumerate(songs.values()):
+        good, bad, skips = data.get("decayed") or (data["good_votes"], data["bad_votes"], data["skips"])
+        assert scores[i] == ratings.rating_formula(data["rating"] or 0, good, bad, skips)
+
+
+def test_engine_crossings(apollo_settings):
+    songs = {("A", "Up"): {"rating": 1.75, "good_votes": 1, "bad_votes": 0, "skips": 0},
+             ("A", "Down"): {"rating": 2.5, "good_votes": 0, "bad_votes": 0, "skips": 3}}
+    engine = RatingEngine(songs)
+    baseline = engine.compute(5, 1)
+    candidate = engine.compute(10, 2)
+    dropped, added = engine.crossings(baseline, candidate, 45)
+    assert [engine.keys[i] for i in dropped] == [("A", "Down")]
+    assert [engine.keys[i] for i in added] == [("A", "Up")]
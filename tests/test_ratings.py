@@ -0,0 +1,86 @@
+import pymysql
+import pytest
+
+from apollo_lib import db, ratings, snapshot, storage
+
+
+@pytest.fixture
+def no_database(monkeypatch):
+    def unreachable(*args, **kwargs):
+        raise pymysql.err.OperationalError(2003, "unreachable")
+    monkeypatch.setattr(db, "session", unreachable)
+
+
+def test_ratings_version_uses_fresh_snapshot(apollo_settings, monkeypatch):
+    snapshot.write_snapshot({"a - b": 70}, "v1")
+    monkeypatch.setattr(db, "session", lambda *args, **kwargs: pytest.fail("database contacted"))
+    assert ratings.get_ratings_version() == "v1"
+
+
+def test_ratings_version_falls_back_to_stale_snapshot(apollo_settings, no_database):
+    snapshot.write_snapshot({"a - b": 70}, "v1")
+    apollo_settings["RATINGS_SNAPSHOT_TTL"] = 0
+    assert ratings.get_ratings_version() == "v1"
+
+
+@pytest.fixture
+def rating_db(sqlite_ratings):
+    sqlite_ratings.update({"VOTE_STRENGTH": 5, "SKIP_STRENGTH": 1, "RATING_THRESHOLD": 45})
+    ratings.reset_calculated_ratings()
+    with db.session() as (dbh, sth):
+        storage.dialect().create_tables(sth, storage.EVENT_TABLES)
+        dbh.commit()
+    yield
+    ratings.reset_calculated_ratings()
+
+
+def _event(table, artist, title, value):
+    with db.session() as (dbh, sth):
+        sth.execute(f"INSERT INTO {table} (artist, title, rating) VALUES (%s, %s, %s)", (artist, title, value))
+        dbh.commit()
+
+
+def _stored():
+    with db.session() as (dbh, sth):
+        sth.execute("SELECT artist, title, calculated_rating, good_votes, skips FROM apollo_calculated_rating")
+        return {(row["artist"], row["title"]): row for row in sth.fetchall()}
+
+
+def test_incremental_recalculation_only_touches_changed_songs(rating_db):
+    _event("apollo_vote", "A", "One", "good")
+    _event("apollo_skip", "B", "Two", "skip")
+    ratings.calculate_all_ratings(full=True)
+    ratings.store_calculated_ratings()
+    assert _stored()[("A", "One")]["calculated_rating"] == 55
+    assert _stored()[("B", "Two")]["calculated_rating"] == 49
+
+    ratings.reset_calculated_ratings()
+    ratings.calculate_all_ratings()
+    assert ratings._dirty_keys == set()
+
+    _event("apollo_vote", "B", "Two", "good")
+    ratings.reset_calculated_ratings()
+    ratings.calculate_all_ratings()
+    assert ratings._dirty_keys == {("B", "Two")}
+    ratings.store_calculated_ratings()
+
+    stored = _stored()
+    assert stored[("B", "Two")]["calculated_rating"] == 54
+    assert stored[("B", "Two")]["good_votes"] == 1
+    assert stored[("A", "One")]["calculated_rating"] == 55
+
+    ratings.reset_calculated_ratings()
+    ratings.calculate_all_ratings()
+    assert ratings._dirty_keys == set()
+
+
+def test_incremental_recalculation_picks_up_new_songs(rating_db):
+    _event("apollo_vote", "A", "One", "good")
+    ratings.calculate_all_ratings(full=True)
+    ratings.store_calculated_ratings()
+
+    _event("apollo_rating", "C", "Three", 4)
+    ratings.reset_calculated_ratings()
+    ratings.calculate_all_ratings()
+    assert ratings._dirty_keys == {("C", "Three")}
+    assert ratings.calculated_ratings[("C", "Three")]["calculated_rating"] == 80
@@ -0,0 +1,43 @@
+import os
+import stat
+
+from apollo_lib import state
+
+
+def _mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def test_write_atomic_new_file_follows_umask(tmp_path, monkeypatch):
+    monkeypatch.setattr(state, "_UMASK", 0o022)
+    path = tmp_path / "new.m3u"
+    state.write_atomic(str(path), b"data")
+    assert path.read_bytes() == b"data"
+    assert _mode(path) == 0o644
+
+
+def test_write_atomic_keeps_existing_mode(tmp_path):
+    path = tmp_path / "old.m3u"
+    path.write_bytes(b"old")
+    os.chmod(path, 0o640)
+    state.write_atomic(str(path), b"new")
+    assert path.read_bytes() == b"new"
+    assert _mode(path) == 0o640
+
+
+def test_write_atomic_leaves_no_temp_files(tmp_path):
+    state.write_atomic(str(tmp_path / "a.json"), b"{}")
+    assert os.listdir(tmp_path) == ["a.json"]
+
+
+def test_write_if_changed(tmp_path):
+    path = str(tmp_path / "a.m3u")
+    assert state.write_if_changed(path, b"one")
+    assert not state.write_if_changed(path, b"one")
+    assert state.write_if_changed(path, b"two")
+
+
+def test_save_and_load_state(apollo_settings):
+    state.save_state("example", {"b": 1, "a": [1, 2]})
+    assert state.load_state("example") == {"a": [1, 2], "b": 1}
+    assert state.load_state("missing", default=[]) == []
@@ -0,0 +1,42 @@
+from apollo_lib import db, storage
+
+
+def _modifiedon(sth, artist):
+    sth.execute("SELECT modifiedon FROM apollo_calculated_rating WHERE artist = %s", (artist,))
+    return sth.fetchone()["modifiedon"]
+
+
+def test_sqlite_update_bumps_modifiedon(sqlite_ratings):
+    with db.session() as (dbh, sth):
+        storage.dialect().create_tables(sth, ["apollo_calculated_rating"])
+        sth.execute(
+            "INSERT INTO apollo_calculated_rating (artist, title, calculated_rating, modifiedon) "
+            "VALUES (%s, %s, %s, %s)", ("A", "T", 50, "2000-01-01 00:00:00"),
+        )
+        sth.execute("UPDATE apollo_calculated_rating SET calculated_rating = 60 WHERE artist = %s", ("A",))
+        dbh.commit()
+        assert _modifiedon(sth, "A") > "2000-01-01 00:00:00"
+
+
+def test_sqlite_update_keeps_explicit_modifiedon(sqlite_ratings):
+    with db.session() as (dbh, sth):
+        storage.dialect().create_tables(sth, ["apollo_calculated_rating"])
+        sth.execute(
+            "INSERT INTO apollo_calculated_rating (artist, title, calculated_rating) VALUES (%s, %s, %s)",
+            ("A", "T", 50),
+        )
+        sth.execute(
+            "UPDATE apollo_calculated_rating SET calculated_rating = 60, modifiedon = %s WHERE artist = %s",
+            ("2001-02-03 04:05:06", "A"),
+        )
+        dbh.commit()
+        assert _modifiedon(sth, "A") == "2001-02-03 04:05:06"
+
+
+def test_sqlite_create_tables_is_repeatable(sqlite_ratings):
+    with db.session() as (dbh, sth):
+        storage.dialect().create_tables(sth, list(storage.SCHEMA))
+        storage.dialect().create_tables(sth, list(storage.SCHEMA))
+        sth.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+        triggers = {row["name"] for row in sth.fetchall()}
+    assert "apollo_vote_modifiedon_on_update" in triggers
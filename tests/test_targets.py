@@ -0,0 +1,43 @@
+import pytest
+
+from apollo_lib import targets
+
+
+PHONE = {"from": "/mnt/user/music", "to": "/sdcard/Music"}
+
+
+def test_rewrite_prefix_and_separator():
+    target = {"path": "/mnt/win", "rewrite": {"from": "/mnt/user/music", "to": "D:/Music"}, "separator": "\\"}
+    assert targets.rewrite_url("/mnt/user/music/A/x.mp3", target) == "D:\\Music\\A\\x.mp3"
+
+
+def test_url_outside_rewrite_is_left_alone():
+    target = {"path": "/mnt/win", "rewrite": PHONE}
+    assert targets.rewrite_url("/other/A/x.mp3", target) == "/other/A/x.mp3"
+
+
+def test_relative_to_rewritten_playlist_folder():
+    target = {"path": "/mnt/user/music/Playlists", "rewrite": PHONE, "relative": True}
+    assert targets.rewrite_url("/mnt/user/music/A/x.mp3", target) == "../A/x.mp3"
+
+
+def test_relative_to_explicit_folder():
+    target = {"path": "/mnt/user/phone/Playlists", "rewrite": PHONE, "relative": True,
+              "relative_to": "/sdcard/Playlists"}
+    assert targets.rewrite_url("/mnt/user/music/A/x.mp3", target) == "../Music/A/x.mp3"
+
+
+def test_relative_target_outside_rewrite_needs_relative_to(monkeypatch):
+    monkeypatch.setattr(targets.settings, "_settings", {"PLAYLIST_PUBLISHED_FOLDER": [
+        {"path": "/mnt/user/phone/Playlists", "rewrite": PHONE, "relative": True},
+    ]})
+    with pytest.raises(SystemExit):
+        targets.get_publish_targets()
+
+
+def test_publish_targets_accept_plain_folders(monkeypatch):
+    monkeypatch.setattr(targets.settings, "_settings", {"PLAYLIST_PUBLISHED_FOLDER": [
+        "/mnt/user/mpd", {"path": "/mnt/user/phone/Playlists", "rewrite": PHONE, "relative": True,
+                          "relative_to": "/sdcard/Playlists"},
+    ]})
+    assert [target["path"] for target in targets.get_publish_targets()] == ["/mnt/user/mpd", "/mnt/user/phone/Playlists"]